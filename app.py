@@ -1,23 +1,33 @@
 import streamlit as st
 from streamlit import rerun
-import pandas as pd
-import zipfile
-import io
-from lxml import etree
-
-from src.xml_reader import extrair_dados_xmls
-from src.nfse_reader import extrair_dados_nfses_xmls
+import os
+
+from src.dispatcher import extrair_dados_fiscais
+from src.parse_cache import obter_cache_padrao
+from src.preferencias import garantir_colunas, mesclar_preferencias, salvar_preferencias
+from src.db_async import carregar_contexto
+from src.itens import TabelaItens, GradeItens, DiarioCfop
+from src.edicao import aplicar_edicoes
+from src.busca import IndiceBusca, TODOS, normalizar, normalizar_texto
+from src.export import gerar_zip_xmls_alterados, gerar_zip_xmls_originais, gerar_csv_contabil, nome_arquivo_csv
 # (Removidos imports não utilizados)
 from src.db import (
     interpretar_cfop_decomposto,
     buscar_tipo_operacao_emissor,
     salvar_tipo_operacao_emissor,
-    buscar_preferencia_empresa_fornecedor,
-    salvar_preferencia_empresa_fornecedor,
     listar_cfops,
-    adicionar_ou_atualizar_cfop
+    codigos_cfop,
+    adicionar_ou_atualizar_cfop,
+    CFOPS_PADRAO,
+    listar_empresas,
+    obter_empresa,
+    criar_empresa,
 )
 
+# Paginação do editor de CFOP por item: notas por página e itens por página de cada nota
+NOTAS_POR_PAGINA = 10
+ITENS_POR_PAGINA = 25
+
 st.set_page_config(page_title="ContagFiscal Pro - NF-e e NFSe Inteligente", layout="wide")
 st.title("🧾 ContagFiscal Pro - NF-e e NFSe Inteligente")
 
@@ -34,28 +44,24 @@ if "selecionar_todos" not in st.session_state:
     st.session_state.selecionar_todos = False
 if "arquivos_dict" not in st.session_state:
     st.session_state.arquivos_dict = {}
-if "itens_por_chave" not in st.session_state:
-    st.session_state.itens_por_chave = {}
-if "item_cfops" not in st.session_state:
-    # estrutura: {chave: {nItem: cfop_str}}
-    st.session_state.item_cfops = {}
-if "item_cfops_undo" not in st.session_state:
-    # pilha de alterações em lote: cada item é uma lista de dicts {chave, nItem, old, new}
-    st.session_state.item_cfops_undo = []
+if "tabela_itens" not in st.session_state:
+    # itens de todas as NF-e em formato colunar, com o CFOP editado por item (src/itens.py)
+    st.session_state.tabela_itens = TabelaItens.vazia()
+if "indice_notas" not in st.session_state:
+    # índices de busca (src/busca.py), construídos uma vez por carga
+    st.session_state.indice_notas = None
+    st.session_state.indice_itens = None
+    st.session_state.grade_itens = None
+if "diario_cfop" not in st.session_state:
+    # diário de desfazer das aplicações de CFOP em lote (src/itens.py), ligado à tabela de itens
+    st.session_state.diario_cfop = None
 if "apply_busy" not in st.session_state:
     st.session_state.apply_busy = False
 
 # Função para cadastrar empresa
 def cadastrar_empresa(cnpj, razao_social, nome_fantasia):
-    from src.db import engine, Table, MetaData, insert
-    metadata = MetaData()
     try:
-        metadata.reflect(bind=engine)
-        empresas_table = Table('empresas', metadata, autoload_with=engine)
-        with engine.connect() as conn:
-            stmt = insert(empresas_table).values(cnpj=cnpj, nome=nome_fantasia, razao_social=razao_social)
-            conn.execute(stmt)
-            conn.commit()
+        criar_empresa(cnpj, razao_social, nome_fantasia)
         return True
     except Exception as e:
         st.error("Não foi possível cadastrar empresa: banco indisponível ou credenciais faltando. Detalhe: " + str(e))
@@ -63,22 +69,16 @@ def cadastrar_empresa(cnpj, razao_social, nome_fantasia):
 
 # Seleção da empresa no início da sessão com opção de cadastro
 if st.session_state.empresa_selecionada is None:
-    from src.db import engine, Table, MetaData
-    metadata = MetaData()
     empresas = []
     try:
-        # Tenta refletir as tabelas e buscar empresas. Em ambientes sem DB (ex: secrets não configurados)
-        # evitamos que a aplicação quebre em tempo de importação — tratamos a falha e seguimos em modo limitado.
-        metadata.reflect(bind=engine)
-        empresas_table = Table('empresas', metadata, autoload_with=engine)
-        with engine.connect() as conn:
-            result = conn.execute(empresas_table.select())
-            empresas = result.fetchall()
+        # Lista em cache no processo (src/db.py). Em ambientes sem DB (ex: secrets não configurados)
+        # tratamos a falha e seguimos em modo limitado.
+        empresas = listar_empresas()
     except Exception as e:
         # Mostra aviso no Streamlit (logs do deploy também terão a stack trace); continua sem quebrar o app.
         st.warning("Banco de dados indisponível ou credenciais não configuradas. Configure SUPABASE_* em Settings/Secrets. (Detalhe: " + str(e) + ")")
         empresas = []
-    empresa_options = {row[2]: row[0] for row in empresas} if empresas else {}
+    empresa_options = {empresa["nome"]: empresa["id"] for empresa in empresas}
 
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -112,59 +112,55 @@ if st.session_state.empresa_selecionada is None:
 if st.button("🔄 Recarregar dados"):
     st.session_state.df_geral = None
     st.session_state.arquivos_dict = {}
-    st.session_state.itens_por_chave = {}
-    st.session_state.item_cfops = {}
+    st.session_state.tabela_itens = TabelaItens.vazia()
+    st.session_state.indice_notas = None
+    st.session_state.indice_itens = None
+    st.session_state.grade_itens = None
+    st.session_state.diario_cfop = None
     rerun()
 
-uploaded_files = st.file_uploader("📂 Envie os arquivos XML das NF-es e NFS-es", type=["xml"], accept_multiple_files=True)
+uploaded_files = st.file_uploader(
+    "📂 Envie os arquivos XML das NF-es e NFS-es (ou compactados .zip / .tar.gz com os XMLs)",
+    type=["xml", "zip", "tar", "gz", "tgz"],
+    accept_multiple_files=True,
+)
+
+# Resultado de carregar_contexto quando o upload é processado nesta execução
+contexto = None
 
 if uploaded_files:
     # Só processa os arquivos se ainda não tiverem sido processados
     if st.session_state.df_geral is None:
-        files_copy_1 = []
-        files_copy_2 = []
-        for file in uploaded_files:
-            content = file.read()
-            b1 = io.BytesIO(content)
-            b1.name = file.name
-            files_copy_1.append(b1)
-
-            b2 = io.BytesIO(content)
-            b2.name = file.name
-            files_copy_2.append(b2)
-
-        # Barras de progresso para leitura
-        total_nfe = len(files_copy_1)
-        total_nfse = len(files_copy_2)
-        prog_nfe = st.progress(0, text=f"NF-e 0/{total_nfe}")
-        prog_nfse = st.progress(0, text=f"NFS-e 0/{total_nfse}")
-
-        def _upd_nfe(i, total, name=None):
-            if total:
-                pct = int(i * 100 / total)
-                txt = f"NF-e {i}/{total}"
-                if name:
-                    txt += f" — {name}"
-                prog_nfe.progress(pct, text=txt)
+        # Barra de progresso para leitura (NF-e e NFS-e numa única passada; o total
+        # inclui os XMLs contidos em compactados e é informado pelo callback)
+        prog_xml = st.progress(0, text="XML 0")
 
-        def _upd_nfse(i, total, name=None):
+        def _upd_xml(i, total, name=None):
             if total:
                 pct = int(i * 100 / total)
-                txt = f"NFS-e {i}/{total}"
+                txt = f"XML {i}/{total}"
                 if name:
                     txt += f" — {name}"
-                prog_nfse.progress(pct, text=txt)
+                prog_xml.progress(pct, text=txt)
 
-        # xml_reader.extrair_dados_xmls retorna df, arquivos_dict, itens_por_chave
-        df_nfe, arquivos_nfe, itens_por_chave = extrair_dados_xmls(files_copy_1, progress_callback=_upd_nfe)
-        df_nfse, arquivos_nfse = extrair_dados_nfses_xmls(files_copy_2, progress_callback=_upd_nfse)
+        # Leitura em processos paralelos é opt-in: habilitada quando XML_WORKERS está definido
+        paralelo = bool(os.getenv("XML_WORKERS"))
+        # Cache em disco por SHA-256 do conteúdo: reenvios do mesmo lote não são parseados de novo
+        cache_xml = obter_cache_padrao()
 
-        st.session_state.df_geral = pd.concat([df_nfe, df_nfse], ignore_index=True)  # Atualizando df_geral no session state
+        # Cada arquivo é lido uma vez e enviado apenas ao leitor do seu tipo (NF-e ou NFS-e)
+        df_geral, arquivos_dict, itens_por_chave = extrair_dados_fiscais(
+            uploaded_files, progress_callback=_upd_xml, paralelo=paralelo, cache=cache_xml
+        )
+        st.session_state.df_geral = df_geral  # Atualizando df_geral no session state
 
-        # Merge dos arquivos e itens
-        arquivos_dict = {**(arquivos_nfe or {}), **(arquivos_nfse or {})}
+        # Arquivos e itens
         st.session_state.arquivos_dict = arquivos_dict  # Salva no session state
-        st.session_state.itens_por_chave = itens_por_chave or {}
+        st.session_state.tabela_itens = TabelaItens.de_itens_por_chave(itens_por_chave or {})
+        st.session_state.indice_notas = None
+        st.session_state.indice_itens = None
+        st.session_state.grade_itens = None
+        st.session_state.diario_cfop = None
 
         # Garantir que o número de chaves corresponda ao número de linhas (apenas aviso)
         chaves = list(arquivos_dict.keys())
@@ -177,29 +173,22 @@ if uploaded_files:
             st.session_state.df_geral["chave"] = chaves
 
         # Garante que as colunas existam
-        for col in ["tipo_operacao", "data_nota", "complemento", "debito", "credito", "historico"]:
-            if col not in st.session_state.df_geral.columns:
-                st.session_state.df_geral[col] = ""
+        garantir_colunas(st.session_state.df_geral)
 
-        # Aplica preferências salvas no banco para a empresa selecionada
+        # Aplica preferências salvas no banco para a empresa selecionada; empresa e catálogo
+        # de CFOPs são carregados na mesma leva, em paralelo (src/db_async.py)
         empresa_id = st.session_state.empresa_selecionada
-        for cnpj in st.session_state.df_geral["cnpj_emissor"].unique():
-            pref = buscar_preferencia_empresa_fornecedor(empresa_id, cnpj)
-            if pref:
-                idxs = st.session_state.df_geral.index[st.session_state.df_geral["cnpj_emissor"] == cnpj].tolist()
-                for idx in idxs:
-                    if "tipo_operacao" in pref and pref["tipo_operacao"]:
-                        st.session_state.df_geral.at[idx, "tipo_operacao"] = pref["tipo_operacao"]
-                    if "data_nota" in pref and pref["data_nota"]:
-                        st.session_state.df_geral.at[idx, "data_nota"] = pref["data_nota"]
-                    if "complemento" in pref and pref["complemento"]:
-                        st.session_state.df_geral.at[idx, "complemento"] = pref["complemento"]
-                    if "debito" in pref and pref["debito"]:
-                        st.session_state.df_geral.at[idx, "debito"] = pref["debito"]
-                    if "credito" in pref and pref["credito"]:
-                        st.session_state.df_geral.at[idx, "credito"] = pref["credito"]
-                    if "historico" in pref and pref["historico"]:
-                        st.session_state.df_geral.at[idx, "historico"] = pref["historico"]
+        if not st.session_state.df_geral.empty:
+            try:
+                contexto = carregar_contexto(empresa_id, st.session_state.df_geral["cnpj_emissor"].unique())
+            except Exception as e:
+                # As notas já lidas continuam válidas: segue sem preferências; o catálogo de
+                # CFOPs cai para o cache do processo (ou o padrão local) mais abaixo
+                st.error("Não foi possível carregar as preferências salvas no banco: " + str(e))
+                contexto = {"preferencias": {}, "empresa": None, "codigos_cfop": []}
+            mesclar_preferencias(st.session_state.df_geral, contexto["preferencias"])
+            # Empresa e catálogo já vieram na mesma leva: usados abaixo sem nova consulta
+            st.session_state.empresa_carregada = contexto["empresa"]
 
         if st.session_state.df_geral.empty:
             st.error("Nenhuma nota válida encontrada.")
@@ -239,21 +228,19 @@ if uploaded_files:
         selecionar_todos = st.checkbox("Selecionar todos os filtrados", value=st.session_state.selecionar_todos)
         st.session_state.selecionar_todos = selecionar_todos
 
+    # Índice de busca das notas (valores normalizados, sem acentos): construído uma vez por
+    # carga e atualizado nas edições, em vez de remontar o texto de cada linha a cada tecla
+    indice_notas = st.session_state.indice_notas
+    if indice_notas is None or not indice_notas.compativel(st.session_state.df_geral):
+        # "Todos" busca em todas as colunas da nota (nNF, tipo, cfop_atual...), não só nas do seletor
+        indice_notas = IndiceBusca(st.session_state.df_geral, list(st.session_state.df_geral.columns))
+        st.session_state.indice_notas = indice_notas
+
     # Aplicar filtro por campo ou todos
     if filtro_texto:
         base = st.session_state.df_geral.copy()
-        texto = filtro_texto.strip().lower()
         try:
-            if filtro_campo_notas == "Todos":
-                mask = base.apply(
-                    lambda r: texto in " ".join(["" if pd.isna(v) else str(v).lower() for v in r.values]),
-                    axis=1,
-                )
-            else:
-                col = filtro_campo_notas
-                series = base[col].astype(str).str.lower() if col in base.columns else pd.Series([""] * len(base))
-                mask = series.str.contains(texto, na=False)
-            df_filtrado = base[mask].copy()
+            df_filtrado = base[indice_notas.filtrar(filtro_texto, filtro_campo_notas)].copy()
         except Exception:
             df_filtrado = base.copy()
         if df_filtrado.empty:
@@ -276,65 +263,16 @@ if uploaded_files:
     if st.session_state.selecionar_todos:
         df_filtrado["Selecionar"] = True
 
-    # Lista de CFOPs: carrega do catálogo no banco; fallback para padrão local
-    DEFAULT_CFOPS_META = [
-        {"codigo":"1102","categoria":"Consumo","nome":"Dentro do Estado"},
-        {"codigo":"2102","categoria":"Consumo","nome":"Fora do Estado"},
-        {"codigo":"1556","categoria":"Revenda","nome":"Dentro do Estado"},
-        {"codigo":"2556","categoria":"Revenda","nome":"Fora do Estado"},
-        {"codigo":"1126","categoria":"Ativo Imobilizado","nome":"Dentro do Estado"},
-        {"codigo":"2126","categoria":"Ativo Imobilizado","nome":"Fora do Estado"},
-        {"codigo":"1551","categoria":"Serviço","nome":"Dentro do Estado"},
-        {"codigo":"2551","categoria":"Serviço","nome":"Fora do Estado"},
-        {"codigo":"1405","categoria":"Tributos","nome":"Estaduais e Municipais"},
-        {"codigo":"1403","categoria":"Revenda","nome":"Substituição tributária"},
-        {"codigo":"1910","categoria":"Bonificação/Brinde","nome":"Doação ou brinde"},
-        {"codigo":"2403","categoria":"Revenda","nome":"Para fora do Estado"},
-        {"codigo":"2910","categoria":"Bonificação/Brinde","nome":"Outros Estados"},
-        {"codigo":"5152","categoria":"Transferência","nome":"Dentro do Estado"},
-        {"codigo":"6152","categoria":"Transferência","nome":"Fora do Estado"},
-        {"codigo":"5910","categoria":"Bonificação/Brinde","nome":"Dentro do Estado"},
-        {"codigo":"6910","categoria":"Bonificação/Brinde","nome":"Fora do Estado"},
-        {"codigo":"5915","categoria":"Doação","nome":"Dentro do Estado"},
-        {"codigo":"6915","categoria":"Doação","nome":"Fora do Estado"},
-        {"codigo":"5920","categoria":"Demonstração","nome":"Dentro do Estado"},
-        {"codigo":"6920","categoria":"Demonstração","nome":"Fora do Estado"},
-        {"codigo":"5931","categoria":"Conserto","nome":"Remessa – Dentro do Estado"},
-        {"codigo":"6931","categoria":"Conserto","nome":"Remessa – Fora do Estado"},
-        {"codigo":"5932","categoria":"Conserto","nome":"Retorno – Dentro do Estado"},
-        {"codigo":"6932","categoria":"Conserto","nome":"Retorno – Fora do Estado"},
-        {"codigo":"5949","categoria":"Industrialização","nome":"Remessa – Dentro do Estado"},
-        {"codigo":"6949","categoria":"Industrialização","nome":"Remessa – Fora do Estado"},
-        {"codigo":"5951","categoria":"Industrialização","nome":"Retorno – Dentro do Estado"},
-        {"codigo":"6951","categoria":"Industrialização","nome":"Retorno – Fora do Estado"},
-    ]
-    DEFAULT_CFOPS = [d["codigo"] for d in DEFAULT_CFOPS_META]
-
-    def _seed_cfop_catalog_if_empty():
+    # Lista de CFOPs: catálogo em cache no processo (src/db.py); fallback para o padrão local
+    # (na execução do upload, usa os códigos trazidos por carregar_contexto)
+    if contexto is not None and contexto["codigos_cfop"]:
+        CFOP_CODES = contexto["codigos_cfop"]
+    else:
         try:
-            rows = listar_cfops()
-            if not rows:
-                for d in DEFAULT_CFOPS_META:
-                    try:
-                        adicionar_ou_atualizar_cfop(d["codigo"], d.get("categoria"), d.get("nome"), d.get("descricao"))
-                    except Exception:
-                        pass
+            CFOP_CODES = codigos_cfop()
         except Exception:
-            # Sem banco disponível; segue com fallback
-            pass
-    def _load_cfop_codes():
-        try:
-            # Faz seed inicial se estiver vazio
-            _seed_cfop_catalog_if_empty()
-            rows = listar_cfops()
-            if rows:
-                # Ordena por código numérico quando possível
-                codes = sorted({r.get("codigo") for r in rows if r.get("codigo")}, key=lambda x: (len(x), x))
-                return codes
-        except Exception as e:
-            pass
-        return DEFAULT_CFOPS
-    CFOP_CODES = _load_cfop_codes()
+            CFOP_CODES = []
+    CFOP_CODES = CFOP_CODES or [d["codigo"] for d in CFOPS_PADRAO]
 
     # Gestão do catálogo de CFOPs (opcional): cadastrar novos códigos
     # Sidebar: gestão do catálogo de CFOPs (cadastrar/editar)
@@ -445,38 +383,49 @@ if uploaded_files:
     st.session_state.selected_rows = selected_rows["chave"].tolist()
     st.caption(f"{len(st.session_state.selected_rows)} nota(s) selecionada(s) de {len(df_filtrado)} exibidas")
 
-    # Atualiza o dataframe original com as edições feitas pelo usuário
-    for idx, row in edited_df.iterrows():
-        chave = row["chave"]
-        tipo_operacao_codigo = row["tipo_operacao"]  # já é o código diretamente
-        data_nota = row.get("data_nota", "")
-        complemento = row.get("complemento", "")
-        debito = row.get("debito", "")
-        credito = row.get("credito", "")
-        historico = row.get("historico", "")
-        
-        # Grava no df_geral sempre o código diretamente
-        st.session_state.df_geral.loc[st.session_state.df_geral["chave"] == chave, "tipo_operacao"] = tipo_operacao_codigo
-        st.session_state.df_geral.loc[st.session_state.df_geral["chave"] == chave, "data_nota"] = data_nota
-        st.session_state.df_geral.loc[st.session_state.df_geral["chave"] == chave, "complemento"] = complemento
-        st.session_state.df_geral.loc[st.session_state.df_geral["chave"] == chave, "debito"] = debito
-        st.session_state.df_geral.loc[st.session_state.df_geral["chave"] == chave, "credito"] = credito
-        st.session_state.df_geral.loc[st.session_state.df_geral["chave"] == chave, "historico"] = historico
+    # Atualiza o dataframe original apenas com as células alteradas no editor (por chave)
+    aplicar_edicoes(st.session_state.df_geral, edited_df, indice_busca=indice_notas)
     
     st.divider()
 
     # Edição de CFOP por item (para as notas selecionadas)
+    tabela_itens = st.session_state.tabela_itens
     notas_selecionadas = st.session_state.df_geral[st.session_state.df_geral["chave"].isin(st.session_state.selected_rows)]
     if not notas_selecionadas.empty:
+        # CFOP e fornecedor de cada nota selecionada, usados como padrão/descrição dos itens
+        cfop_nota_por_chave = dict(zip(notas_selecionadas["chave"], notas_selecionadas["tipo_operacao"]))
+        fornecedor_por_chave = dict(zip(notas_selecionadas["chave"], notas_selecionadas["fornecedor"]))
+
+        # Atribuições em lote passam pelo diário, que guarda as posições e os valores
+        # anteriores de forma compacta para o "Desfazer"
+        diario_cfop = st.session_state.diario_cfop
+        if diario_cfop is None or diario_cfop.tabela is not tabela_itens:
+            diario_cfop = DiarioCfop(tabela_itens)
+            st.session_state.diario_cfop = diario_cfop
+
+        def _atribuir_cfop_item(posicao, key_item):
+            # Só grava quando o usuário troca o CFOP no seletor (vazio = sem edição)
+            tabela_itens.atribuir_cfop([posicao], st.session_state[key_item])
+
         st.subheader("🔧 Editar CFOP por item (somente notas selecionadas)")
-        for _, nota in notas_selecionadas.iterrows():
-            chave = nota["chave"]
-            fornecedor = nota.get("fornecedor", "")
-            itens = st.session_state.itens_por_chave.get(chave, [])
-            if not itens:
-                continue
-            if chave not in st.session_state.item_cfops:
-                st.session_state.item_cfops[chave] = {}
+        # Só a página atual de notas (e de itens dentro de cada nota) vira widget: o custo do
+        # rerun não cresce com o número de notas selecionadas
+        notas_com_itens = [chave for chave in notas_selecionadas["chave"] if chave in tabela_itens]
+        total_paginas_notas = max(1, -(-len(notas_com_itens) // NOTAS_POR_PAGINA))
+        if total_paginas_notas > 1:
+            pagina_notas = st.number_input(
+                f"Página de notas (1–{total_paginas_notas}, {NOTAS_POR_PAGINA} por página)",
+                min_value=1,
+                max_value=total_paginas_notas,
+                value=1,
+                step=1,
+                key="pagina_notas_itens",
+            )
+        else:
+            pagina_notas = 1
+        inicio_notas = (pagina_notas - 1) * NOTAS_POR_PAGINA
+        for chave in notas_com_itens[inicio_notas:inicio_notas + NOTAS_POR_PAGINA]:
+            fornecedor = fornecedor_por_chave.get(chave, "")
             with st.expander(f"Itens da nota {chave} - {fornecedor}", expanded=False):
                 # Aplicar CFOP único para todos os itens desta nota
                 col_n1, col_n2 = st.columns([2, 1])
@@ -492,70 +441,60 @@ if uploaded_files:
                         "Aplicar a todos os itens desta nota",
                         key=f"{chave}_aplicar_todos"
                     )
+                posicoes_nota = tabela_itens.posicoes_das_notas([chave])
                 if aplicar_todos_btn and cfop_para_todos and not st.session_state.apply_busy:
                     st.session_state.apply_busy = True
                     with st.spinner("Aplicando CFOP em todos os itens da nota, aguarde..."):
-                        changes = []
-                        count_local = 0
-                        for item in itens:
-                            nItem = str(item.get("nItem", ""))
-                            old = st.session_state.item_cfops.get(chave, {}).get(nItem)
-                            new = cfop_para_todos
-                            if chave not in st.session_state.item_cfops:
-                                st.session_state.item_cfops[chave] = {}
-                            st.session_state.item_cfops[chave][nItem] = new
-                            changes.append({"chave": chave, "nItem": nItem, "old": old, "new": new})
-                            count_local += 1
-                        if changes:
-                            st.session_state.item_cfops_undo.append(changes)
+                        diario_cfop.aplicar(posicoes_nota, cfop_para_todos)
                     st.session_state.apply_busy = False
-                    st.success(f"Aplicado CFOP '{cfop_para_todos}' em {count_local} item(ns) da nota {chave}")
-                for item in itens:
-                    nItem = item.get("nItem", "")
-                    xProd = item.get("xProd", "")
-                    vProd = item.get("vProd", "0")
-                    current = (
-                        st.session_state.item_cfops[chave].get(nItem)
-                        or item.get("cfop")
-                        or nota.get("tipo_operacao")
-                        or ""
+                    st.success(f"Aplicado CFOP '{cfop_para_todos}' em {len(posicoes_nota)} item(ns) da nota {chave}")
+
+                total_paginas_itens = max(1, -(-len(posicoes_nota) // ITENS_POR_PAGINA))
+                if total_paginas_itens > 1:
+                    pagina_itens = st.number_input(
+                        f"Página de itens (1–{total_paginas_itens}, {ITENS_POR_PAGINA} por página)",
+                        min_value=1,
+                        max_value=total_paginas_itens,
+                        value=1,
+                        step=1,
+                        key=f"{chave}_pagina_itens",
                     )
-                    cfop_selecionado = st.selectbox(
+                else:
+                    pagina_itens = 1
+                inicio_itens = (pagina_itens - 1) * ITENS_POR_PAGINA
+                posicoes_pagina = posicoes_nota[inicio_itens:inicio_itens + ITENS_POR_PAGINA]
+                itens = tabela_itens.df.iloc[posicoes_pagina]
+                atuais = tabela_itens.cfop_atual(posicoes_pagina, cfop_nota_por_chave)
+                for posicao, nItem, xProd, vProd, current in zip(
+                    posicoes_pagina, itens["nItem"], itens["xProd"], itens["vProd"], atuais
+                ):
+                    key_item = f"{chave}_{nItem}_cfop_item"
+                    # CFOP vigente fora do catálogo continua visível como opção (não vira "")
+                    opcoes = [""] + CFOP_CODES + ([current] if current and current not in CFOP_CODES else [])
+                    # A key é estável; o valor exibido é sincronizado com a tabela a cada rerun,
+                    # então aplicações em lote/desfazer aparecem nos seletores
+                    st.session_state[key_item] = current
+                    st.selectbox(
                         label=f"CFOP item {nItem} - {xProd} (Valor: {vProd})",
-                        options=[""] + CFOP_CODES,
-                        index=([""] + CFOP_CODES).index(current) if current in CFOP_CODES else 0,
-                        key=f"{chave}_{nItem}_cfop_item"
+                        options=opcoes,
+                        key=key_item,
+                        on_change=_atribuir_cfop_item,
+                        args=(posicao, key_item),
                     )
-                    st.session_state.item_cfops[chave][nItem] = cfop_selecionado
-
-        # Seleção em lote de itens e aplicação de CFOP único
-        itens_rows = []
-        for _, nota in notas_selecionadas.iterrows():
-            chave = nota["chave"]
-            fornecedor = nota.get("fornecedor", "")
-            itens = st.session_state.itens_por_chave.get(chave, [])
-            for item in itens:
-                nItem = str(item.get("nItem", ""))
-                atual = (
-                    st.session_state.item_cfops.get(chave, {}).get(nItem)
-                    or item.get("cfop")
-                    or nota.get("tipo_operacao")
-                    or ""
-                )
-                itens_rows.append({
-                    "Selecionar": False,
-                    "chave": chave,
-                    "nItem": nItem,
-                    "fornecedor": fornecedor,
-                    "xProd": item.get("xProd", ""),
-                    "vProd": item.get("vProd", ""),
-                    "cfop_atual": atual,
-                })
-
-        if itens_rows:
+        if total_paginas_notas > 1:
+            st.caption(f"Exibindo notas {inicio_notas + 1}–{min(inicio_notas + NOTAS_POR_PAGINA, len(notas_com_itens))} de {len(notas_com_itens)}")
+
+        # Seleção em lote de itens e aplicação de CFOP único: grade persistente entre reruns,
+        # atualizada só quando a seleção de notas ou algum CFOP muda (src/itens.py)
+        grade_itens = st.session_state.get("grade_itens")
+        if grade_itens is None or grade_itens.tabela is not tabela_itens:
+            grade_itens = GradeItens(tabela_itens)
+            st.session_state.grade_itens = grade_itens
+        df_itens = grade_itens.obter(notas_selecionadas["chave"], cfop_nota_por_chave, fornecedor_por_chave)
+        posicoes_sel = df_itens.index.to_numpy()
+
+        if not df_itens.empty:
             st.caption("Selecione itens por filtro e aplique um CFOP único em lote")
-            import pandas as pd  # já importado; redundante, mas seguro
-            df_itens = pd.DataFrame(itens_rows)
 
             col_f0, col_f1, col_f2, col_f3 = st.columns([1, 2, 1, 1])
             with col_f0:
@@ -589,44 +528,55 @@ if uploaded_files:
                 st.write("")
                 st.write("")
 
-            # Aplica filtro universal por texto em todas as colunas
-            df_filtrado = df_itens.copy()
+            # Aplica filtro por texto usando o índice de busca dos itens (colunas fixas); o CFOP
+            # atual muda com as edições e é normalizado só para os itens exibidos
+            indice_itens = st.session_state.indice_itens
+            if indice_itens is None or len(indice_itens.index) != len(tabela_itens):
+                todos_itens = tabela_itens.df[["chave", "nItem", "xProd"]].copy()
+                # Valor indexado como exibido na grade ("12.50"), não como float
+                vprod = tabela_itens.df["vProd"]
+                todos_itens["vProd"] = vprod.map("{:.2f}".format).where(vprod.notna(), "")
+                todos_itens["fornecedor"] = todos_itens["chave"].astype(object).map(
+                    dict(zip(st.session_state.df_geral["chave"], st.session_state.df_geral["fornecedor"]))
+                )
+                indice_itens = IndiceBusca(todos_itens, ["xProd", "fornecedor", "chave", "nItem", "vProd"])
+                st.session_state.indice_itens = indice_itens
+            df_itens_filtrado = df_itens.copy()
             filtro_itens_val = (st.session_state.get("filtro_texto", "") if usar_filtro_notas else filtro_itens_input)
             filtro_campo_aplicado = (st.session_state.get("filtro_campo_notas", "Todos") if usar_filtro_notas else filtro_campo_itens)
             if filtro_itens_val:
-                texto = filtro_itens_val.strip().lower()
                 try:
-                    if filtro_campo_aplicado == "Todos":
-                        mask = df_itens.apply(
-                            lambda r: texto in " ".join([str(v).lower() for v in r.values if v is not None]),
-                            axis=1,
-                        )
+                    termo = normalizar_texto(filtro_itens_val.strip())
+                    cfop_casa = normalizar(df_itens["cfop_atual"]).str.contains(termo, regex=False).to_numpy(dtype=bool)
+                    if filtro_campo_aplicado == "cfop_atual":
+                        mask = cfop_casa
                     else:
-                        col = filtro_campo_aplicado
-                        series = df_itens[col].astype(str).str.lower() if col in df_itens.columns else pd.Series([""] * len(df_itens))
-                        mask = series.str.contains(texto, na=False)
-                    df_filtrado = df_itens[mask].copy()
+                        # O índice do grid é a posição na tabela de itens
+                        mask = indice_itens.filtrar(filtro_itens_val, filtro_campo_aplicado)[df_itens.index.to_numpy()]
+                        if filtro_campo_aplicado == TODOS:
+                            mask = mask | cfop_casa
+                    df_itens_filtrado = df_itens[mask].copy()
                 except Exception:
-                    df_filtrado = df_itens.copy()
-                if df_filtrado.empty:
+                    df_itens_filtrado = df_itens.copy()
+                if df_itens_filtrado.empty:
                     st.info("Nenhum item encontrado com o filtro informado; exibindo todos.")
-                    df_filtrado = df_itens.copy()
+                    df_itens_filtrado = df_itens.copy()
 
             # Marcar todos os filtrados se solicitado
-            if itens_select_all and not df_filtrado.empty:
-                df_filtrado["Selecionar"] = True
+            if itens_select_all and not df_itens_filtrado.empty:
+                df_itens_filtrado["Selecionar"] = True
 
-            st.caption(f"{len(df_filtrado)} item(ns) no filtro atual")
+            st.caption(f"{len(df_itens_filtrado)} item(ns) no filtro atual")
 
             edited_items_df = st.data_editor(
-                df_filtrado,
+                df_itens_filtrado,
                 column_config={
                     "Selecionar": st.column_config.CheckboxColumn("Selecionar", width="small"),
                     "chave": st.column_config.TextColumn("Chave", disabled=True, width="small"),
                     "nItem": st.column_config.TextColumn("Item", disabled=True, width="small"),
                     "fornecedor": st.column_config.TextColumn("Fornecedor", disabled=True),
                     "xProd": st.column_config.TextColumn("Produto", disabled=True),
-                    "vProd": st.column_config.TextColumn("Valor", disabled=True, width="small"),
+                    "vProd": st.column_config.NumberColumn("Valor", disabled=True, width="small", format="%.2f"),
                     "cfop_atual": st.column_config.TextColumn("CFOP atual", disabled=True, width="small"),
                 },
                 hide_index=True,
@@ -651,20 +601,9 @@ if uploaded_files:
                 if novo_cfop_itens:
                     st.session_state.apply_busy = True
                     with st.spinner("Aplicando CFOP nos itens selecionados, aguarde..."):
-                        changes = []
-                        count = 0
-                        for _, row_it in selected_items.iterrows():
-                            chave = row_it["chave"]
-                            nItem = str(row_it["nItem"])
-                            old = st.session_state.item_cfops.get(chave, {}).get(nItem)
-                            new = novo_cfop_itens
-                            if chave not in st.session_state.item_cfops:
-                                st.session_state.item_cfops[chave] = {}
-                            st.session_state.item_cfops[chave][nItem] = new
-                            changes.append({"chave": chave, "nItem": nItem, "old": old, "new": new})
-                            count += 1
-                        if changes:
-                            st.session_state.item_cfops_undo.append(changes)
+                        # O índice do editor é a posição do item na tabela colunar
+                        posicoes = selected_items.index.to_numpy()
+                        count = diario_cfop.aplicar(posicoes, novo_cfop_itens)
                     st.session_state.apply_busy = False
                     st.success(f"CFOP '{novo_cfop_itens}' aplicado em {count} item(ns)")
                 else:
@@ -674,25 +613,11 @@ if uploaded_files:
             # Desfazer última aplicação em lote
             col_u1, col_u2 = st.columns([2, 1])
             with col_u1:
-                undo_label = "↩️ Desfazer última aplicação" if st.session_state.item_cfops_undo else "↩️ Nada para desfazer"
+                undo_label = "↩️ Desfazer última aplicação" if len(diario_cfop) else "↩️ Nada para desfazer"
             with col_u2:
-                undo_btn = st.button(undo_label, disabled=not bool(st.session_state.item_cfops_undo))
+                undo_btn = st.button(undo_label, disabled=not len(diario_cfop))
             if undo_btn:
-                changes = st.session_state.item_cfops_undo.pop()
-                restored = 0
-                for ch in changes:
-                    chave = ch["chave"]
-                    nItem = ch["nItem"]
-                    old = ch.get("old")
-                    if chave not in st.session_state.item_cfops:
-                        st.session_state.item_cfops[chave] = {}
-                    # Se old é None, removemos a entrada para voltar ao estado "sem seleção"
-                    if old is None:
-                        if nItem in st.session_state.item_cfops[chave]:
-                            del st.session_state.item_cfops[chave][nItem]
-                    else:
-                        st.session_state.item_cfops[chave][nItem] = old
-                    restored += 1
+                restored = diario_cfop.desfazer()
                 st.success(f"Desfeita a última aplicação em {restored} item(ns)")
             # Aplicar CFOP a todos os itens de todas as notas selecionadas
             col_all1, col_all2 = st.columns([2, 1])
@@ -709,22 +634,7 @@ if uploaded_files:
                 if cfop_todos_itens_de_todas_notas:
                     st.session_state.apply_busy = True
                     with st.spinner("Aplicando CFOP em todos os itens das notas selecionadas, aguarde..."):
-                        changes = []
-                        total = 0
-                        for _, nota in notas_selecionadas.iterrows():
-                            chave = nota["chave"]
-                            itens = st.session_state.itens_por_chave.get(chave, [])
-                            if chave not in st.session_state.item_cfops:
-                                st.session_state.item_cfops[chave] = {}
-                            for item in itens:
-                                nItem = str(item.get("nItem", ""))
-                                old = st.session_state.item_cfops.get(chave, {}).get(nItem)
-                                new = cfop_todos_itens_de_todas_notas
-                                st.session_state.item_cfops[chave][nItem] = new
-                                changes.append({"chave": chave, "nItem": nItem, "old": old, "new": new})
-                                total += 1
-                        if changes:
-                            st.session_state.item_cfops_undo.append(changes)
+                        total = diario_cfop.aplicar(posicoes_sel, cfop_todos_itens_de_todas_notas)
                     st.session_state.apply_busy = False
                     st.success(f"CFOP '{cfop_todos_itens_de_todas_notas}' aplicado em {total} item(ns) nas notas selecionadas")
                 else:
@@ -763,17 +673,14 @@ if uploaded_files:
         if not chaves_alvo:
             st.warning("Nenhuma nota alvo. Selecione notas ou marque 'Aplicar a todas as notas filtradas'.")
         else:
-            count = 0
-            for chave in chaves_alvo:
-                idxs = st.session_state.df_geral.index[st.session_state.df_geral["chave"] == chave].tolist()
-                for idx in idxs:
-                    if novo_debito:
-                        st.session_state.df_geral.at[idx, "debito"] = novo_debito
-                    if novo_credito:
-                        st.session_state.df_geral.at[idx, "credito"] = novo_credito
-                    if novo_historico:
-                        st.session_state.df_geral.at[idx, "historico"] = novo_historico
-                    count += 1
+            df_geral = st.session_state.df_geral
+            alvo = df_geral["chave"].isin(chaves_alvo)
+            novos_valores = {"debito": novo_debito, "credito": novo_credito, "historico": novo_historico}
+            colunas_alteradas = [col for col, valor in novos_valores.items() if valor]
+            for col in colunas_alteradas:
+                df_geral.loc[alvo, col] = novos_valores[col]
+            indice_notas.atualizar(df_geral, df_geral.index[alvo], colunas_alteradas)
+            count = int(alvo.sum())
             st.success(f"Valores aplicados em {count} linha(s) de nota (sem alterar CFOP)")
 
     # Salvar tipos no banco
@@ -782,145 +689,22 @@ if uploaded_files:
         if empresa_id is None:
             st.error("Nenhuma empresa selecionada para salvar.")
         else:
-            for idx, row in st.session_state.df_geral.iterrows():
-                cnpj = row["cnpj_emissor"]
-                cfop_code = row["tipo_operacao"]
-                data_nota = row.get("data_nota", "")
-                complemento = row.get("complemento", "")
-                debito = row.get("debito", "")
-                credito = row.get("credito", "")
-                historico = row.get("historico", "")
-                if cnpj and cfop_code:
-                    st.write(f"Salvando: empresa_id={empresa_id}, cnpj={cnpj}, tipo_operacao={cfop_code}, data_nota={data_nota}, complemento={complemento}")
-                    salvar_preferencia_empresa_fornecedor(
-                        empresa_id,
-                        cnpj,
-                        tipo_operacao=cfop_code,
-                        cfop=None,
-                        data_nota=data_nota,
-                        complemento=complemento,
-                        debito=debito,
-                        credito=credito,
-                        historico=historico
-                    )
-            st.success("Preferências salvas no banco.")
+            with st.spinner("Salvando preferências no banco..."):
+                gravadas = salvar_preferencias(st.session_state.df_geral, empresa_id)
+            st.success(f"Preferências salvas no banco ({gravadas} fornecedor(es)).")
 
     # Gerar e exportar ZIP com XMLs: aplica CFOP por item quando definido; caso contrário, aplica CFOP da nota
-    def gerar_zip_com_xmls_alterados():
-        allowed_cfops = {"1102", "2102", "1910", "2910", "1403", "2403", "1405", "1911"}
-
-        # Decide quais notas processar: notas com CFOP permitido no nível da nota
-        # ou notas que tenham pelo menos um item com CFOP definido
-        chaves_cfop_permitido = set(
-            st.session_state.df_geral[
-                st.session_state.df_geral["tipo_operacao"].isin(allowed_cfops)
-            ]["chave"].tolist()
-        )
-        chaves_com_itens_editados = set()
-        for chave, itens_map in st.session_state.item_cfops.items():
-            if any(v for v in itens_map.values()):
-                chaves_com_itens_editados.add(chave)
-
-        chaves_por_processar = chaves_cfop_permitido.union(chaves_com_itens_editados)
-        if not chaves_por_processar:
-            st.warning("Nenhuma nota elegível para gerar XML (verifique CFOP da nota ou CFOP por item).")
-            return None
-
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zipf:
-            for chave in chaves_por_processar:
-                conteudo_xml = st.session_state.arquivos_dict.get(chave) or st.session_state.arquivos_dict.get(f"{chave}.xml")
-                if not conteudo_xml:
-                    continue
-
-                try:
-                    tree = etree.parse(io.BytesIO(conteudo_xml))
-                    root = tree.getroot()
-                    # Mapeamentos de CFOP por item
-                    itens_map = st.session_state.item_cfops.get(chave, {})
-                    nota_cfop = (
-                        st.session_state.df_geral.loc[
-                            st.session_state.df_geral["chave"] == chave, "tipo_operacao"
-                        ].values[0]
-                        if not st.session_state.df_geral.loc[st.session_state.df_geral["chave"] == chave].empty
-                        else ""
-                    )
-
-                    # Se houver CFOP por item, aplica por det; caso contrário, aplica CFOP da nota
-                    if any(v for v in itens_map.values()):
-                        for det in root.findall(".//{http://www.portalfiscal.inf.br/nfe}det"):
-                            nItem_attr = det.get("nItem", "")
-                            prod = det.find("{http://www.portalfiscal.inf.br/nfe}prod")
-                            if prod is None:
-                                continue
-                            alvo_cfop = itens_map.get(nItem_attr) or (nota_cfop if nota_cfop in allowed_cfops else None)
-                            if not alvo_cfop:
-                                continue
-                            cfop_elem = prod.find("{http://www.portalfiscal.inf.br/nfe}CFOP")
-                            if cfop_elem is None:
-                                cfop_elem = etree.SubElement(prod, "{http://www.portalfiscal.inf.br/nfe}CFOP")
-                            cfop_elem.text = alvo_cfop
-                    else:
-                        if nota_cfop in allowed_cfops:
-                            for cfop in root.findall(".//{http://www.portalfiscal.inf.br/nfe}CFOP"):
-                                cfop.text = nota_cfop
-                        else:
-                            # Nem CFOP por item, nem CFOP de nota permitido
-                            continue
-
-                    # Limpa PIS/COFINS conforme padrão do editor
-                    for pis in root.findall(".//{http://www.portalfiscal.inf.br/nfe}PIS"):
-                        for child in list(pis):
-                            pis.remove(child)
-                        pis_aliq = etree.SubElement(pis, "{http://www.portalfiscal.inf.br/nfe}PISAliq")
-                        etree.SubElement(pis_aliq, "{http://www.portalfiscal.inf.br/nfe}CST").text = ""
-                        etree.SubElement(pis_aliq, "{http://www.portalfiscal.inf.br/nfe}vBC").text = ""
-                        etree.SubElement(pis_aliq, "{http://www.portalfiscal.inf.br/nfe}pPIS").text = ""
-                        etree.SubElement(pis_aliq, "{http://www.portalfiscal.inf.br/nfe}vPIS").text = ""
-
-                    for cofins in root.findall(".//{http://www.portalfiscal.inf.br/nfe}COFINS"):
-                        for child in list(cofins):
-                            cofins.remove(child)
-                        cofins_aliq = etree.SubElement(cofins, "{http://www.portalfiscal.inf.br/nfe}COFINSAliq")
-                        etree.SubElement(cofins_aliq, "{http://www.portalfiscal.inf.br/nfe}CST").text = ""
-                        etree.SubElement(cofins_aliq, "{http://www.portalfiscal.inf.br/nfe}vBC").text = ""
-                        etree.SubElement(cofins_aliq, "{http://www.portalfiscal.inf.br/nfe}pCOFINS").text = ""
-                        etree.SubElement(cofins_aliq, "{http://www.portalfiscal.inf.br/nfe}vCOFINS").text = ""
-
-                    buffer = io.BytesIO()
-                    tree.write(buffer, encoding="utf-8", xml_declaration=True, pretty_print=False)
-                    nome_arquivo = chave if str(chave).endswith(".xml") else f"{chave}.xml"
-                    zipf.writestr(nome_arquivo, buffer.getvalue())
-                except Exception as e:
-                    print(f"Erro ao processar {chave}: {e}")
-                    continue
-
-        zip_buffer.seek(0)
-        return zip_buffer
-
     if st.button("📦 Gerar ZIP com XMLs alterados"):
-        zip_buffer = gerar_zip_com_xmls_alterados()
+        zip_buffer = gerar_zip_xmls_alterados(
+            st.session_state.df_geral, st.session_state.arquivos_dict, st.session_state.tabela_itens.cfops_editados()
+        )
         if zip_buffer is None:
+            st.warning("Nenhuma nota elegível para gerar XML (verifique CFOP da nota ou CFOP por item).")
             # Se não houver notas/itens para gerar, tenta gerar a partir do df_geral sem alterações
-            arquivos_filtrados = {}
-            for _, row in st.session_state.df_geral.iterrows():
-                chave = row["chave"]
-                conteudo_xml = st.session_state.arquivos_dict.get(chave) or st.session_state.arquivos_dict.get(chave + ".xml")
-                if conteudo_xml:
-                    arquivos_filtrados[f"{chave}.xml"] = (conteudo_xml, None)
-
-            if not arquivos_filtrados:
+            zip_buffer = gerar_zip_xmls_originais(st.session_state.df_geral, st.session_state.arquivos_dict)
+            if zip_buffer is None:
                 st.warning("Nenhuma nota válida para gerar ZIP.")
             else:
-                zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(zip_buffer, "w") as zipf:
-                    for nome_arquivo, (conteudo, _) in arquivos_filtrados.items():
-                        try:
-                            zipf.writestr(nome_arquivo, conteudo)
-                        except Exception as e:
-                            print(f"Erro ao adicionar {nome_arquivo} ao ZIP: {e}")
-                            continue
-                zip_buffer.seek(0)
                 st.download_button(
                     label="⬇️ Baixar ZIP com XMLs originais",
                     data=zip_buffer,
@@ -936,75 +720,24 @@ if uploaded_files:
             )
     # Gerar e exportar CSV com dados selecionados
     if st.button("📄 Gerar CSV com dados selecionados"):
-        import tempfile
-        from datetime import datetime
-
-        # Definir os cabeçalhos conforme solicitado
-        csv_headers = ["DEBITO", "CREDITO", "HISTORICO", "DATA", "VALOR", "COMPLEMENTO"]
-
-        # Filtrar e formatar os dados conforme especificado
-        df = st.session_state.df_geral.copy()
-
-        # Filtrar colunas necessárias e renomear para os cabeçalhos
-        df_csv = df[["debito", "credito", "historico", "data_nota", "valor_total"]].copy()
-        df_csv.columns = csv_headers[:-1]  # Exclui COMPLEMENTO para renomear
-
-        # DATA: formatar para DD/MM/AAAA
-        def format_date(date_str):
-            try:
-                dt = pd.to_datetime(date_str, errors='coerce')
-                if pd.isna(dt):
-                    return ""
-                return dt.strftime("%d/%m/%Y")
-            except Exception:
-                return ""
-        df_csv["DATA"] = df_csv["DATA"].apply(format_date)
-
-        # VALOR: numérico com 2 casas decimais e separador decimal vírgula
-        df_csv["VALOR"] = df_csv["VALOR"].apply(lambda x: f"{float(x):.2f}".replace(".", ",") if pd.notnull(x) else "0,00")
-
-        # DEBITO, CREDITO, HISTORICO: manter como string sem preenchimento de zeros
-        df_csv["DEBITO"] = df_csv["DEBITO"].astype(str)
-        df_csv["CREDITO"] = df_csv["CREDITO"].astype(str)
-        df_csv["HISTORICO"] = df_csv["HISTORICO"].astype(str)
-
-        # COMPLEMENTO: concatenar "CNPJ - FORNECEDOR - NUMERO_NOTA" como string única
-        def format_complemento(row):
-            cnpj = row.get("cnpj_emissor", "")
-            fornecedor = row.get("fornecedor", "")
-            numero_nota = row.get("nNF", "") or row.get("nnotafiscal", "")
-            parts = [cnpj, fornecedor, numero_nota]
-            return " - ".join([p for p in parts if p])
-
-        df_csv["COMPLEMENTO"] = df.apply(format_complemento, axis=1)
+        # Cabeçalhos, formatação de DATA/VALOR e COMPLEMENTO em src/export.py
+        csv_data = gerar_csv_contabil(st.session_state.df_geral)
 
         # Gerar nome do arquivo com "YYYY/MM" + Nome Fantasia + ".csv"
         nome_fantasia = ""
         if st.session_state.empresa_selecionada:
-            from src.db import engine, Table, MetaData
-            metadata = MetaData()
-            nome_fantasia = ""
             try:
-                metadata.reflect(bind=engine)
-                empresas_table = Table('empresas', metadata, autoload_with=engine)
-                with engine.connect() as conn:
-                    result = conn.execute(empresas_table.select().where(empresas_table.c.id == st.session_state.empresa_selecionada))
-                    empresa = result.fetchone()
-                    if empresa:
-                        nome_fantasia = empresa.nome or empresa.razao_social or "empresa"
+                # Empresa lida junto com as preferências no upload; só consulta se mudou
+                empresa = st.session_state.get("empresa_carregada")
+                if not empresa or empresa.get("id") != st.session_state.empresa_selecionada:
+                    empresa = obter_empresa(st.session_state.empresa_selecionada)
+                if empresa:
+                    nome_fantasia = empresa["nome"] or empresa["razao_social"] or "empresa"
             except Exception as e:
                 st.warning("Não foi possível ler dados da empresa do banco: " + str(e))
                 nome_fantasia = "empresa"
 
-        now = datetime.now()
-        prefix = now.strftime("%Y/%m")
-        filename = f"{prefix}_{nome_fantasia}.csv"
-
-        # Criar arquivo CSV temporário com separador ";"
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False, newline='', suffix=".csv") as tmpfile:
-            df_csv.to_csv(tmpfile.name, index=False, sep=";")
-            tmpfile.seek(0)
-            csv_data = tmpfile.read()
+        filename = nome_arquivo_csv(nome_fantasia)
 
         st.download_button(
             label="⬇️ Baixar CSV",
@@ -0,0 +1,102 @@
+"""
+Benchmark de memória do caminho de upload: cópias por arquivo (legado) vs. buffer único.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_memoria_upload [--mb 1024]
+
+Monta um "upload" sintético de --mb megabytes replicando os XMLs de docs/ (cada
+arquivo com seu próprio buffer, como os UploadedFile do Streamlit) e mede, em um
+subprocesso por modo, o pico de RSS acima do necessário para manter o próprio upload:
+  - legado: file.read() + dois BytesIO por arquivo e os dois leitores sobre todos os arquivos
+  - atual : extrair_dados_fiscais sobre os UploadedFile, com um único bytes por arquivo
+"""
+import argparse
+import glob
+import io
+import os
+import resource
+import subprocess
+import sys
+import time
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs")
+
+
+class _UploadedFile(io.BytesIO):
+    """Imita streamlit.UploadedFile: BytesIO sobre os bytes recebidos, com .name."""
+
+    def __init__(self, nome, conteudo):
+        super().__init__(conteudo)
+        self.name = nome
+
+
+def _montar_upload(mb):
+    modelos = []
+    for caminho in sorted(glob.glob(os.path.join(DOCS_DIR, "*.xml"))):
+        with open(caminho, "rb") as fh:
+            modelos.append(fh.read())
+    if not modelos:
+        raise SystemExit(f"Nenhum XML encontrado em {DOCS_DIR}")
+    alvo = mb * 1024 * 1024
+    arquivos, tamanho, i = [], 0, 0
+    while tamanho < alvo:
+        conteudo = bytes(bytearray(modelos[i % len(modelos)]))  # buffer próprio por arquivo
+        arquivos.append(_UploadedFile(f"{i:06d}.xml", conteudo))
+        tamanho += len(conteudo)
+        i += 1
+    return arquivos, tamanho
+
+
+def _rss_mb():
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rodar_modo(modo, mb):
+    from src.xml_reader import extrair_dados_xmls
+    from src.nfse_reader import extrair_dados_nfses_xmls
+    from src.dispatcher import extrair_dados_fiscais
+
+    uploads, tamanho = _montar_upload(mb)
+    base = _rss_mb()
+    inicio = time.perf_counter()
+    if modo == "legado":
+        copias_1, copias_2 = [], []
+        for file in uploads:
+            content = file.read()
+            b1 = io.BytesIO(content)
+            b1.name = file.name
+            copias_1.append(b1)
+            b2 = io.BytesIO(content)
+            b2.name = file.name
+            copias_2.append(b2)
+        resultado = (extrair_dados_xmls(copias_1), extrair_dados_nfses_xmls(copias_2))
+    else:
+        resultado = extrair_dados_fiscais(uploads)
+    duracao = time.perf_counter() - inicio
+    print(f"{modo};{tamanho / 1024 / 1024:.0f};{len(uploads)};{_rss_mb() - base:.0f};{duracao:.1f}")
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=int, default=1024, help="tamanho total do upload sintético")
+    parser.add_argument("--modo", choices=["legado", "atual"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.modo:
+        _rodar_modo(args.modo, args.mb)
+        return
+
+    print(f"{'modo':8} {'upload':>9} {'arquivos':>9} {'pico RSS extra':>15} {'tempo':>8}")
+    for modo in ("legado", "atual"):
+        saida = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_memoria_upload", "--mb", str(args.mb), "--modo", modo],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        nome, tamanho, n, rss, duracao = saida.split(";")
+        print(f"{nome:8} {tamanho + ' MB':>9} {n:>9} {rss + ' MB':>15} {duracao + ' s':>8}")
+
+
+if __name__ == "__main__":
+    main()
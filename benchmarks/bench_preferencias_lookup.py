@@ -0,0 +1,116 @@
+"""
+Benchmark da busca de preferências por fornecedor em função do tamanho da tabela.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_preferencias_lookup [--url URL] [--linhas 1000,10000,100000] [--buscas 200]
+
+Para cada tamanho, recria preferencias_fornecedor_empresa sem índice, preenche com
+linhas sintéticas (várias empresas, com algumas duplicatas) e mede a latência média
+de uma busca (empresa_id, cnpj_fornecedor):
+  - legado : empresa_id convertido para texto na comparação (CAST), sem índice
+  - migrado: após src.migrations (sem duplicatas, índice único), comparação direta
+
+Sem --url usa um SQLite temporário; para medir o banco real passe a URL de um banco
+de testes (a tabela é apagada e recriada).
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import String, create_engine, insert, select, text
+
+_EMPRESAS = 50
+
+
+def _recriar_tabela(eng, tabela):
+    from src.migrations import schema_migrations
+
+    schema_migrations.drop(eng, checkfirst=True)
+    tabela.drop(eng, checkfirst=True)
+    tabela.create(eng)
+    with eng.begin() as conn:
+        for indice in tabela.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {indice.name}"))
+
+
+def _preencher(eng, tabela, linhas):
+    rng = random.Random(42)
+    registros = []
+    for i in range(linhas):
+        # ~2% de duplicatas, como as gravadas pelo caminho legado sem chave única
+        n = rng.randrange(i) if i and rng.random() < 0.02 else i
+        registros.append(
+            {
+                "empresa_id": n % _EMPRESAS + 1,
+                "cnpj_fornecedor": f"{n:014d}",
+                "tipo_operacao": "1102",
+                "debito": "1" * 13,
+                "credito": "2" * 13,
+                "historico": "3" * 9,
+            }
+        )
+    with eng.begin() as conn:
+        for i in range(0, len(registros), 5000):
+            conn.execute(insert(tabela), registros[i:i + 5000])
+
+
+def _medir(eng, tabela, linhas, buscas, legado):
+    rng = random.Random(7)
+    alvos = [rng.randrange(linhas) for _ in range(buscas)]
+    tempos = []
+    with eng.connect() as conn:
+        for n in alvos:
+            empresa_id = n % _EMPRESAS + 1
+            if legado:
+                cond = tabela.c.empresa_id.cast(String) == str(empresa_id)
+            else:
+                cond = tabela.c.empresa_id == empresa_id
+            stmt = select(tabela).where(cond & (tabela.c.cnpj_fornecedor == f"{n:014d}"))
+            inicio = time.perf_counter()
+            conn.execute(stmt).fetchone()
+            tempos.append(time.perf_counter() - inicio)
+    return statistics.mean(tempos) * 1000, statistics.median(tempos) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="URL SQLAlchemy (padrão: SQLite temporário)")
+    parser.add_argument("--linhas", default="1000,10000,100000", help="tamanhos da tabela, separados por vírgula")
+    parser.add_argument("--buscas", type=int, default=200, help="buscas medidas por cenário")
+    args = parser.parse_args(argv)
+
+    from src.db import preferencias_fornecedor_empresa as tabela
+    from src.migrations import executar_migracoes
+
+    tmp = None
+    url = args.url
+    if url is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+        tmp.close()
+        url = f"sqlite:///{tmp.name}"
+    eng = create_engine(url)
+
+    print(f"{'linhas':>8} {'legado (ms)':>18} {'migrado (ms)':>18} {'ganho':>8}")
+    try:
+        for linhas in [int(v) for v in args.linhas.split(",")]:
+            _recriar_tabela(eng, tabela)
+            _preencher(eng, tabela, linhas)
+            media_legado, mediana_legado = _medir(eng, tabela, linhas, args.buscas, legado=True)
+            executar_migracoes(eng)
+            media_novo, mediana_novo = _medir(eng, tabela, linhas, args.buscas, legado=False)
+            print(
+                f"{linhas:>8} {media_legado:>8.3f} / {mediana_legado:<7.3f} "
+                f"{media_novo:>8.3f} / {mediana_novo:<7.3f} {media_legado / media_novo:>7.1f}x"
+            )
+        print("(média / mediana por busca)")
+    finally:
+        eng.dispose()
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
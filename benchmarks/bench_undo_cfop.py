@@ -0,0 +1,85 @@
+"""
+Benchmark da aplicação de CFOP em lote com registro para desfazer.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_undo_cfop [--itens 10000,100000] [--itens-por-nota 5] [--aplicacoes 5]
+
+Para cada tamanho monta uma TabelaItens sintética, aplica um CFOP a todos os itens
+--aplicacoes vezes e mede tempo e memória do registro de desfazer:
+  - legado: um dict {chave, nItem, old, new} por item, pilha sem limite
+  - atual : src.itens.DiarioCfop (posições em faixas, valores anteriores em run-length)
+Ao final, desfaz tudo no diário e confere que a tabela voltou ao estado inicial.
+"""
+import argparse
+import sys
+import time
+
+from src.itens import DiarioCfop, TabelaItens
+
+
+def _tabela(n, por_nota):
+    itens_por_chave = {
+        f"NFe{i:044d}": [{"nItem": str(j + 1), "cfop": "5102"} for j in range(por_nota)]
+        for i in range(n // por_nota)
+    }
+    return TabelaItens.de_itens_por_chave(itens_por_chave)
+
+
+def _tamanho_legado(pilha):
+    total = sys.getsizeof(pilha)
+    for entrada in pilha:
+        total += sys.getsizeof(entrada) + sum(sys.getsizeof(d) for d in entrada)
+    return total
+
+
+def _legado(tabela, posicoes, cfop, pilha):
+    sub = tabela.df.iloc[posicoes]
+    antigos = tabela.atribuir_cfop(posicoes, cfop)
+    pilha.append(
+        [
+            {"chave": chave, "nItem": nItem, "old": None if old != old else old, "new": cfop}
+            for chave, nItem, old in zip(sub["chave"].astype(object), sub["nItem"], antigos)
+        ]
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--itens", default="10000,100000", help="total de itens, separados por vírgula")
+    parser.add_argument("--itens-por-nota", type=int, default=5)
+    parser.add_argument("--aplicacoes", type=int, default=5, help="aplicações em lote por tamanho")
+    args = parser.parse_args(argv)
+
+    print(f"{'itens':>7} {'legado (ms)':>12} {'legado (KB)':>12} {'atual (ms)':>11} {'atual (KB)':>11}")
+    for n in [int(v) for v in args.itens.split(",")]:
+        cfops = [f"{1100 + i}" for i in range(args.aplicacoes)]
+
+        tabela = _tabela(n, args.itens_por_nota)
+        posicoes = tabela.posicoes_das_notas(list(tabela._offsets))
+        pilha = []
+        inicio = time.perf_counter()
+        for cfop in cfops:
+            _legado(tabela, posicoes, cfop, pilha)
+        legado = time.perf_counter() - inicio
+
+        tabela = _tabela(n, args.itens_por_nota)
+        inicial = tabela.df["cfop_editado"].astype(object).copy()
+        diario = DiarioCfop(tabela, limite=args.aplicacoes)
+        inicio = time.perf_counter()
+        for cfop in cfops:
+            diario.aplicar(posicoes, cfop)
+        atual = time.perf_counter() - inicio
+        tamanho = diario.tamanho_bytes()
+
+        while diario.desfazer():
+            pass
+        assert tabela.df["cfop_editado"].astype(object).equals(inicial)
+
+        print(
+            f"{n:>7} {legado * 1000:>12.1f} {_tamanho_legado(pilha) / 1024:>12.0f} "
+            f"{atual * 1000:>11.1f} {tamanho / 1024:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark do write-back das edições do st.data_editor em df_geral.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_write_back [--notas 1000,10000,50000] [--editadas 0.01] [--amostra-legado 1000]
+
+Para cada tamanho monta um df_geral sintético, simula o retorno do editor com uma
+fração das notas alteradas e mede:
+  - legado: iterrows() + seis df_geral.loc[df_geral["chave"] == chave, col] = ... por linha
+            (O(linhas² × 6); medido nas primeiras --amostra-legado linhas e extrapolado
+            linearmente, já que cada linha custa uma varredura completa)
+  - atual : src.edicao.aplicar_edicoes (diff por chave, só células alteradas)
+Ambos os caminhos são conferidos: o resultado final de df_geral precisa ser igual.
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from src.edicao import COLUNAS_EDITAVEIS, aplicar_edicoes
+
+
+def _df_geral(n):
+    return pd.DataFrame(
+        {
+            "chave": [f"NFe{i:044d}" for i in range(n)],
+            "tipo": "NFe",
+            "fornecedor": [f"Fornecedor {i % 800}" for i in range(n)],
+            "cnpj_emissor": [f"{i % 800:014d}" for i in range(n)],
+            "valor_total": [float(i % 1000) for i in range(n)],
+            "tipo_operacao": "1102",
+            "data_nota": "2025-01-01",
+            "complemento": [f"{i % 800:014d} Fornecedor {i % 800} {i}" for i in range(n)],
+            "debito": "",
+            "credito": "",
+            "historico": "",
+        }
+    )
+
+
+def _editado(df_geral, fracao):
+    rng = random.Random(42)
+    editado = df_geral.copy()
+    editado.insert(0, "Selecionar", False)
+    linhas = rng.sample(range(len(editado)), max(1, int(len(editado) * fracao)))
+    editado.loc[linhas, "tipo_operacao"] = "2102"
+    editado.loc[linhas, "debito"] = "1" * 13
+    return editado
+
+
+def _legado(df_geral, edited_df):
+    for _, row in edited_df.iterrows():
+        chave = row["chave"]
+        for col in COLUNAS_EDITAVEIS:
+            df_geral.loc[df_geral["chave"] == chave, col] = row.get(col, "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notas", default="1000,10000,50000", help="tamanhos de df_geral, separados por vírgula")
+    parser.add_argument("--editadas", type=float, default=0.01, help="fração de notas alteradas no editor")
+    parser.add_argument("--amostra-legado", type=int, default=1000, help="linhas medidas no caminho legado")
+    args = parser.parse_args(argv)
+
+    print(f"{'notas':>7} {'legado (s)':>14} {'atual (ms)':>11} {'células':>8} {'ganho':>9}")
+    for n in [int(v) for v in args.notas.split(",")]:
+        base = _df_geral(n)
+        editado = _editado(base, args.editadas)
+
+        amostra = min(n, args.amostra_legado)
+        df_legado = base.copy()
+        inicio = time.perf_counter()
+        _legado(df_legado, editado.iloc[:amostra])
+        legado = (time.perf_counter() - inicio) * n / amostra
+
+        df_atual = base.copy()
+        inicio = time.perf_counter()
+        celulas = aplicar_edicoes(df_atual, editado)
+        atual = time.perf_counter() - inicio
+
+        # Conferência: o legado aplicado por completo só é viável nos tamanhos pequenos
+        if amostra == n:
+            pd.testing.assert_frame_equal(df_legado, df_atual)
+        else:
+            esperado = base.copy()
+            for col in COLUNAS_EDITAVEIS:
+                esperado[col] = editado[col].to_numpy()
+            pd.testing.assert_frame_equal(esperado, df_atual)
+
+        marca = "" if amostra == n else "*"
+        print(
+            f"{n:>7} {legado:>13.2f}{marca or ' '} {atual * 1000:>11.2f} {celulas:>8} {legado / atual:>8.0f}x"
+        )
+    print("* extrapolado a partir da amostra")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark do extrator de NF-e: percurso único (atual) vs. buscas `.//` repetidas (legado).
+
+Uso (na raiz do projeto):
+    python -m benchmarks.bench_xml_reader [--repeticoes 20] [--copias 10]
+
+Usa os XMLs de exemplo em docs/ e confere que os dois extratores produzem a mesma saída.
+"""
+import argparse
+import glob
+import io
+import os
+import time
+
+from lxml import etree
+import pandas as pd
+
+from src.xml_reader import extrair_dados_xmls
+
+NS = "{http://www.portalfiscal.inf.br/nfe}"
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs")
+
+
+def _extrair_legado(arquivos_xml):
+    """Cópia da extração anterior (uma busca `.//` por campo), mantida só para comparação."""
+    registros = []
+    itens_por_chave = {}
+    for file in arquivos_xml:
+        root = etree.parse(file).getroot()
+        infNFe = root.find(f".//{NS}infNFe")
+        if infNFe is None:
+            continue
+        emit = root.find(f".//{NS}emit")
+        cnpj_emissor = emit.findtext(f"{NS}CNPJ", default="") if emit is not None else ""
+        fornecedor = emit.findtext(f"{NS}xNome", default="") if emit is not None else ""
+        chave = infNFe.get("Id", "").replace("NFe", "")
+        valor_total = root.findtext(f".//{NS}vNF", default="0")
+        cfop_atual = root.findtext(f".//{NS}CFOP", default="")
+        credito_icms = root.findtext(f".//{NS}vICMS", default="0")
+        data_emissao = root.findtext(f".//{NS}dhEmi", default="") or root.findtext(f".//{NS}dEmi", default="")
+        numero_nota = root.findtext(f".//{NS}nNF", default="")
+        itens = []
+        for det in root.findall(f".//{NS}det"):
+            prod = det.find(f"{NS}prod")
+            if prod is None:
+                continue
+            itens.append({
+                "nItem": det.get("nItem", ""),
+                "cProd": prod.findtext(f"{NS}cProd", default=""),
+                "xProd": prod.findtext(f"{NS}xProd", default=""),
+                "qCom": prod.findtext(f"{NS}qCom", default=""),
+                "vProd": prod.findtext(f"{NS}vProd", default=""),
+                "cfop": prod.findtext(f"{NS}CFOP", default=""),
+            })
+        itens_por_chave[chave] = itens
+        registros.append({
+            "chave": chave,
+            "tipo": "NFe",
+            "fornecedor": fornecedor,
+            "cnpj_emissor": cnpj_emissor,
+            "valor_total": float(valor_total) if valor_total not in (None, "") else 0.0,
+            "cfop_atual": cfop_atual,
+            "credito_icms": float(credito_icms) if credito_icms not in (None, "") else 0.0,
+            "data_nota": data_emissao,
+            "complemento": f"{cnpj_emissor} {fornecedor} {numero_nota}",
+            "nNF": numero_nota,
+        })
+    return pd.DataFrame(registros), itens_por_chave
+
+
+def _carregar_docs(copias):
+    conteudos = []
+    for caminho in sorted(glob.glob(os.path.join(DOCS_DIR, "*.xml"))):
+        with open(caminho, "rb") as fh:
+            conteudos.append((os.path.basename(caminho), fh.read()))
+    return conteudos * copias
+
+
+def _como_uploads(conteudos):
+    arquivos = []
+    for nome, conteudo in conteudos:
+        b = io.BytesIO(conteudo)
+        b.name = nome
+        arquivos.append(b)
+    return arquivos
+
+
+def _medir(func, conteudos, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        arquivos = _como_uploads(conteudos)
+        inicio = time.perf_counter()
+        func(arquivos)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--copias", type=int, default=10, help="quantas vezes repetir o lote de docs/")
+    args = parser.parse_args()
+
+    conteudos = _carregar_docs(args.copias)
+    if not conteudos:
+        raise SystemExit(f"Nenhum XML encontrado em {DOCS_DIR}")
+
+    df_novo, _, itens_novo = extrair_dados_xmls(_como_uploads(conteudos))
+    df_legado, itens_legado = _extrair_legado(_como_uploads(conteudos))
+    pd.testing.assert_frame_equal(df_novo, df_legado)
+    assert itens_novo == itens_legado, "itens divergentes entre os extratores"
+
+    t_legado = _medir(_extrair_legado, conteudos, args.repeticoes)
+    t_novo = _medir(lambda arqs: extrair_dados_xmls(arqs), conteudos, args.repeticoes)
+    n = len(conteudos)
+    print(f"{n} arquivo(s), melhor de {args.repeticoes} execução(ões)")
+    print(f"  legado (buscas .//): {t_legado * 1000:8.1f} ms  ({t_legado * 1000 / n:.2f} ms/arquivo)")
+    print(f"  percurso único     : {t_novo * 1000:8.1f} ms  ({t_novo * 1000 / n:.2f} ms/arquivo)")
+    print(f"  ganho              : {t_legado / t_novo:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
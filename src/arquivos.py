@@ -0,0 +1,177 @@
+import io
+import os
+import posixpath
+import tarfile
+import zipfile
+from collections import namedtuple
+
+# Um arquivo enviado: nome e conteúdo (bytes imutáveis). O mesmo objeto bytes é
+# compartilhado por leitores, arquivos_dict e exportação do ZIP, sem cópias.
+ArquivoXML = namedtuple("ArquivoXML", ["nome", "conteudo"])
+
+
+def ler_arquivo(file):
+    """
+    Retorna ArquivoXML(nome, conteúdo em bytes) de um arquivo enviado (UploadedFile, BytesIO com .name, ...).
+
+    Para objetos BytesIO (caso do UploadedFile do Streamlit), getvalue() devolve o
+    próprio buffer interno enquanto ele não for modificado, então nenhuma cópia é feita.
+    """
+    if isinstance(file, tuple):
+        # Já lido (ex.: pelo despachante em src/dispatcher.py)
+        return ArquivoXML(*file)
+    nome = getattr(file, "name", str(file))
+    try:
+        conteudo = file.getvalue()
+    except Exception:
+        # Se o objeto não tiver getvalue (por alguma razão), ler do começo
+        file.seek(0)
+        conteudo = file.read()
+    return ArquivoXML(nome, conteudo)
+
+
+# Compactados aceitos no upload (além de .xml)
+EXTENSOES_COMPACTADAS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+# Limite de aninhamento (ZIP dentro de ZIP...) para evitar recursão sem fim em arquivos maliciosos
+PROFUNDIDADE_MAXIMA = 3
+
+
+def _env_mb(nome, padrao):
+    try:
+        return int(float(os.getenv(nome) or padrao) * 1024 * 1024)
+    except ValueError:
+        return int(padrao * 1024 * 1024)
+
+
+# Limites de descompactação (proteção contra "zip bombs"): tamanho de cada membro e soma
+# de tudo o que é extraído numa chamada de expandir_arquivos
+TAMANHO_MAXIMO_MEMBRO = _env_mb("ARQUIVOS_MAX_MEMBRO_MB", 64)
+TAMANHO_MAXIMO_TOTAL = _env_mb("ARQUIVOS_MAX_TOTAL_MB", 1024)
+
+
+class _LimiteTotalExcedido(Exception):
+    pass
+
+
+class _Orcamento:
+    """Bytes ainda disponíveis para extração na chamada atual de expandir_arquivos."""
+
+    def __init__(self, total):
+        self.restante = total
+
+    def ler(self, membro, declarado):
+        """
+        Lê o membro respeitando os limites; None (membro ignorado) se passar do limite por
+        membro. O tamanho declarado no cabeçalho é conferido antes e o lido de fato depois,
+        já que o cabeçalho pode mentir.
+        """
+        if declarado > TAMANHO_MAXIMO_MEMBRO:
+            return None
+        if declarado > self.restante:
+            raise _LimiteTotalExcedido()
+        limite = min(TAMANHO_MAXIMO_MEMBRO, self.restante)
+        dados = membro.read(limite + 1)
+        if len(dados) > limite:
+            if limite == TAMANHO_MAXIMO_MEMBRO:
+                return None
+            raise _LimiteTotalExcedido()
+        self.restante -= len(dados)
+        return dados
+
+
+def _tipo_compactado(nome, conteudo):
+    if conteudo[:4] == b"PK\x03\x04":
+        return "zip"
+    nome = nome.lower()
+    if conteudo[:2] == b"\x1f\x8b" or nome.endswith(EXTENSOES_COMPACTADAS[1:]) or conteudo[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+def _membros_zip(conteudo, orcamento):
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            # Leitura do membro direto do ZIP em memória, sem extrair para disco
+            with zf.open(info) as membro:
+                yield info.filename, orcamento.ler(membro, info.file_size)
+
+
+def _membros_tar(conteudo, orcamento):
+    # Modo "r|*": leitura sequencial (streaming), com gzip/bz2/xz detectado automaticamente
+    with tarfile.open(fileobj=io.BytesIO(conteudo), mode="r|*") as tf:
+        for info in tf:
+            if not info.isfile():
+                continue
+            membro = tf.extractfile(info)
+            if membro is not None:
+                yield info.name, orcamento.ler(membro, info.size)
+
+
+def _nome_unico(caminho, usados):
+    """
+    Nome base do membro; se já houver outro arquivo com esse nome no lote (ex.:
+    a/nota.xml e b/nota.xml), usa o caminho do membro e, se preciso, um sufixo.
+    """
+    nome = posixpath.basename(caminho)
+    if nome in usados:
+        nome = caminho.lstrip("/")
+        raiz, ext = posixpath.splitext(nome)
+        n = 2
+        while nome in usados:
+            nome = f"{raiz} ({n}){ext}"
+            n += 1
+    usados.add(nome)
+    return nome
+
+
+def _expandir(nome, conteudo, profundidade, saida, orcamento, usados):
+    tipo = _tipo_compactado(nome, conteudo)
+    if tipo is None:
+        saida.append(ArquivoXML(nome if profundidade == 0 else _nome_unico(nome, usados), conteudo))
+        return
+    if profundidade >= PROFUNDIDADE_MAXIMA:
+        print(f"Erro ao processar {nome}: compactado aninhado além de {PROFUNDIDADE_MAXIMA} níveis")
+        return
+    membros = _membros_zip(conteudo, orcamento) if tipo == "zip" else _membros_tar(conteudo, orcamento)
+    try:
+        for caminho, dados in membros:
+            base = posixpath.basename(caminho)
+            # Ignora metadados do macOS e arquivos ocultos
+            if caminho.startswith("__MACOSX/") or base.startswith("."):
+                continue
+            if dados is None:
+                print(f"Erro ao processar {nome}: {caminho} excede {TAMANHO_MAXIMO_MEMBRO // (1024 * 1024)} MB; ignorado")
+                continue
+            if base.lower().endswith(".xml") or _tipo_compactado(base, dados):
+                _expandir(caminho, dados, profundidade + 1, saida, orcamento, usados)
+    except _LimiteTotalExcedido:
+        print(
+            f"Erro ao processar {nome}: conteúdo descompactado excede {TAMANHO_MAXIMO_TOTAL // (1024 * 1024)} MB; "
+            "demais arquivos ignorados"
+        )
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        print(f"Erro ao processar {nome}: {e}")
+
+
+def expandir_arquivos(arquivos):
+    """
+    Substitui cada ZIP/TAR (inclusive .tar.gz e ZIPs aninhados) pelos XMLs que contém.
+
+    Os membros são lidos direto do compactado em memória (ZipFile.open / tarfile em
+    modo streaming), sem gravar em disco, e viram ArquivoXML com o nome base do membro,
+    para que a busca por "<chave>.xml" na exportação continue funcionando; quando dois
+    membros têm o mesmo nome base, o seguinte mantém o caminho dentro do compactado.
+    Membros acima de TAMANHO_MAXIMO_MEMBRO são ignorados e a extração para ao somar
+    TAMANHO_MAXIMO_TOTAL. Arquivos que não são compactados passam inalterados.
+    """
+    saida = []
+    orcamento = _Orcamento(TAMANHO_MAXIMO_TOTAL)
+    lidos = [ler_arquivo(file) for file in arquivos]
+    # Nomes já usados no lote: os XMLs enviados diretamente têm prioridade sobre os extraídos
+    usados = {nome for nome, conteudo in lidos if _tipo_compactado(nome, conteudo) is None}
+    for nome, conteudo in lidos:
+        _expandir(nome, conteudo, 0, saida, orcamento, usados)
+    return saida
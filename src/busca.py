@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Opção dos filtros que busca em todas as colunas indexadas
+TODOS = "Todos"
+# Separador entre colunas no texto concatenado: não aparece em dados digitados, então
+# uma busca não casa "atravessando" duas colunas
+_SEPARADOR = "\x1f"
+
+
+# Marcas combinantes (acentos) que sobram após a decomposição NFKD
+_MARCAS_COMBINANTES = "[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]"
+
+
+def normalizar(serie):
+    """
+    Minúsculas (casefold) e sem acentos ("São Paulo" -> "sao paulo"); NaN/None viram "".
+
+    É a única normalização usada pelo índice e pela consulta: demais caracteres (travessão,
+    "°", etc.) são mantidos, então o texto digitado casa com o valor exibido.
+    """
+    texto = serie.astype(object).where(serie.notna(), "").astype(str)
+    return (
+        texto.str.normalize("NFKD")
+        .str.replace(_MARCAS_COMBINANTES, "", regex=True)
+        .str.casefold()
+    )
+
+
+def normalizar_texto(texto):
+    """normalizar() para um único texto (usado no termo buscado)."""
+    return normalizar(pd.Series([texto], dtype=object)).iloc[0]
+
+
+class IndiceBusca:
+    """
+    Índice de busca por substring sobre colunas de um DataFrame, construído uma vez por carga.
+
+    Guarda, para cada coluna, os valores já normalizados (minúsculas, sem acentos) e uma
+    coluna com todos eles concatenados para a opção "Todos". Uma busca é um único
+    str.contains vetorizado, sem reconstruir texto linha a linha; quando células são
+    editadas, atualizar() recalcula só as linhas/colunas afetadas.
+    """
+
+    def __init__(self, df, colunas):
+        self.colunas = [c for c in colunas if c in df.columns]
+        self.index = df.index.copy()
+        self._por_coluna = {c: normalizar(df[c]) for c in self.colunas}
+        self._todos = self._concatenar(self._por_coluna, self.index)
+
+    def _concatenar(self, por_coluna, rotulos):
+        if not self.colunas:
+            return pd.Series("", index=rotulos, dtype=object)
+        partes = [por_coluna[c].loc[rotulos] for c in self.colunas]
+        todos = partes[0]
+        for parte in partes[1:]:
+            todos = todos + _SEPARADOR + parte
+        return todos
+
+    def compativel(self, df):
+        """True se o índice foi construído sobre as mesmas linhas de df (senão, reconstrua)."""
+        return len(df) == len(self.index) and df.index.equals(self.index)
+
+    def atualizar(self, df, rotulos, colunas=None):
+        """Reindexa as células de df nas linhas (rótulos do índice) e colunas informadas."""
+        colunas = [c for c in (colunas or self.colunas) if c in self._por_coluna]
+        rotulos = pd.Index(rotulos)
+        if rotulos.empty or not colunas:
+            return
+        for c in colunas:
+            self._por_coluna[c].loc[rotulos] = normalizar(df.loc[rotulos, c]).to_numpy()
+        self._todos.loc[rotulos] = self._concatenar(self._por_coluna, rotulos).to_numpy()
+
+    def filtrar(self, texto, coluna=TODOS):
+        """
+        Máscara booleana (numpy, na ordem do índice) das linhas que contêm o texto.
+
+        A comparação ignora maiúsculas e acentos. Coluna fora do índice não casa nada.
+        """
+        termo = normalizar_texto(texto.strip())
+        if not termo:
+            return np.ones(len(self.index), dtype=bool)
+        if coluna == TODOS:
+            valores = self._todos
+        elif coluna in self._por_coluna:
+            valores = self._por_coluna[coluna]
+        else:
+            return np.zeros(len(self.index), dtype=bool)
+        return valores.str.contains(termo, regex=False).to_numpy(dtype=bool)
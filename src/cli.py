@@ -0,0 +1,181 @@
+"""
+Processamento em lote sem interface (para agendamento noturno).
+
+Uso:
+    python -m src.cli ENTRADA [ENTRADA ...] --empresa-id ID --saida DIR [--workers N] [--streaming]
+
+ENTRADA pode ser um XML, um compactado (.zip, .tar.gz, ...) ou um diretório (lido
+recursivamente). O fluxo é o mesmo do app: leitura (NF-e/NFS-e), preferências salvas
+por fornecedor, ZIP com CFOP e PIS/COFINS reescritos e CSV contábil. Ao final um
+resumo em JSON (contagens, arquivos gerados e tempos por etapa) é impresso em stdout;
+mensagens de progresso e avisos vão para stderr.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+from src.arquivos import ArquivoXML, EXTENSOES_COMPACTADAS, _nome_unico
+
+_EXTENSOES_ENTRADA = (".xml",) + EXTENSOES_COMPACTADAS
+
+
+def _listar_entradas(caminhos):
+    """
+    Coleta (nome, bytes) dos arquivos informados, percorrendo diretórios em ordem alfabética.
+
+    O nome é o nome base do arquivo; se outro arquivo do lote já o usa (ex.: a/nota.xml e
+    b/nota.xml), vale o caminho relativo à entrada, como nos membros de compactados.
+    """
+    arquivos = []
+    usados = set()
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            encontrados = []
+            for raiz, _, nomes in os.walk(caminho):
+                for nome in nomes:
+                    if nome.lower().endswith(_EXTENSOES_ENTRADA):
+                        encontrados.append(os.path.join(raiz, nome))
+            candidatos = [(arquivo, os.path.relpath(arquivo, caminho)) for arquivo in sorted(encontrados)]
+        else:
+            candidatos = [(caminho, caminho)]
+        for arquivo, relativo in candidatos:
+            with open(arquivo, "rb") as fh:
+                nome = _nome_unico(relativo.replace(os.sep, "/"), usados)
+                arquivos.append(ArquivoXML(nome, fh.read()))
+    return arquivos
+
+
+def _nome_empresa(empresa_id):
+    from src.db import obter_empresa
+
+    empresa = obter_empresa(empresa_id)
+    if empresa:
+        return empresa["nome"] or empresa["razao_social"] or "empresa"
+    return "empresa"
+
+
+def _progresso(idx, total, nome=None):
+    print(f"[{idx}/{total}] {nome or ''}", file=sys.stderr)
+
+
+def executar(entradas, empresa_id, saida, workers=None, streaming=False, usar_cache=True, usar_preferencias=True):
+    """Roda o lote completo e retorna o resumo (dict serializável em JSON)."""
+    from src.dispatcher import extrair_dados_fiscais
+    from src.parse_cache import obter_cache_padrao
+    from src.export import gerar_zip_xmls_alterados, gerar_zip_xmls_originais, gerar_csv_contabil, nome_arquivo_csv
+
+    tempos = {}
+    avisos = []
+    inicio_total = time.perf_counter()
+
+    inicio = time.perf_counter()
+    arquivos = _listar_entradas(entradas)
+    tempos["entrada"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    df_geral, arquivos_dict, itens_por_chave = extrair_dados_fiscais(
+        arquivos,
+        progress_callback=_progresso,
+        streaming=streaming,
+        paralelo=workers is not None and workers > 1,
+        max_workers=workers,
+        cache=obter_cache_padrao() if usar_cache else None,
+    )
+    tempos["leitura"] = time.perf_counter() - inicio
+
+    resumo = {
+        "empresa_id": empresa_id,
+        "arquivos": len(arquivos_dict),
+        "notas": int(len(df_geral)),
+        "nfe": int((df_geral["tipo"] == "NFe").sum()) if not df_geral.empty else 0,
+        "nfse": int((df_geral["tipo"] == "NFSe").sum()) if not df_geral.empty else 0,
+        "itens": sum(len(itens) for itens in itens_por_chave.values()),
+        "zip": None,
+        "csv": None,
+        "avisos": avisos,
+        "tempos": tempos,
+    }
+    if df_geral.empty:
+        avisos.append("Nenhuma nota válida encontrada.")
+        tempos["total"] = time.perf_counter() - inicio_total
+        return resumo
+
+    from src.preferencias import garantir_colunas, aplicar_preferencias
+
+    garantir_colunas(df_geral)
+    inicio = time.perf_counter()
+    if usar_preferencias:
+        try:
+            aplicar_preferencias(df_geral, empresa_id)
+        except Exception as e:
+            avisos.append(f"Preferências não aplicadas (banco indisponível?): {e}")
+    tempos["preferencias"] = time.perf_counter() - inicio
+
+    os.makedirs(saida, exist_ok=True)
+
+    inicio = time.perf_counter()
+    # Sem edição por item no modo em lote: vale o CFOP da nota vindo das preferências
+    zip_buffer = gerar_zip_xmls_alterados(df_geral, arquivos_dict, {})
+    nome_zip = "notas_alteradas.zip"
+    if zip_buffer is None:
+        avisos.append("Nenhuma nota elegível para gerar XML; exportando XMLs originais.")
+        zip_buffer = gerar_zip_xmls_originais(df_geral, arquivos_dict)
+        nome_zip = "notas_originais.zip"
+    if zip_buffer is not None:
+        caminho_zip = os.path.join(saida, nome_zip)
+        with open(caminho_zip, "wb") as fh:
+            fh.write(zip_buffer.getvalue())
+        resumo["zip"] = caminho_zip
+    tempos["zip"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    try:
+        nome_fantasia = _nome_empresa(empresa_id)
+    except Exception as e:
+        avisos.append(f"Não foi possível ler dados da empresa do banco: {e}")
+        nome_fantasia = "empresa"
+    # O nome do app usa "YYYY/MM"; em disco a barra vira hífen
+    caminho_csv = os.path.join(saida, nome_arquivo_csv(nome_fantasia).replace("/", "-"))
+    with open(caminho_csv, "w", encoding="utf-8", newline="") as fh:
+        fh.write(gerar_csv_contabil(df_geral))
+    resumo["csv"] = caminho_csv
+    tempos["csv"] = time.perf_counter() - inicio
+
+    tempos["total"] = time.perf_counter() - inicio_total
+    return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.cli", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("entradas", nargs="+", help="XMLs, compactados ou diretórios")
+    parser.add_argument("--empresa-id", type=int, required=True, help="id da empresa (tabela empresas)")
+    parser.add_argument("--saida", required=True, help="diretório onde gravar o ZIP e o CSV")
+    parser.add_argument("--workers", type=int, default=None, help="processos para leitura paralela (padrão: sequencial)")
+    parser.add_argument("--streaming", action="store_true", help="lê NF-e com iterparse (menos memória)")
+    parser.add_argument("--sem-cache", action="store_true", help="não usa o cache de parse em disco")
+    parser.add_argument("--sem-preferencias", action="store_true", help="não consulta preferências no banco")
+    args = parser.parse_args(argv)
+
+    # Tudo o que os módulos imprimem vai para stderr; stdout fica só com o resumo JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        resumo = executar(
+            args.entradas,
+            args.empresa_id,
+            args.saida,
+            workers=args.workers,
+            streaming=args.streaming,
+            usar_cache=not args.sem_cache,
+            usar_preferencias=not args.sem_preferencias,
+        )
+    resumo["tempos"] = {etapa: round(segundos, 3) for etapa, segundos in resumo["tempos"].items()}
+    print(json.dumps(resumo, ensure_ascii=False))
+    return 0 if resumo["notas"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
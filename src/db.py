@@ -1,5 +1,11 @@
 import os
-from sqlalchemy import create_engine, MetaData, Table, Column, String, Integer, select, insert, update
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, MetaData, Table, Column, String, Integer, Index, select, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 
 load_dotenv()  # Carrega variáveis do arquivo .env se existir
@@ -11,17 +17,41 @@ DB_HOST = os.getenv("SUPABASE_HOST")
 DB_PORT = os.getenv("SUPABASE_PORT", "5432")
 DB_NAME = os.getenv("SUPABASE_DB_NAME", "postgres")
 
-# Cria o engine apenas se as variáveis mínimas de conexão estiverem presentes.
-engine = None
-if DB_HOST and DB_PASS:
+PG_SSLMODE = os.getenv("PG_SSLMODE")
+
+# Backend de persistência: "postgres" (Supabase, padrão) ou "sqlite" (arquivo local com as
+# mesmas tabelas, para uso offline/filiais e benchmarks reproduzíveis)
+DB_BACKEND = os.getenv("DB_BACKEND", "postgres").strip().lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH") or os.path.join(
+    os.path.expanduser("~"), ".local", "share", "collosfiscal", "collosfiscal.sqlite3"
+)
+
+
+def _env_float(nome, padrao):
     try:
-        engine = create_engine(f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-    except Exception as e:
-        # Não falha a importação — apenas registra aviso. Chamadas que precisarem do DB
-        # deverão tratar a ausência do engine.
-        print(f"Warning: não foi possível criar engine do banco: {e}")
-else:
-    print("Warning: Variáveis SUPABASE_* incompletas. Engine do banco não será criado. Defina SUPABASE_HOST e SUPABASE_PASSWORD em Settings/Secrets.")
+        return float(os.getenv(nome, padrao))
+    except ValueError:
+        return float(padrao)
+
+
+# Tempo máximo para abrir uma conexão (segundos) e para cada comando SQL (ms; 0 = sem limite)
+DB_CONNECT_TIMEOUT = _env_float("DB_CONNECT_TIMEOUT", "5")
+DB_STATEMENT_TIMEOUT_MS = int(_env_float("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# Pool de conexões (QueuePool). Com DB_PGBOUNCER=1 (ex.: pooler do Supabase na porta 6543)
+# o pool local é desligado (NullPool) e quem reaproveita as conexões é o PgBouncer.
+DB_POOL_SIZE = int(_env_float("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(_env_float("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = _env_float("DB_POOL_TIMEOUT", "30")
+DB_POOL_RECYCLE = int(_env_float("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "").lower() in ("1", "true", "yes")
+
+# O engine é criado no primeiro uso (_ensure_engine), não na importação: importar este
+# módulo nunca acessa a rede. A criação das tabelas é um passo explícito
+# (inicializar_schema / python -m src.migrations).
+_engine = None
+_engine_lock = threading.Lock()
 
 metadata = MetaData()
 
@@ -85,6 +115,8 @@ preferencias_fornecedor_empresa = Table(
     Column("historico", String(9)),
     Column("data_nota", String),
     Column("complemento", String(255)),
+    # Uma preferência por fornecedor em cada empresa (alvo do ON CONFLICT do upsert em lote)
+    Index("ux_preferencias_empresa_fornecedor", "empresa_id", "cnpj_fornecedor", unique=True),
     extend_existing=True
 )
 
@@ -100,85 +132,306 @@ cfop_catalog = Table(
     extend_existing=True,
 )
 
-try:
-    if engine is not None:
-        metadata.create_all(engine)
-except Exception as e:
-    # Evita quebrar a importação do módulo quando o banco não estiver configurado
-    # ou indisponível no momento do deploy (ex: Streamlit Cloud). As funções
-    # que dependem do engine ainda irão falhar quando chamadas, mas o app
-    # poderá iniciar e tratar a falha de conexão posteriormente.
-    print(f"Warning: não foi possível criar/refletir tabelas no import time: {e}")
-
-# Helper para garantir engine antes de usar
-def _ensure_engine():
-    if engine is None:
+def criar_engine_sqlite(caminho=None):
+    """Engine do backend local (SQLite); o diretório do arquivo é criado se necessário."""
+    caminho = os.path.abspath(os.path.expanduser(caminho or SQLITE_PATH))
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    eng = create_engine(f"sqlite:///{caminho}", connect_args={"timeout": max(1.0, DB_CONNECT_TIMEOUT)})
+
+    @event.listens_for(eng, "connect")
+    def _configurar_sqlite(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        # WAL: leituras das sessões do Streamlit não bloqueiam durante uma gravação
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return eng
+
+def _configurar_statement_timeout(eng):
+    """
+    Aplica DB_STATEMENT_TIMEOUT_MS às consultas do engine.
+
+    Com PgBouncer em modo transação, a conexão do servidor muda a cada transação: um SET
+    de sessão ficaria em outra conexão (e vazaria para outros clientes), então o limite é
+    definido com SET LOCAL no início de cada transação. Sem PgBouncer, basta um SET por
+    conexão nova (em autocommit, para não ser desfeito pelo rollback do pool). Em ambos
+    os casos não se usa "options=-c statement_timeout", que o pooler do Supabase recusa.
+    """
+    if DB_PGBOUNCER:
+        @event.listens_for(eng, "begin")
+        def _definir_statement_timeout_local(conn):
+            # Cursor DBAPI direto: executar pela Connection aqui abriria outra transação
+            cursor = conn.connection.cursor()
+            cursor.execute(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+            cursor.close()
+        return
+
+    @event.listens_for(eng, "connect")
+    def _definir_statement_timeout(dbapi_conn, _):
+        autocommit = dbapi_conn.autocommit
+        dbapi_conn.autocommit = True
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"SET statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+        cursor.close()
+        dbapi_conn.autocommit = autocommit
+
+def criar_engine_postgres():
+    """Engine do PostgreSQL (Supabase) a partir das variáveis SUPABASE_*."""
+    if not (DB_HOST and DB_PASS):
         raise RuntimeError(
             "Conexão ao banco não configurada. Defina SUPABASE_HOST e SUPABASE_PASSWORD nos secrets/variáveis de ambiente."
         )
-    return engine
+    connect_args = {"connect_timeout": max(1, int(DB_CONNECT_TIMEOUT))}
+    if PG_SSLMODE:
+        connect_args["sslmode"] = PG_SSLMODE
+    if DB_PGBOUNCER:
+        opcoes_pool = {"poolclass": NullPool}
+    else:
+        opcoes_pool = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            # Recicla antes do servidor/pooler derrubar conexões ociosas
+            "pool_recycle": DB_POOL_RECYCLE,
+            # Testa a conexão no checkout: evita erros de conexão morta após períodos ociosos
+            "pool_pre_ping": DB_POOL_PRE_PING,
+        }
+    eng = create_engine(
+        f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
+        connect_args=connect_args,
+        **opcoes_pool,
+    )
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        _configurar_statement_timeout(eng)
+    return eng
+
+# Helper para garantir engine antes de usar (criado uma única vez, sob lock)
+def _ensure_engine():
+    global _engine
+    if _engine is not None:
+        return _engine
+    if DB_BACKEND not in ("postgres", "sqlite"):
+        raise RuntimeError(f"DB_BACKEND inválido: {DB_BACKEND!r} (use 'postgres' ou 'sqlite').")
+    with _engine_lock:
+        if _engine is None:
+            if DB_BACKEND == "sqlite":
+                eng = criar_engine_sqlite()
+                # Arquivo local: criar as tabelas no primeiro uso não depende de rede
+                inicializar_schema(eng)
+            else:
+                eng = criar_engine_postgres()
+            _engine = eng
+    return _engine
+
+def __getattr__(nome):
+    # Compatibilidade com "from src.db import engine": None quando o banco não está configurado
+    if nome == "engine":
+        try:
+            return _ensure_engine()
+        except Exception as e:
+            print(f"Warning: não foi possível criar engine do banco: {e}")
+            return None
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+def estatisticas_pool():
+    """Estado do pool do engine (conexões em uso, livres, overflow) para diagnóstico."""
+    if _engine is None:
+        return {"engine": "não criado"}
+    pool = _engine.pool
+    estatisticas = {"pool": type(pool).__name__, "status": pool.status()}
+    for nome in ("size", "checkedin", "checkedout", "overflow"):
+        metodo = getattr(pool, nome, None)
+        if callable(metodo):
+            estatisticas[nome] = metodo()
+    return estatisticas
+
+@contextmanager
+def _conexao(conn=None):
+    """Usa a conexão recebida (mesma unidade de trabalho) ou abre uma do pool."""
+    if conn is not None:
+        yield conn
+    else:
+        with _ensure_engine().connect() as nova:
+            yield nova
+
+@contextmanager
+def _transacao(conn=None):
+    """Como _conexao, para escrita: sem conexão recebida, abre uma com commit ao final.
+
+    Com conexão recebida, o commit fica a cargo de quem a passou.
+    """
+    if conn is not None:
+        yield conn
+    else:
+        with _ensure_engine().begin() as nova:
+            yield nova
+
+def inicializar_schema(eng=None, semear=True):
+    """
+    Cria as tabelas ausentes e semeia o catálogo de CFOPs (bootstrap; não roda na importação).
+
+    semear=False só cria as tabelas (usado pela sincronização, que traz o catálogo do central).
+    """
+    eng = eng if eng is not None else _ensure_engine()
+    metadata.create_all(eng)
+    if semear:
+        with eng.begin() as conn:
+            semear_cfop_catalog(conn=conn)
+
+# 🏢 Empresas
+# A lista de empresas é pequena e lida a cada rerun do app: fica em cache no processo,
+# invalidado ao cadastrar uma empresa e relido após EMPRESAS_CACHE_TTL segundos (para
+# enxergar cadastros feitos por outros processos).
+EMPRESAS_CACHE_TTL = _env_float("EMPRESAS_CACHE_TTL", "300")
+
+_cache_empresas = {"lista": None, "carregado_em": 0.0}
+_cache_empresas_lock = threading.Lock()
+
+def listar_empresas(conn=None):
+    """Retorna a lista de empresas (dicts id/cnpj/nome/razao_social), ordenada por id."""
+    with _cache_empresas_lock:
+        expirado = time.monotonic() - _cache_empresas["carregado_em"] > EMPRESAS_CACHE_TTL
+        if _cache_empresas["lista"] is None or expirado:
+            with _conexao(conn) as conn:
+                rows = conn.execute(select(empresas).order_by(empresas.c.id)).fetchall()
+            _cache_empresas["lista"] = [dict(r._mapping) for r in rows]
+            _cache_empresas["carregado_em"] = time.monotonic()
+        return list(_cache_empresas["lista"])
+
+def invalidar_cache_empresas():
+    """Descarta a lista de empresas em cache (a próxima chamada relê do banco)."""
+    with _cache_empresas_lock:
+        _cache_empresas["lista"] = None
+
+def obter_empresa(empresa_id, conn=None):
+    """Retorna o dict da empresa pelo id (None se não existir)."""
+    for empresa in listar_empresas(conn=conn):
+        if empresa["id"] == empresa_id:
+            return empresa
+    # Pode ter sido cadastrada por outro processo depois da última carga
+    with _conexao(conn) as conn:
+        row = conn.execute(select(empresas).where(empresas.c.id == empresa_id)).fetchone()
+    if row:
+        invalidar_cache_empresas()
+        return dict(row._mapping)
+    return None
+
+def criar_empresa(cnpj, razao_social, nome, conn=None):
+    """Cadastra a empresa e retorna o id gerado."""
+    with _transacao(conn) as conn:
+        result = conn.execute(insert(empresas).values(cnpj=cnpj, nome=nome, razao_social=razao_social))
+        empresa_id = result.inserted_primary_key[0]
+    invalidar_cache_empresas()
+    return empresa_id
 
 # 📋 Funções para buscar interpretações
 
+# As tabelas de decomposição do CFOP (origem/destino, tipo de operação, finalidade) têm
+# poucas dezenas de linhas e quase nunca mudam: ficam em memória no processo e são
+# recarregadas após CFOP_CACHE_TTL segundos (padrão 1 hora) ou por invalidar_cache_cfop().
+try:
+    CFOP_CACHE_TTL = float(os.getenv("CFOP_CACHE_TTL", "3600"))
+except ValueError:
+    CFOP_CACHE_TTL = 3600.0
+
+_cache_cfop = {"tabelas": None, "carregado_em": 0.0}
+_cache_cfop_lock = threading.Lock()
+
+def _carregar_tabelas_cfop():
+    """Lê as três tabelas de decomposição numa única conexão."""
+    tabelas = {}
+    with _conexao() as conn:
+        for nome, tabela in (
+            ("origem", origem_destino_cfop),
+            ("tipo", tipo_operacao_cfop),
+            ("finalidade", finalidade_cfop),
+        ):
+            rows = conn.execute(select(tabela.c.codigo, tabela.c.descricao)).fetchall()
+            tabelas[nome] = {codigo: descricao for codigo, descricao in rows}
+    return tabelas
+
+def _tabelas_cfop():
+    with _cache_cfop_lock:
+        expirado = time.monotonic() - _cache_cfop["carregado_em"] > CFOP_CACHE_TTL
+        if _cache_cfop["tabelas"] is None or expirado:
+            _cache_cfop["tabelas"] = _carregar_tabelas_cfop()
+            _cache_cfop["carregado_em"] = time.monotonic()
+        return _cache_cfop["tabelas"]
+
+def invalidar_cache_cfop():
+    """Descarta as tabelas de decomposição em memória (a próxima consulta relê do banco)."""
+    with _cache_cfop_lock:
+        _cache_cfop["tabelas"] = None
+
 def buscar_origem_destino(digito):
-    eng = _ensure_engine()
-    with eng.connect() as conn:
-        stmt = select(origem_destino_cfop.c.descricao).where(origem_destino_cfop.c.codigo == digito)
-        result = conn.execute(stmt).fetchone()
-        return result[0] if result else "Origem desconhecida"
+    return _tabelas_cfop()["origem"].get(digito, "Origem desconhecida")
 
 def buscar_tipo_operacao(digito):
-    eng = _ensure_engine()
-    with eng.connect() as conn:
-        stmt = select(tipo_operacao_cfop.c.descricao).where(tipo_operacao_cfop.c.codigo == digito)
-        result = conn.execute(stmt).fetchone()
-        return result[0] if result else "Tipo de operação desconhecido"
+    return _tabelas_cfop()["tipo"].get(digito, "Tipo de operação desconhecido")
 
 def buscar_finalidade(digitos):
-    eng = _ensure_engine()
-    with eng.connect() as conn:
-        stmt = select(finalidade_cfop.c.descricao).where(finalidade_cfop.c.codigo == digitos)
-        result = conn.execute(stmt).fetchone()
-        return result[0] if result else "Finalidade desconhecida"
+    return _tabelas_cfop()["finalidade"].get(digitos, "Finalidade desconhecida")
+
+def _interpretar(cfop, tabelas):
+    if not isinstance(cfop, str) or len(cfop) != 4:
+        return "CFOP inválido"
+    origem = tabelas["origem"].get(cfop[0], "Origem desconhecida")
+    tipo = tabelas["tipo"].get(cfop[1], "Tipo de operação desconhecido")
+    finalidade = tabelas["finalidade"].get(cfop[2:], "Finalidade desconhecida")
+    return f"{origem} / {tipo} / {finalidade} ({cfop})"
 
 def interpretar_cfop_decomposto(cfop):
     if not cfop or len(cfop) != 4:
         return "CFOP inválido"
-    origem = buscar_origem_destino(cfop[0])
-    tipo = buscar_tipo_operacao(cfop[1])
-    finalidade = buscar_finalidade(cfop[2:])
-    return f"{origem} / {tipo} / {finalidade} ({cfop})"
+    return _interpretar(cfop, _tabelas_cfop())
+
+def interpretar_cfops(cfops):
+    """
+    Interpreta uma coleção de CFOPs sem consultas ao banco (além da carga do cache).
+
+    Cada CFOP distinto é decomposto uma vez. Recebendo uma pandas.Series, retorna uma
+    Series com o mesmo índice; para outros iteráveis, uma lista na mesma ordem.
+    """
+    tabelas = _tabelas_cfop()
+    if hasattr(cfops, "map") and hasattr(cfops, "unique"):
+        traducao = {cfop: _interpretar(cfop, tabelas) for cfop in cfops.unique()}
+        return cfops.map(traducao)
+    traducao = {}
+    resultado = []
+    for cfop in cfops:
+        if cfop not in traducao:
+            traducao[cfop] = _interpretar(cfop, tabelas)
+        resultado.append(traducao[cfop])
+    return resultado
 
 # 📋 Funções para emissor antigo
+# Os helpers abaixo aceitam conn opcional: passando a mesma conexão, uma unidade de
+# trabalho usa um único checkout do pool.
 
-def buscar_tipo_operacao_emissor(cnpj):
-    eng = _ensure_engine()
-    with eng.connect() as conn:
+def buscar_tipo_operacao_emissor(cnpj, conn=None):
+    with _conexao(conn) as conn:
         stmt = select(emissores_operacoes.c.tipo_operacao).where(emissores_operacoes.c.cnpj_emissor == cnpj)
         result = conn.execute(stmt).fetchone()
         if result:
             return result[0]
         return None
 
-def salvar_tipo_operacao_emissor(cnpj, tipo_operacao):
-    eng = _ensure_engine()
-    with eng.connect() as conn:
-        existe = buscar_tipo_operacao_emissor(cnpj)
+def salvar_tipo_operacao_emissor(cnpj, tipo_operacao, conn=None):
+    with _transacao(conn) as conn:
+        existe = buscar_tipo_operacao_emissor(cnpj, conn=conn)
         if existe:
             stmt = update(emissores_operacoes).where(emissores_operacoes.c.cnpj_emissor == cnpj).values(tipo_operacao=tipo_operacao)
         else:
             stmt = insert(emissores_operacoes).values(cnpj_emissor=cnpj, tipo_operacao=tipo_operacao)
         conn.execute(stmt)
-        conn.commit()
 
 # 📋 Novas funções para preferências por empresa e fornecedor
 
-def buscar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor):
-    eng = _ensure_engine()
-    with eng.connect() as conn:
-        # Cast empresa_id to string to match database column type
+def buscar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor, conn=None):
+    with _conexao(conn) as conn:
         stmt = select(preferencias_fornecedor_empresa).where(
-            (preferencias_fornecedor_empresa.c.empresa_id.cast(String) == str(empresa_id)) &
+            (preferencias_fornecedor_empresa.c.empresa_id == int(empresa_id)) &
             (preferencias_fornecedor_empresa.c.cnpj_fornecedor == cnpj_fornecedor)
         )
         result = conn.execute(stmt).fetchone()
@@ -186,14 +439,51 @@ def buscar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor):
             return dict(result._mapping)
         return None
 
-def salvar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor, tipo_operacao=None, cfop=None, debito=None, credito=None, historico=None, data_nota=None, complemento=None):
+# Tamanho máximo da lista do IN por consulta (lotes grandes são divididos)
+_LOTE_IN = 1000
+
+def consultas_preferencias(empresa_id, cnpjs_fornecedores):
+    """SELECTs (um por lote de até _LOTE_IN CNPJs distintos) das preferências da empresa."""
+    cnpjs = [c for c in dict.fromkeys(cnpjs_fornecedores) if c]
+    return [
+        select(preferencias_fornecedor_empresa).where(
+            (preferencias_fornecedor_empresa.c.empresa_id == int(empresa_id)) &
+            (preferencias_fornecedor_empresa.c.cnpj_fornecedor.in_(cnpjs[i:i + _LOTE_IN]))
+        )
+        for i in range(0, len(cnpjs), _LOTE_IN)
+    ]
+
+def agrupar_preferencias(rows, preferencias=None):
+    """Acumula as linhas em {cnpj_fornecedor: dict}; em duplicatas mantém a primeira, como a busca individual."""
+    preferencias = {} if preferencias is None else preferencias
+    for row in rows:
+        pref = dict(row._mapping)
+        preferencias.setdefault(pref["cnpj_fornecedor"], pref)
+    return preferencias
+
+def buscar_preferencias_empresa_fornecedores(empresa_id, cnpjs_fornecedores, conn=None):
+    """
+    Busca numa única consulta (por lote de até _LOTE_IN CNPJs) as preferências da
+    empresa para vários fornecedores. Retorna {cnpj_fornecedor: dict da preferência}
+    apenas para os CNPJs que possuem preferência salva.
+    """
+    preferencias = {}
+    consultas = consultas_preferencias(empresa_id, cnpjs_fornecedores)
+    if not consultas:
+        return preferencias
+    with _conexao(conn) as conn:
+        for stmt in consultas:
+            agrupar_preferencias(conn.execute(stmt), preferencias)
+    return preferencias
+
+def salvar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor, tipo_operacao=None, cfop=None, debito=None, credito=None, historico=None, data_nota=None, complemento=None, conn=None):
     print(f"Salvando preferência: empresa_id={empresa_id}, cnpj_fornecedor={cnpj_fornecedor}, tipo_operacao={tipo_operacao}, data_nota={data_nota}, complemento={complemento}")
-    eng = _ensure_engine()
-    with eng.connect() as conn:
-        pref = buscar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor)
+    with _transacao(conn) as conn:
+        # Busca na mesma conexão (antes abria uma segunda enquanto esta estava em uso)
+        pref = buscar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor, conn=conn)
         if pref:
             stmt = update(preferencias_fornecedor_empresa).where(
-                (preferencias_fornecedor_empresa.c.empresa_id.cast(String) == str(empresa_id)) &
+                (preferencias_fornecedor_empresa.c.empresa_id == int(empresa_id)) &
                 (preferencias_fornecedor_empresa.c.cnpj_fornecedor == cnpj_fornecedor)
             ).values(
                 tipo_operacao=tipo_operacao,
@@ -217,22 +507,159 @@ def salvar_preferencia_empresa_fornecedor(empresa_id, cnpj_fornecedor, tipo_oper
                 complemento=complemento
             )
         conn.execute(stmt)
-        conn.commit()
+
+# Campos gravados pelo upsert em lote (além de empresa_id/cnpj_fornecedor)
+_CAMPOS_PREFERENCIA = ["tipo_operacao", "cfop", "debito", "credito", "historico", "data_nota", "complemento"]
+# Parâmetros por INSERT: abaixo do limite do PostgreSQL (65535) e do SQLite antigo (999)
+_PARAMETROS_UPSERT = {"postgresql": 45000, "sqlite": 900}
+
+def upsert(conn, tabela, linhas, index_elements, campos):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO UPDATE SET campos, no dialeto da conexão
+    (PostgreSQL ou SQLite), em lotes que respeitam o limite de parâmetros do banco.
+    """
+    if not linhas:
+        return
+    dialeto = conn.dialect.name
+    if dialeto == "postgresql":
+        construtor = pg_insert
+    elif dialeto == "sqlite":
+        construtor = sqlite_insert
+    else:
+        raise RuntimeError(f"Upsert não suportado no dialeto {dialeto!r}")
+    por_lote = max(1, _PARAMETROS_UPSERT[dialeto] // len(linhas[0]))
+    for i in range(0, len(linhas), por_lote):
+        stmt = construtor(tabela).values(linhas[i:i + por_lote])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tabela.c[c] for c in index_elements],
+            set_={campo: stmt.excluded[campo] for campo in campos},
+        )
+        conn.execute(stmt)
+
+def salvar_preferencias_em_lote(empresa_id, preferencias, conn=None):
+    """
+    Grava várias preferências da empresa com INSERT ... ON CONFLICT (empresa_id,
+    cnpj_fornecedor) DO UPDATE, numa única transação.
+
+    preferencias: iterável de dicts com "cnpj_fornecedor" e os campos de
+    _CAMPOS_PREFERENCIA (ausentes gravam NULL). Quando o mesmo fornecedor aparece
+    mais de uma vez, vale o último. Retorna o número de linhas gravadas.
+    """
+    por_fornecedor = {}
+    for pref in preferencias:
+        cnpj = pref.get("cnpj_fornecedor")
+        if not cnpj:
+            continue
+        # pop + reinserção: a ordem final segue a última ocorrência de cada fornecedor
+        por_fornecedor.pop(cnpj, None)
+        por_fornecedor[cnpj] = {
+            "empresa_id": empresa_id,
+            "cnpj_fornecedor": cnpj,
+            **{campo: pref.get(campo) for campo in _CAMPOS_PREFERENCIA},
+        }
+    linhas = list(por_fornecedor.values())
+    if not linhas:
+        return 0
+    with _transacao(conn) as conn:
+        upsert(conn, preferencias_fornecedor_empresa, linhas, ["empresa_id", "cnpj_fornecedor"], _CAMPOS_PREFERENCIA)
+    return len(linhas)
 
 # 📚 Catálogo de CFOPs
-def listar_cfops():
+
+# Catálogo inicial gravado por semear_cfop_catalog quando a tabela está vazia
+CFOPS_PADRAO = [
+    {"codigo":"1102","categoria":"Consumo","nome":"Dentro do Estado"},
+    {"codigo":"2102","categoria":"Consumo","nome":"Fora do Estado"},
+    {"codigo":"1556","categoria":"Revenda","nome":"Dentro do Estado"},
+    {"codigo":"2556","categoria":"Revenda","nome":"Fora do Estado"},
+    {"codigo":"1126","categoria":"Ativo Imobilizado","nome":"Dentro do Estado"},
+    {"codigo":"2126","categoria":"Ativo Imobilizado","nome":"Fora do Estado"},
+    {"codigo":"1551","categoria":"Serviço","nome":"Dentro do Estado"},
+    {"codigo":"2551","categoria":"Serviço","nome":"Fora do Estado"},
+    {"codigo":"1405","categoria":"Tributos","nome":"Estaduais e Municipais"},
+    {"codigo":"1403","categoria":"Revenda","nome":"Substituição tributária"},
+    {"codigo":"1910","categoria":"Bonificação/Brinde","nome":"Doação ou brinde"},
+    {"codigo":"2403","categoria":"Revenda","nome":"Para fora do Estado"},
+    {"codigo":"2910","categoria":"Bonificação/Brinde","nome":"Outros Estados"},
+    {"codigo":"5152","categoria":"Transferência","nome":"Dentro do Estado"},
+    {"codigo":"6152","categoria":"Transferência","nome":"Fora do Estado"},
+    {"codigo":"5910","categoria":"Bonificação/Brinde","nome":"Dentro do Estado"},
+    {"codigo":"6910","categoria":"Bonificação/Brinde","nome":"Fora do Estado"},
+    {"codigo":"5915","categoria":"Doação","nome":"Dentro do Estado"},
+    {"codigo":"6915","categoria":"Doação","nome":"Fora do Estado"},
+    {"codigo":"5920","categoria":"Demonstração","nome":"Dentro do Estado"},
+    {"codigo":"6920","categoria":"Demonstração","nome":"Fora do Estado"},
+    {"codigo":"5931","categoria":"Conserto","nome":"Remessa – Dentro do Estado"},
+    {"codigo":"6931","categoria":"Conserto","nome":"Remessa – Fora do Estado"},
+    {"codigo":"5932","categoria":"Conserto","nome":"Retorno – Dentro do Estado"},
+    {"codigo":"6932","categoria":"Conserto","nome":"Retorno – Fora do Estado"},
+    {"codigo":"5949","categoria":"Industrialização","nome":"Remessa – Dentro do Estado"},
+    {"codigo":"6949","categoria":"Industrialização","nome":"Remessa – Fora do Estado"},
+    {"codigo":"5951","categoria":"Industrialização","nome":"Retorno – Dentro do Estado"},
+    {"codigo":"6951","categoria":"Industrialização","nome":"Retorno – Fora do Estado"},
+]
+
+# Catálogo em cache no processo, compartilhado por todas as sessões do Streamlit. Cada
+# escrita por adicionar_ou_atualizar_cfop atualiza o cache (write-through) e incrementa a
+# versão; a releitura do banco acontece após CFOP_CACHE_TTL segundos (alterações feitas por
+# outros processos) ou por invalidar_cache_catalogo().
+_cache_catalogo = {"versao": 0, "linhas": None, "codigos": None, "carregado_em": 0.0}
+_cache_catalogo_lock = threading.Lock()
+
+def _ordenar_codigos(linhas):
+    # Ordena por código numérico quando possível
+    return sorted({r.get("codigo") for r in linhas if r.get("codigo")}, key=lambda x: (len(x), x))
+
+def _catalogo(conn=None):
+    """Linhas do catálogo em cache (relidas do banco quando ausentes ou expiradas). Requer o lock."""
+    expirado = time.monotonic() - _cache_catalogo["carregado_em"] > CFOP_CACHE_TTL
+    if _cache_catalogo["linhas"] is None or expirado:
+        with _conexao(conn) as conn:
+            rows = conn.execute(select(cfop_catalog)).fetchall()
+        linhas = [dict(r._mapping) for r in rows]
+        if linhas != _cache_catalogo["linhas"]:
+            _cache_catalogo["versao"] += 1
+        _cache_catalogo["linhas"] = linhas
+        _cache_catalogo["codigos"] = _ordenar_codigos(linhas)
+        _cache_catalogo["carregado_em"] = time.monotonic()
+    return _cache_catalogo
+
+def listar_cfops(conn=None):
     """Retorna lista de dicionários com os CFOPs cadastrados."""
-    eng = _ensure_engine()
-    with eng.connect() as conn:
-        rows = conn.execute(select(cfop_catalog)).fetchall()
-        return [dict(r._mapping) for r in rows]
+    with _cache_catalogo_lock:
+        return [dict(linha) for linha in _catalogo(conn)["linhas"]]
+
+def codigos_cfop(conn=None):
+    """Códigos do catálogo, ordenados (por tamanho e depois lexicograficamente)."""
+    with _cache_catalogo_lock:
+        return list(_catalogo(conn)["codigos"])
+
+def versao_catalogo_cfop():
+    """Versão do catálogo em cache: muda a cada alteração, para quem deriva dados dele."""
+    with _cache_catalogo_lock:
+        return _cache_catalogo["versao"]
 
-def adicionar_ou_atualizar_cfop(codigo, categoria=None, nome=None, descricao=None):
+def invalidar_cache_catalogo():
+    """Descarta o catálogo em cache (a próxima leitura relê do banco)."""
+    with _cache_catalogo_lock:
+        _cache_catalogo["linhas"] = None
+
+def _atualizar_cache_catalogo(linha):
+    with _cache_catalogo_lock:
+        if _cache_catalogo["linhas"] is None:
+            return
+        linhas = [l for l in _cache_catalogo["linhas"] if l.get("codigo") != linha["codigo"]]
+        linhas.append(linha)
+        _cache_catalogo["linhas"] = linhas
+        _cache_catalogo["codigos"] = _ordenar_codigos(linhas)
+        _cache_catalogo["versao"] += 1
+
+def adicionar_ou_atualizar_cfop(codigo, categoria=None, nome=None, descricao=None, conn=None):
     """Adiciona um CFOP ao catálogo ou atualiza seus campos se já existir."""
     if not codigo:
         raise ValueError("Código CFOP é obrigatório")
-    eng = _ensure_engine()
-    with eng.connect() as conn:
+    conn_externa = conn is not None
+    with _transacao(conn) as conn:
         existente = conn.execute(select(cfop_catalog).where(cfop_catalog.c.codigo == codigo)).fetchone()
         if existente:
             stmt = (
@@ -243,4 +670,24 @@ def adicionar_ou_atualizar_cfop(codigo, categoria=None, nome=None, descricao=Non
         else:
             stmt = insert(cfop_catalog).values(codigo=codigo, categoria=categoria, nome=nome, descricao=descricao)
         conn.execute(stmt)
-        conn.commit()
+        linha = dict(conn.execute(select(cfop_catalog).where(cfop_catalog.c.codigo == codigo)).fetchone()._mapping)
+    if conn_externa:
+        # O commit é de quem passou a conexão: relê do banco na próxima consulta
+        invalidar_cache_catalogo()
+        with _cache_catalogo_lock:
+            _cache_catalogo["versao"] += 1
+    else:
+        _atualizar_cache_catalogo(linha)
+
+def semear_cfop_catalog(conn=None):
+    """Grava CFOPS_PADRAO se o catálogo estiver vazio (bootstrap; fora do caminho das requisições)."""
+    with _transacao(conn) as conn:
+        if conn.execute(select(cfop_catalog.c.id).limit(1)).first() is not None:
+            return 0
+        conn.execute(insert(cfop_catalog), [{"descricao": None, **d} for d in CFOPS_PADRAO])
+    invalidar_cache_catalogo()
+    return len(CFOPS_PADRAO)
+
+if __name__ == "__main__":
+    inicializar_schema()
+    print("Tabelas criadas/verificadas e catálogo de CFOPs semeado (se vazio).")
@@ -0,0 +1,137 @@
+"""
+Acesso assíncrono ao banco para as consultas independentes feitas após o upload.
+
+As preferências dos fornecedores, a empresa selecionada e o catálogo de CFOPs não
+dependem umas das outras: carregar_contexto_async as dispara juntas (asyncio.gather),
+então o tempo total fica próximo ao da consulta mais lenta em vez da soma das três.
+
+No PostgreSQL, com SQLAlchemy async + asyncpg (e greenlet) instalados, as preferências
+são buscadas por um engine assíncrono próprio; sem esses pacotes ou no backend SQLite,
+cada consulta roda num thread com o helper síncrono de src/db.py (que já tem pool e
+cache), mantendo a concorrência. A empresa e o catálogo sempre passam pelos helpers
+síncronos, para compartilhar o cache do processo.
+
+Quem não usa asyncio (o app Streamlit, a CLI) chama a fachada síncrona
+carregar_contexto(), que executa as corrotinas num event loop dedicado do processo; o
+loop é único para que as conexões do pool assíncrono continuem válidas entre chamadas.
+"""
+import asyncio
+import threading
+
+from src import db
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import asyncpg  # noqa: F401  (driver usado pelo create_async_engine)
+    import greenlet  # noqa: F401  (exigido pelo SQLAlchemy async)
+
+    ASYNC_DISPONIVEL = True
+except ImportError:
+    ASYNC_DISPONIVEL = False
+
+_engine_async = None
+_loop = None
+_lock = threading.Lock()
+
+
+def _criar_engine_async():
+    connect_args = {"timeout": max(1.0, db.DB_CONNECT_TIMEOUT)}
+    if db.PG_SSLMODE and db.PG_SSLMODE != "disable":
+        connect_args["ssl"] = db.PG_SSLMODE
+    if db.DB_PGBOUNCER:
+        from sqlalchemy.pool import NullPool
+
+        # PgBouncer em modo transação não suporta prepared statements nem parâmetros de sessão
+        connect_args["statement_cache_size"] = 0
+        return create_async_engine(
+            f"postgresql+asyncpg://{db.DB_USER}:{db.DB_PASS}@{db.DB_HOST}:{db.DB_PORT}/{db.DB_NAME}"
+            "?prepared_statement_cache_size=0",
+            connect_args=connect_args,
+            poolclass=NullPool,
+        )
+    if db.DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {"statement_timeout": str(db.DB_STATEMENT_TIMEOUT_MS)}
+    return create_async_engine(
+        f"postgresql+asyncpg://{db.DB_USER}:{db.DB_PASS}@{db.DB_HOST}:{db.DB_PORT}/{db.DB_NAME}",
+        connect_args=connect_args,
+        pool_size=db.DB_POOL_SIZE,
+        max_overflow=db.DB_MAX_OVERFLOW,
+        pool_timeout=db.DB_POOL_TIMEOUT,
+        pool_recycle=db.DB_POOL_RECYCLE,
+        pool_pre_ping=db.DB_POOL_PRE_PING,
+    )
+
+
+def _engine_assincrono():
+    """Engine assíncrono (criado no primeiro uso) ou None quando indisponível para o backend."""
+    global _engine_async
+    if not ASYNC_DISPONIVEL or db.DB_BACKEND != "postgres" or not (db.DB_HOST and db.DB_PASS):
+        return None
+    with _lock:
+        if _engine_async is None:
+            _engine_async = _criar_engine_async()
+    return _engine_async
+
+
+async def buscar_preferencias_empresa_fornecedores_async(empresa_id, cnpjs_fornecedores):
+    """Versão assíncrona de db.buscar_preferencias_empresa_fornecedores (mesmo retorno)."""
+    eng = _engine_assincrono()
+    if eng is None:
+        return await asyncio.to_thread(db.buscar_preferencias_empresa_fornecedores, empresa_id, cnpjs_fornecedores)
+    preferencias = {}
+    consultas = db.consultas_preferencias(empresa_id, cnpjs_fornecedores)
+    if not consultas:
+        return preferencias
+    async with eng.connect() as conn:
+        for stmt in consultas:
+            db.agrupar_preferencias(await conn.execute(stmt), preferencias)
+    return preferencias
+
+
+async def obter_empresa_async(empresa_id):
+    return await asyncio.to_thread(db.obter_empresa, empresa_id)
+
+
+async def codigos_cfop_async():
+    return await asyncio.to_thread(db.codigos_cfop)
+
+
+async def carregar_contexto_async(empresa_id, cnpjs_fornecedores):
+    """
+    Busca concorrentemente preferências, empresa e códigos do catálogo.
+
+    Retorna {"preferencias": {...}, "empresa": dict|None, "codigos_cfop": [...]}. Falhas
+    na empresa ou no catálogo viram None/[] (com aviso); falha nas preferências é propagada.
+    """
+    preferencias, empresa, codigos = await asyncio.gather(
+        buscar_preferencias_empresa_fornecedores_async(empresa_id, cnpjs_fornecedores),
+        obter_empresa_async(empresa_id),
+        codigos_cfop_async(),
+        return_exceptions=True,
+    )
+    if isinstance(preferencias, BaseException):
+        raise preferencias
+    if isinstance(empresa, BaseException):
+        print(f"Warning: não foi possível ler a empresa {empresa_id}: {empresa}")
+        empresa = None
+    if isinstance(codigos, BaseException):
+        print(f"Warning: não foi possível ler o catálogo de CFOPs: {codigos}")
+        codigos = []
+    return {"preferencias": preferencias, "empresa": empresa, "codigos_cfop": codigos}
+
+
+def _loop_dedicado():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="db-async", daemon=True).start()
+    return _loop
+
+
+def carregar_contexto(empresa_id, cnpjs_fornecedores):
+    """Fachada síncrona de carregar_contexto_async."""
+    futuro = asyncio.run_coroutine_threadsafe(
+        carregar_contexto_async(empresa_id, list(cnpjs_fornecedores)), _loop_dedicado()
+    )
+    return futuro.result()
@@ -0,0 +1,82 @@
+import io
+
+from lxml import etree
+import pandas as pd
+
+from src.arquivos import expandir_arquivos
+from src.xml_reader import NFE_NAMESPACE, extrair_dados_xmls
+from src.nfse_reader import extrair_dados_nfses_xmls
+
+TIPO_NFE = "NFe"
+TIPO_NFSE = "NFSe"
+
+# Raízes de NF-e quando o arquivo não declara o namespace do portal fiscal
+_RAIZES_NFE = {"nfeProc", "NFe", "enviNFe"}
+
+
+def detectar_tipo_documento(conteudo):
+    """
+    Identifica o tipo do XML lendo apenas o elemento raiz (sem montar a árvore).
+
+    NF-e: namespace do portal fiscal ou raiz nfeProc/NFe. Todo o resto (CompNfse,
+    ConsultarNfseResponse, ListaNfse, ...) segue para o leitor de NFS-e, que ignora
+    arquivos sem InfNfse; XMLs malformados também vão para ele e são reportados lá.
+    """
+    try:
+        for _, el in etree.iterparse(io.BytesIO(conteudo), events=("start",)):
+            nome = etree.QName(el)
+            if nome.namespace == NFE_NAMESPACE or nome.localname in _RAIZES_NFE:
+                return TIPO_NFE
+            return TIPO_NFSE
+    except etree.XMLSyntaxError:
+        pass
+    return TIPO_NFSE
+
+
+def extrair_dados_fiscais(arquivos_xml, progress_callback=None, streaming=False, paralelo=False, max_workers=None,
+                          cache=None):
+    """
+    Lê cada arquivo uma vez, detecta o tipo pela raiz e envia ao extrator correspondente.
+
+    ZIP/TAR (inclusive .tar.gz e ZIPs aninhados) são expandidos antes, em memória, e
+    cada XML contido entra no lote como um arquivo enviado (ver expandir_arquivos).
+
+    Retorna o resultado combinado:
+      - df: registros de NF-e seguidos dos de NFS-e (mesmas colunas de cada leitor)
+      - arquivos_dict: nome_arquivo -> bytes de todos os arquivos lidos com sucesso
+      - itens_por_chave: itens das NF-e (ver extrair_dados_xmls)
+
+    progress_callback(idx, total, nome) é chamado com a contagem global de arquivos.
+    """
+    arquivos = expandir_arquivos(arquivos_xml)
+    nfes, nfses = [], []
+    for arquivo in arquivos:
+        (nfes if detectar_tipo_documento(arquivo[1]) == TIPO_NFE else nfses).append(arquivo)
+
+    total = len(arquivos)
+
+    def _progresso(deslocamento):
+        if not callable(progress_callback):
+            return None
+        return lambda idx, _total, nome=None: progress_callback(deslocamento + idx, total, nome)
+
+    df_nfe, arquivos_nfe, itens_por_chave = extrair_dados_xmls(
+        nfes,
+        progress_callback=_progresso(0),
+        streaming=streaming,
+        paralelo=paralelo,
+        max_workers=max_workers,
+        cache=cache,
+    )
+    df_nfse, arquivos_nfse = extrair_dados_nfses_xmls(
+        nfses,
+        progress_callback=_progresso(len(nfes)),
+        paralelo=paralelo,
+        max_workers=max_workers,
+        cache=cache,
+    )
+
+    partes = [df for df in (df_nfe, df_nfse) if not df.empty]
+    df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    arquivos_dict = {**arquivos_nfe, **arquivos_nfse}
+    return df, arquivos_dict, itens_por_chave
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from src.preferencias import COLUNAS_PREFERENCIA
+
+# Colunas de df_geral editáveis na tabela de notas (as mesmas preenchidas pelas preferências)
+COLUNAS_EDITAVEIS = COLUNAS_PREFERENCIA
+
+
+def aplicar_edicoes(df_geral, edited_df, colunas=COLUNAS_EDITAVEIS, indice_busca=None):
+    """
+    Grava em df_geral (in-place) as edições feitas no st.data_editor, por chave.
+
+    Em vez de atribuir todas as colunas de todas as linhas exibidas, compara os valores
+    do editor com os atuais (alinhados pela chave) e escreve apenas as células que
+    mudaram, uma atribuição vetorizada por coluna. Se a mesma chave aparece em várias
+    linhas de df_geral, todas recebem o valor; em chaves repetidas no editor vale a
+    última linha. Com indice_busca (src/busca.py), as células alteradas também são
+    reindexadas. Retorna o número de células alteradas.
+    """
+    if df_geral is None or df_geral.empty or edited_df is None or edited_df.empty:
+        return 0
+    colunas = [c for c in colunas if c in edited_df.columns and c in df_geral.columns]
+    if not colunas:
+        return 0
+
+    novos = edited_df.drop_duplicates("chave", keep="last").set_index("chave")[colunas]
+    alvo = df_geral["chave"].isin(novos.index).to_numpy()
+    if not alvo.any():
+        return 0
+    indice_alvo = df_geral.index[alvo]
+    # Valores do editor na ordem das linhas de df_geral afetadas
+    novos = novos.reindex(df_geral.loc[indice_alvo, "chave"].to_numpy())
+
+    alteradas = 0
+    for col in colunas:
+        atual = df_geral.loc[indice_alvo, col].to_numpy(dtype=object)
+        novo = novos[col].to_numpy(dtype=object)
+        # NaN/None dos dois lados não conta como mudança
+        diferente = ~((atual == novo) | (pd.isna(atual) & pd.isna(novo)))
+        if diferente.any():
+            df_geral.loc[indice_alvo[diferente], col] = novo[diferente]
+            if indice_busca is not None:
+                indice_busca.atualizar(df_geral, indice_alvo[diferente], [col])
+            alteradas += int(np.count_nonzero(diferente))
+    return alteradas
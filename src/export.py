@@ -0,0 +1,198 @@
+import io
+import zipfile
+from datetime import datetime
+
+from lxml import etree
+import pandas as pd
+
+from src.xml_reader import NFE_NAMESPACE
+
+_NS = "{%s}" % NFE_NAMESPACE
+
+# CFOPs de nota que autorizam a reescrita do XML quando não há CFOP por item
+ALLOWED_CFOPS = {"1102", "2102", "1910", "2910", "1403", "2403", "1405", "1911"}
+
+CSV_HEADERS = ["DEBITO", "CREDITO", "HISTORICO", "DATA", "VALOR", "COMPLEMENTO"]
+
+
+def _conteudo_da_chave(arquivos_dict, chave):
+    return arquivos_dict.get(chave) or arquivos_dict.get(f"{chave}.xml")
+
+
+def reescrever_xml(conteudo_xml, itens_map, nota_cfop):
+    """
+    Aplica CFOP por item (prioridade) ou da nota e limpa PIS/COFINS conforme padrão do editor.
+
+    Retorna os bytes do XML alterado, ou None quando não há CFOP por item nem CFOP de
+    nota permitido.
+    """
+    # Parse direto do buffer compartilhado em arquivos_dict (sem cópia)
+    root = etree.fromstring(conteudo_xml)
+    tree = root.getroottree()
+
+    # Se houver CFOP por item, aplica por det; caso contrário, aplica CFOP da nota
+    if any(v for v in itens_map.values()):
+        for det in root.findall(f".//{_NS}det"):
+            nItem_attr = det.get("nItem", "")
+            prod = det.find(f"{_NS}prod")
+            if prod is None:
+                continue
+            alvo_cfop = itens_map.get(nItem_attr) or (nota_cfop if nota_cfop in ALLOWED_CFOPS else None)
+            if not alvo_cfop:
+                continue
+            cfop_elem = prod.find(f"{_NS}CFOP")
+            if cfop_elem is None:
+                cfop_elem = etree.SubElement(prod, f"{_NS}CFOP")
+            cfop_elem.text = alvo_cfop
+    else:
+        if nota_cfop in ALLOWED_CFOPS:
+            for cfop in root.findall(f".//{_NS}CFOP"):
+                cfop.text = nota_cfop
+        else:
+            # Nem CFOP por item, nem CFOP de nota permitido
+            return None
+
+    # Limpa PIS/COFINS conforme padrão do editor
+    for pis in root.findall(f".//{_NS}PIS"):
+        for child in list(pis):
+            pis.remove(child)
+        pis_aliq = etree.SubElement(pis, f"{_NS}PISAliq")
+        etree.SubElement(pis_aliq, f"{_NS}CST").text = ""
+        etree.SubElement(pis_aliq, f"{_NS}vBC").text = ""
+        etree.SubElement(pis_aliq, f"{_NS}pPIS").text = ""
+        etree.SubElement(pis_aliq, f"{_NS}vPIS").text = ""
+
+    for cofins in root.findall(f".//{_NS}COFINS"):
+        for child in list(cofins):
+            cofins.remove(child)
+        cofins_aliq = etree.SubElement(cofins, f"{_NS}COFINSAliq")
+        etree.SubElement(cofins_aliq, f"{_NS}CST").text = ""
+        etree.SubElement(cofins_aliq, f"{_NS}vBC").text = ""
+        etree.SubElement(cofins_aliq, f"{_NS}pCOFINS").text = ""
+        etree.SubElement(cofins_aliq, f"{_NS}vCOFINS").text = ""
+
+    buffer = io.BytesIO()
+    tree.write(buffer, encoding="utf-8", xml_declaration=True, pretty_print=False)
+    return buffer.getvalue()
+
+
+def gerar_zip_xmls_alterados(df_geral, arquivos_dict, item_cfops):
+    """
+    Gera o ZIP com os XMLs alterados: aplica CFOP por item quando definido; caso contrário, aplica CFOP da nota.
+
+    item_cfops: {chave: {nItem: cfop}}. Retorna BytesIO posicionado no início, ou None
+    se nenhuma nota for elegível.
+    """
+    # Decide quais notas processar: notas com CFOP permitido no nível da nota
+    # ou notas que tenham pelo menos um item com CFOP definido
+    chaves_cfop_permitido = set(df_geral[df_geral["tipo_operacao"].isin(ALLOWED_CFOPS)]["chave"].tolist())
+    chaves_com_itens_editados = set()
+    for chave, itens_map in item_cfops.items():
+        if any(v for v in itens_map.values()):
+            chaves_com_itens_editados.add(chave)
+
+    chaves_por_processar = chaves_cfop_permitido.union(chaves_com_itens_editados)
+    if not chaves_por_processar:
+        return None
+
+    # CFOP de nota por chave (primeira ocorrência), sem filtrar o DataFrame a cada nota
+    cfop_por_chave = df_geral.drop_duplicates("chave").set_index("chave")["tipo_operacao"].to_dict()
+
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as zipf:
+        for chave in chaves_por_processar:
+            conteudo_xml = _conteudo_da_chave(arquivos_dict, chave)
+            if not conteudo_xml:
+                continue
+            try:
+                # Mapeamentos de CFOP por item
+                itens_map = item_cfops.get(chave, {})
+                nota_cfop = cfop_por_chave.get(chave, "")
+                alterado = reescrever_xml(conteudo_xml, itens_map, nota_cfop)
+                if alterado is None:
+                    continue
+                nome_arquivo = chave if str(chave).endswith(".xml") else f"{chave}.xml"
+                zipf.writestr(nome_arquivo, alterado)
+            except Exception as e:
+                print(f"Erro ao processar {chave}: {e}")
+                continue
+
+    zip_buffer.seek(0)
+    return zip_buffer
+
+
+def gerar_zip_xmls_originais(df_geral, arquivos_dict):
+    """Gera o ZIP com os XMLs originais das notas de df_geral (BytesIO), ou None se não houver nenhum."""
+    arquivos_filtrados = {}
+    for chave in df_geral["chave"]:
+        conteudo_xml = _conteudo_da_chave(arquivos_dict, chave)
+        if conteudo_xml:
+            arquivos_filtrados[f"{chave}.xml"] = conteudo_xml
+
+    if not arquivos_filtrados:
+        return None
+
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as zipf:
+        for nome_arquivo, conteudo in arquivos_filtrados.items():
+            try:
+                zipf.writestr(nome_arquivo, conteudo)
+            except Exception as e:
+                print(f"Erro ao adicionar {nome_arquivo} ao ZIP: {e}")
+                continue
+    zip_buffer.seek(0)
+    return zip_buffer
+
+
+def _format_date(date_str):
+    try:
+        dt = pd.to_datetime(date_str, errors='coerce')
+        if pd.isna(dt):
+            return ""
+        return dt.strftime("%d/%m/%Y")
+    except Exception:
+        return ""
+
+
+def _format_complemento(row):
+    # COMPLEMENTO: concatenar "CNPJ - FORNECEDOR - NUMERO_NOTA" como string única
+    cnpj = row.get("cnpj_emissor", "")
+    fornecedor = row.get("fornecedor", "")
+    numero_nota = row.get("nNF", "") or row.get("nnotafiscal", "")
+    parts = [cnpj, fornecedor, numero_nota]
+    return " - ".join([p for p in parts if isinstance(p, str) and p])
+
+
+def gerar_df_csv(df_geral):
+    """Monta o DataFrame do CSV contábil (DEBITO; CREDITO; HISTORICO; DATA; VALOR; COMPLEMENTO)."""
+    df = df_geral.copy()
+
+    # Filtrar colunas necessárias e renomear para os cabeçalhos
+    df_csv = df[["debito", "credito", "historico", "data_nota", "valor_total"]].copy()
+    df_csv.columns = CSV_HEADERS[:-1]  # Exclui COMPLEMENTO para renomear
+
+    # DATA: formatar para DD/MM/AAAA
+    df_csv["DATA"] = df_csv["DATA"].apply(_format_date)
+
+    # VALOR: numérico com 2 casas decimais e separador decimal vírgula
+    df_csv["VALOR"] = df_csv["VALOR"].apply(lambda x: f"{float(x):.2f}".replace(".", ",") if pd.notnull(x) else "0,00")
+
+    # DEBITO, CREDITO, HISTORICO: manter como string sem preenchimento de zeros
+    df_csv["DEBITO"] = df_csv["DEBITO"].astype(str)
+    df_csv["CREDITO"] = df_csv["CREDITO"].astype(str)
+    df_csv["HISTORICO"] = df_csv["HISTORICO"].astype(str)
+
+    df_csv["COMPLEMENTO"] = df.apply(_format_complemento, axis=1) if not df.empty else pd.Series(dtype=str)
+    return df_csv
+
+
+def gerar_csv_contabil(df_geral):
+    """Retorna o texto do CSV contábil, separado por ';'."""
+    return gerar_df_csv(df_geral).to_csv(index=False, sep=";")
+
+
+def nome_arquivo_csv(nome_fantasia, agora=None):
+    """Nome do CSV: "YYYY/MM" + "_" + Nome Fantasia + ".csv"."""
+    agora = agora or datetime.now()
+    prefix = agora.strftime("%Y/%m")
+    return f"{prefix}_{nome_fantasia}.csv"
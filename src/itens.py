@@ -0,0 +1,282 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Colunas de texto copiadas dos itens extraídos (ver extrair_dados_xmls)
+_COLUNAS_TEXTO = ["nItem", "cProd", "xProd"]
+# Colunas numéricas (vêm como texto no XML)
+_COLUNAS_NUMERICAS = ["qCom", "vProd"]
+
+# Quantas aplicações de CFOP em lote podem ser desfeitas (as mais antigas são descartadas)
+try:
+    ITENS_UNDO_MAX = int(os.getenv("ITENS_UNDO_MAX") or 20)
+except ValueError:
+    ITENS_UNDO_MAX = 20
+
+
+class TabelaItens:
+    """
+    Itens (det) de todas as NF-e em formato colunar, substituindo itens_por_chave.
+
+    Uma linha por item, agrupada por nota: chave (categórica), nItem, cProd, xProd,
+    qCom/vProd numéricos, cfop do XML (categórica) e cfop_editado (categórica; NaN
+    quando o usuário não definiu CFOP para o item). Como os itens de uma nota são
+    contíguos, um índice de offsets chave -> (início, fim) dá acesso O(1) aos itens
+    de cada nota, e operações em lote trabalham com arrays de posições.
+    """
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self._col_editado = self.df.columns.get_loc("cfop_editado")
+        self._offsets = self._calcular_offsets()
+        # Incrementada a cada alteração de CFOP: permite à interface saber quando o que
+        # exibiu ficou desatualizado
+        self.versao = 0
+
+    @classmethod
+    def vazia(cls):
+        return cls.de_itens_por_chave({})
+
+    @classmethod
+    def de_itens_por_chave(cls, itens_por_chave):
+        """Constrói a tabela a partir do mapeamento chave -> lista de itens retornado pelos leitores."""
+        chaves = []
+        colunas = {c: [] for c in _COLUNAS_TEXTO + _COLUNAS_NUMERICAS + ["cfop"]}
+        for chave, itens in itens_por_chave.items():
+            chaves.extend([chave] * len(itens))
+            for item in itens:
+                for c, valores in colunas.items():
+                    valores.append(item.get(c, ""))
+
+        df = pd.DataFrame({"chave": pd.Categorical(chaves)})
+        for c in _COLUNAS_TEXTO:
+            df[c] = pd.Series(colunas[c], dtype=object).astype(str)
+        for c in _COLUNAS_NUMERICAS:
+            df[c] = pd.to_numeric(pd.Series(colunas[c], dtype=object), errors="coerce")
+        # CFOP vazio no XML conta como ausente (cai para o CFOP da nota)
+        df["cfop"] = pd.Categorical([v or np.nan for v in colunas["cfop"]])
+        df["cfop_editado"] = pd.Categorical([np.nan] * len(df), categories=df["cfop"].cat.categories)
+        return cls(df)
+
+    def _calcular_offsets(self):
+        if self.df.empty:
+            return {}
+        chaves = self.df["chave"].astype(object).to_numpy()
+        inicios = np.flatnonzero(np.r_[True, chaves[1:] != chaves[:-1]])
+        fins = np.r_[inicios[1:], len(chaves)]
+        return {chaves[i]: (int(i), int(f)) for i, f in zip(inicios, fins)}
+
+    def __len__(self):
+        return len(self.df)
+
+    def __contains__(self, chave):
+        return chave in self._offsets
+
+    def posicoes_das_notas(self, chaves):
+        """Posições (na ordem das chaves informadas) de todos os itens das notas."""
+        faixas = [np.arange(*self._offsets[c]) for c in chaves if c in self._offsets]
+        return np.concatenate(faixas) if faixas else np.empty(0, dtype=np.int64)
+
+    def cfop_atual(self, posicoes, cfop_nota_por_chave):
+        """
+        CFOP vigente dos itens: editado pelo usuário, senão o do XML, senão o CFOP da nota.
+
+        cfop_nota_por_chave: mapeamento chave -> tipo_operacao da nota.
+        """
+        sub = self.df.iloc[posicoes]
+        atual = sub["cfop_editado"].astype(object)
+        atual = atual.where(atual.notna(), sub["cfop"].astype(object))
+        nota = sub["chave"].astype(object).map(cfop_nota_por_chave)
+        atual = atual.where(atual.notna(), nota)
+        return atual.where(atual.notna(), "").astype(str)
+
+    def _garantir_categorias(self, valores):
+        col = self.df["cfop_editado"]
+        novas = [v for v in pd.unique(pd.Series(valores, dtype=object).dropna()) if v not in col.cat.categories]
+        if novas:
+            self.df["cfop_editado"] = col.cat.add_categories(novas)
+
+    def atribuir_cfop(self, posicoes, cfop):
+        """
+        Define o mesmo CFOP para os itens nas posições informadas (operação vetorizada).
+
+        cfop vazio/None limpa a edição. Retorna o array com os valores anteriores de
+        cfop_editado (NaN quando não havia edição), para permitir desfazer.
+        """
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        atuais = self.df["cfop_editado"].iloc[posicoes]
+        antigos = atuais.astype(object).to_numpy()
+        valor = cfop if cfop else np.nan
+        # Sem alteração real, a versão não muda (a interface não precisa se refazer)
+        mudou = atuais.notna().any() if pd.isna(valor) else (atuais.astype(object) != valor).any()
+        if mudou:
+            self._garantir_categorias([valor])
+            self.df.iloc[posicoes, self._col_editado] = valor
+            self.versao += 1
+        return antigos
+
+    def restaurar(self, posicoes, valores):
+        """Grava valores (um por posição, NaN = sem edição) em cfop_editado."""
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        valores = pd.Series(valores, dtype=object).replace("", np.nan)
+        self._garantir_categorias(valores)
+        self.df.iloc[posicoes, self._col_editado] = valores.to_numpy()
+        self.versao += 1
+
+    def cfops_editados(self):
+        """Mapeamento {chave: {nItem: cfop}} apenas dos itens com CFOP editado (formato usado na exportação)."""
+        editados = self.df[self.df["cfop_editado"].notna()]
+        resultado = {}
+        for chave, nItem, cfop in zip(
+            editados["chave"].astype(object), editados["nItem"], editados["cfop_editado"].astype(object)
+        ):
+            resultado.setdefault(chave, {})[nItem] = cfop
+        return resultado
+
+
+def _rle(valores):
+    """Run-length de um array 1-D: (valores, repetições)."""
+    if len(valores) == 0:
+        return valores[:0], np.zeros(0, dtype=np.int64)
+    inicios = np.flatnonzero(np.r_[True, valores[1:] != valores[:-1]])
+    return valores[inicios], np.diff(np.r_[inicios, len(valores)])
+
+
+def _compactar_posicoes(posicoes):
+    """
+    Posições como faixas contíguas (inícios, comprimentos) quando isso ocupa menos que o
+    array; senão o próprio array em int32. Notas inteiras viram uma faixa cada.
+    """
+    posicoes = np.asarray(posicoes, dtype=np.int64)
+    if len(posicoes) == 0:
+        return posicoes.astype(np.int32)
+    quebras = np.flatnonzero(np.diff(posicoes) != 1) + 1
+    if 2 * (len(quebras) + 1) >= len(posicoes):
+        return posicoes.astype(np.int32)
+    inicios = np.r_[0, quebras]
+    comprimentos = np.diff(np.r_[inicios, len(posicoes)])
+    return posicoes[inicios].astype(np.int32), comprimentos.astype(np.int32)
+
+
+def _expandir_posicoes(compactas):
+    if not isinstance(compactas, tuple):
+        return compactas.astype(np.int64)
+    inicios, comprimentos = compactas
+    total = int(comprimentos.sum())
+    # início da faixa repetido + deslocamento dentro da faixa
+    deslocamento = np.arange(total) - np.repeat(np.cumsum(comprimentos) - comprimentos, comprimentos)
+    return np.repeat(inicios.astype(np.int64), comprimentos) + deslocamento
+
+
+class DiarioCfop:
+    """
+    Diário de desfazer das atribuições de CFOP em lote sobre uma TabelaItens.
+
+    Cada entrada guarda as posições alteradas (faixas contíguas quando possível) e os
+    valores anteriores de cfop_editado como códigos da categoria em run-length, em vez
+    de um dict por item. O diário guarda no máximo `limite` entradas (padrão
+    ITENS_UNDO_MAX); as mais antigas são descartadas.
+    """
+
+    def __init__(self, tabela, limite=None):
+        self.tabela = tabela
+        self.limite = max(1, int(ITENS_UNDO_MAX if limite is None else limite))
+        self._entradas = []
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def aplicar(self, posicoes, cfop):
+        """Atribui o CFOP (TabelaItens.atribuir_cfop) e registra a entrada. Retorna o total de itens."""
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        if len(posicoes) == 0:
+            return 0
+        # Códigos das categorias só crescem (add_categories), então continuam válidos no desfazer
+        codigos = self.tabela.df["cfop_editado"].cat.codes.to_numpy()[posicoes]
+        self.tabela.atribuir_cfop(posicoes, cfop)
+        self._entradas.append((_compactar_posicoes(posicoes), _rle(codigos)))
+        del self._entradas[: -self.limite]
+        return len(posicoes)
+
+    def desfazer(self):
+        """Restaura os valores anteriores da última entrada. Retorna o total de itens (0 se vazio)."""
+        if not self._entradas:
+            return 0
+        compactas, (codigos, repeticoes) = self._entradas.pop()
+        posicoes = _expandir_posicoes(compactas)
+        # código -1 (sem edição) indexa o NaN acrescentado ao fim
+        categorias = np.r_[self.tabela.df["cfop_editado"].cat.categories.astype(object), np.nan]
+        self.tabela.restaurar(posicoes, categorias[np.repeat(codigos, repeticoes)])
+        return len(posicoes)
+
+    def tamanho_bytes(self):
+        """Memória aproximada ocupada pelos arrays do diário."""
+        total = 0
+        for compactas, rle in self._entradas:
+            arrays = (compactas if isinstance(compactas, tuple) else (compactas,)) + rle
+            total += sum(a.nbytes for a in arrays)
+        return total
+
+
+class GradeItens:
+    """
+    Grade de itens das notas selecionadas (seleção em lote), mantida entre reruns.
+
+    obter() devolve o mesmo DataFrame enquanto a seleção, o CFOP das notas e a versão da
+    tabela não mudam. Quando mudam, atualiza só o necessário: remove/acrescenta as
+    linhas das notas que saíram/entraram na seleção e recalcula a coluna cfop_atual
+    quando algum CFOP foi alterado. O índice é a posição do item na TabelaItens.
+    """
+
+    COLUNAS = ["Selecionar", "chave", "nItem", "fornecedor", "xProd", "vProd", "cfop_atual"]
+
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.df = pd.DataFrame(columns=self.COLUNAS)
+        self._chaves = ()
+        self._cfop_nota = {}
+        self._versao = tabela.versao
+
+    def _linhas(self, chaves, cfop_nota_por_chave, fornecedor_por_chave):
+        posicoes = self.tabela.posicoes_das_notas(chaves)
+        sub = self.tabela.df.iloc[posicoes]
+        chave = sub["chave"].astype(object)
+        return pd.DataFrame(
+            {
+                "Selecionar": False,
+                "chave": chave,
+                "nItem": sub["nItem"],
+                "fornecedor": chave.map(fornecedor_por_chave),
+                "xProd": sub["xProd"],
+                "vProd": sub["vProd"],
+                "cfop_atual": self.tabela.cfop_atual(posicoes, cfop_nota_por_chave),
+            },
+            index=sub.index,
+        )
+
+    def obter(self, chaves, cfop_nota_por_chave, fornecedor_por_chave):
+        """DataFrame da grade para as notas informadas (não altere o retorno; faça uma cópia)."""
+        chaves = tuple(chaves)
+        if chaves != self._chaves:
+            anteriores, atuais = set(self._chaves), set(chaves)
+            removidas = anteriores - atuais
+            novas = [c for c in chaves if c not in anteriores]
+            df = self.df
+            if removidas:
+                df = df[~df["chave"].isin(removidas)]
+            if novas:
+                novas_linhas = self._linhas(novas, cfop_nota_por_chave, fornecedor_por_chave)
+                df = pd.concat([df, novas_linhas]) if len(df) else novas_linhas
+                # Mantém a ordem da tabela (ordem de leitura das notas)
+                df = df.sort_index()
+            self.df = df
+            self._chaves = chaves
+        if self._versao != self.tabela.versao or cfop_nota_por_chave != self._cfop_nota:
+            if len(self.df):
+                self.df = self.df.assign(
+                    cfop_atual=self.tabela.cfop_atual(self.df.index.to_numpy(), cfop_nota_por_chave).to_numpy()
+                )
+            self._versao = self.tabela.versao
+            self._cfop_nota = dict(cfop_nota_por_chave)
+        return self.df
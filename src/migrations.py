@@ -0,0 +1,145 @@
+"""
+Migrações versionadas do schema (fora do import do app).
+
+Uso:
+    python -m src.migrations [--url URL] [--listar]
+
+Sem --url usa o engine configurado em src/db.py (variáveis SUPABASE_*). Cada
+migração roda na sua própria transação e é registrada em schema_migrations; as já
+registradas são puladas, e cada uma também é segura de repetir (verifica o estado
+antes de alterar), então o comando pode ser executado a cada deploy.
+"""
+import argparse
+import sys
+import time
+
+from sqlalchemy import Column, Float, MetaData, String, Table, create_engine, inspect, select, text
+
+_metadata_migracoes = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata_migracoes,
+    Column("versao", String(50), primary_key=True),
+    Column("descricao", String(255)),
+    Column("aplicada_em", Float, nullable=False),
+)
+
+_TABELA_PREFERENCIAS = "preferencias_fornecedor_empresa"
+_INDICE_PREFERENCIAS = "ux_preferencias_empresa_fornecedor"
+
+
+def _corrigir_tipo_empresa_id(conn):
+    """empresa_id criado como texto em bancos antigos: converte para INTEGER (apenas PostgreSQL)."""
+    if conn.dialect.name != "postgresql":
+        return
+    tipo = conn.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :tabela AND column_name = 'empresa_id'"
+        ),
+        {"tabela": _TABELA_PREFERENCIAS},
+    ).scalar()
+    if tipo is None or tipo in ("integer", "bigint", "smallint"):
+        return
+    conn.execute(
+        text(
+            f"ALTER TABLE {_TABELA_PREFERENCIAS} "
+            "ALTER COLUMN empresa_id TYPE INTEGER USING trim(empresa_id::text)::integer"
+        )
+    )
+
+
+def _remover_preferencias_duplicadas(conn):
+    """Mantém apenas a linha mais recente (maior id) de cada (empresa_id, cnpj_fornecedor)."""
+    conn.execute(
+        text(
+            f"DELETE FROM {_TABELA_PREFERENCIAS} WHERE id NOT IN ("
+            f"SELECT MAX(id) FROM {_TABELA_PREFERENCIAS} GROUP BY empresa_id, cnpj_fornecedor)"
+        )
+    )
+
+
+def _criar_indice_preferencias(conn):
+    """Índice único composto usado pelas buscas e pelo ON CONFLICT do upsert em lote."""
+    conn.execute(
+        text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {_INDICE_PREFERENCIAS} "
+            f"ON {_TABELA_PREFERENCIAS} (empresa_id, cnpj_fornecedor)"
+        )
+    )
+
+
+# (versão, descrição, função(conn)) — em ordem; nunca altere uma migração já publicada,
+# acrescente outra
+MIGRACOES = [
+    ("001", "preferencias: empresa_id como INTEGER", _corrigir_tipo_empresa_id),
+    ("002", "preferencias: remove duplicatas por empresa/fornecedor", _remover_preferencias_duplicadas),
+    ("003", "preferencias: índice único (empresa_id, cnpj_fornecedor)", _criar_indice_preferencias),
+]
+
+
+def migracoes_aplicadas(eng):
+    """Versões já registradas em schema_migrations."""
+    if not inspect(eng).has_table(schema_migrations.name):
+        return set()
+    with eng.connect() as conn:
+        return {row[0] for row in conn.execute(select(schema_migrations.c.versao))}
+
+
+def executar_migracoes(eng=None):
+    """
+    Cria as tabelas ausentes e aplica as migrações pendentes, em ordem.
+
+    Retorna a lista de versões aplicadas nesta execução (vazia se já estava em dia).
+    """
+    from src import db
+
+    if eng is None:
+        eng = db._ensure_engine()
+    db.inicializar_schema(eng)
+    _metadata_migracoes.create_all(eng)
+
+    aplicadas = migracoes_aplicadas(eng)
+    executadas = []
+    for versao, descricao, migrar in MIGRACOES:
+        if versao in aplicadas:
+            continue
+        # Migração e registro na mesma transação: ou os dois acontecem, ou nenhum
+        with eng.begin() as conn:
+            migrar(conn)
+            conn.execute(
+                schema_migrations.insert().values(versao=versao, descricao=descricao, aplicada_em=time.time())
+            )
+        print(f"Migração {versao} aplicada: {descricao}")
+        executadas.append(versao)
+    return executadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.migrations", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", default=None, help="URL SQLAlchemy do banco (padrão: SUPABASE_* de src/db.py)")
+    parser.add_argument("--listar", action="store_true", help="apenas lista as migrações e se já foram aplicadas")
+    args = parser.parse_args(argv)
+
+    eng = create_engine(args.url) if args.url else None
+    if args.listar:
+        if eng is None:
+            from src.db import _ensure_engine
+
+            eng = _ensure_engine()
+        aplicadas = migracoes_aplicadas(eng)
+        for versao, descricao, _ in MIGRACOES:
+            print(f"[{'x' if versao in aplicadas else ' '}] {versao} {descricao}")
+        return 0
+
+    executadas = executar_migracoes(eng)
+    if not executadas:
+        print("Schema já está atualizado.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
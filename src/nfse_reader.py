@@ -2,63 +2,98 @@ from lxml import etree
 import pandas as pd
 import io
 
-def extrair_dados_nfses_xmls(arquivos_xml, progress_callback=None):
-    registros = []
-    arquivos_dict = {}
+from src.arquivos import ler_arquivo
+from src.parallel import processar_arquivos
 
-    total = len(arquivos_xml)
-    for idx, file in enumerate(arquivos_xml, start=1):
-        try:
-            tree = etree.parse(file)
-            root = tree.getroot()
-
-            arquivos_dict[file.name] = file.getvalue()
-
-            infNfse = root.find(".//InfNfse")
-            if infNfse is None:
-                continue
-
-            prestador = root.find(".//PrestadorServico/IdentificacaoPrestador")
-            cnpj_emissor = prestador.findtext("Cnpj", default="") if prestador is not None else ""
-
-            numero_nfse = infNfse.findtext("Numero", default="")
-            fornecedor = root.findtext(".//PrestadorServico/RazaoSocial", default="")
-            valor_total = root.findtext(".//Valores/ValorServicos", default="0")
-            cfop_atual = ""
-            credito_icms = 0
-
-            # Nova extração da data da nota
-            data_emissao = infNfse.findtext("DataEmissao", default="")
-
-            # Complemento: CNPJ + Razão Social + Número da Nota
-            complemento = f"{cnpj_emissor} {fornecedor} {numero_nfse}"
-
-            registros.append({
-                "chave": numero_nfse,
-                "tipo": "NFSe",
-                "fornecedor": fornecedor,
-                "cnpj_emissor": cnpj_emissor,
-                "valor_total": float(valor_total),
-                "cfop_atual": cfop_atual,
-                "credito_icms": float(credito_icms),
-                "data_nota": data_emissao,
-                "complemento": complemento
-            })
-
-            if callable(progress_callback):
-                try:
-                    progress_callback(idx, total, getattr(file, 'name', None))
-                except Exception:
-                    pass
+# Versão do extrator usada como chave do cache de parse (src/parse_cache.py)
+VERSAO_EXTRATOR = "nfse-4"
+
+
+def _extrair_infnfse(infNfse):
+    """Monta o registro de uma InfNfse; os campos são buscados apenas dentro dela."""
+    # {*} aceita tanto XMLs sem namespace quanto os que declaram o namespace ABRASF
+    prestador = infNfse.find(".//{*}PrestadorServico/{*}IdentificacaoPrestador")
+    # ABRASF 1.0: IdentificacaoPrestador/Cnpj; 2.x: IdentificacaoPrestador/CpfCnpj/Cnpj
+    cnpj_emissor = prestador.findtext(".//{*}Cnpj", default="") if prestador is not None else ""
+
+    numero_nfse = infNfse.findtext("{*}Numero", default="")
+    fornecedor = infNfse.findtext(".//{*}PrestadorServico/{*}RazaoSocial", default="")
+    valor_total = infNfse.findtext(".//{*}Valores/{*}ValorServicos", default="0")
+    cfop_atual = ""
+    credito_icms = 0
+
+    # Nova extração da data da nota
+    data_emissao = infNfse.findtext("{*}DataEmissao", default="")
+
+    # Complemento: CNPJ + Razão Social + Número da Nota
+    complemento = f"{cnpj_emissor} {fornecedor} {numero_nfse}"
+
+    return {
+        "chave": numero_nfse,
+        "tipo": "NFSe",
+        "fornecedor": fornecedor,
+        "cnpj_emissor": cnpj_emissor,
+        "valor_total": float(valor_total),
+        "cfop_atual": cfop_atual,
+        "credito_icms": float(credito_icms),
+        "data_nota": data_emissao,
+        "complemento": complemento
+    }
+
+
+def iterar_nfses(fonte):
+    """
+    Gera um registro por InfNfse do XML, lendo o arquivo em streaming (etree.iterparse).
 
+    Cobre tanto o arquivo de uma nota (CompNfse) quanto os lotes exportados pelas
+    prefeituras (ConsultarNfseResponse/ListaNfse com centenas de CompNfse). Cada
+    InfNfse é descartada após a extração, então a memória não cresce com o lote.
+    """
+    for _, el in etree.iterparse(fonte, events=("end",), tag="{*}InfNfse"):
+        # Uma nota com valor malformado é ignorada (com aviso) sem perder as demais do lote
+        try:
+            registro = _extrair_infnfse(el)
         except Exception as e:
-            print(f"Erro ao processar {file.name}: {e}")
-            if callable(progress_callback):
-                try:
-                    progress_callback(idx, total, getattr(file, 'name', None))
-                except Exception:
-                    pass
+            print(f"Erro ao processar NFS-e {el.findtext('{*}Numero', default='?')}: {e}")
+            registro = None
+        # Libera a nota já lida e tudo o que veio antes dela (notas anteriores do lote)
+        el.clear()
+        for no in (el, *el.iterancestors()):
+            # A raiz não tem pai: comentários/instruções antes dela não são removíveis
+            if no.getparent() is None:
+                break
+            while no.getprevious() is not None:
+                del no.getparent()[0]
+        if registro is not None:
+            yield registro
+
+
+def _processar_nfse(conteudo):
+    """Extrai a lista de registros (um por InfNfse) a partir dos bytes do XML."""
+    return list(iterar_nfses(io.BytesIO(conteudo)))
+
+
+def extrair_dados_nfses_xmls(arquivos_xml, progress_callback=None, paralelo=False, max_workers=None, cache=None):
+    registros = []
+    arquivos_dict = {}
+
+    arquivos = [ler_arquivo(file) for file in arquivos_xml]
+    for _, nome, conteudo, registros_arquivo, erro in processar_arquivos(
+        _processar_nfse,
+        arquivos,
+        progress_callback=progress_callback,
+        paralelo=paralelo,
+        max_workers=max_workers,
+        cache=cache,
+        versao_cache=VERSAO_EXTRATOR,
+    ):
+        if erro is not None:
+            print(f"Erro ao processar {nome}: {erro}")
             continue
 
+        arquivos_dict[nome] = conteudo
+
+        registros.extend(registros_arquivo)
+
     df = pd.DataFrame(registros)
     return df, arquivos_dict
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from src.parse_cache import hash_conteudo
+
+
+def numero_workers(max_workers=None):
+    """
+    Resolve a quantidade de processos do backend paralelo.
+
+    Ordem: argumento explícito > variável de ambiente XML_WORKERS > os.cpu_count().
+    """
+    if max_workers is None:
+        max_workers = os.getenv("XML_WORKERS") or os.cpu_count() or 1
+    try:
+        return max(1, int(max_workers))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _executar(func, args):
+    # Roda no processo filho: erros voltam como texto para não interromper o lote inteiro.
+    try:
+        return func(*args), None
+    except Exception as e:
+        return None, str(e)
+
+
+def processar_arquivos(func, arquivos, progress_callback=None, paralelo=False, max_workers=None, extra_args=(),
+                       cache=None, versao_cache=None):
+    """
+    Aplica func(conteudo, *extra_args) a cada (nome, conteudo) de `arquivos`.
+
+    Gera (idx, nome, conteudo, resultado, erro) na ordem de upload, chamando
+    progress_callback(idx, total, nome) a cada arquivo concluído. Com paralelo=True
+    o trabalho é distribuído num ProcessPoolExecutor; `func` deve ser uma função de
+    módulo (serializável) e os resultados continuam chegando na ordem original.
+
+    Com `cache` (ParseCache), arquivos cujo SHA-256 já está gravado para
+    `versao_cache` não são processados; os novos resultados são gravados ao final.
+    """
+    total = len(arquivos)
+    hashes = None
+    acertos = {}
+    if cache is not None:
+        hashes = [hash_conteudo(conteudo) for _, conteudo in arquivos]
+        try:
+            acertos = cache.obter_varios(versao_cache, hashes)
+        except Exception as e:
+            print(f"Warning: falha ao consultar o cache de XMLs: {e}")
+            cache = None
+    pendentes = [i for i in range(total) if hashes is None or hashes[i] not in acertos]
+    tarefas = [(arquivos[i][1], *extra_args) for i in pendentes]
+
+    workers = numero_workers(max_workers) if paralelo else 1
+    if workers > 1 and len(tarefas) > 1:
+        workers = min(workers, len(tarefas))
+        chunksize = max(1, len(tarefas) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        resultados = executor.map(partial(_executar, func), tarefas, chunksize=chunksize)
+    else:
+        executor = None
+        resultados = (_executar(func, args) for args in tarefas)
+
+    novos = []
+    try:
+        for idx, (nome, conteudo) in enumerate(arquivos, start=1):
+            h = hashes[idx - 1] if hashes is not None else None
+            if h is not None and h in acertos:
+                resultado, erro = acertos[h], None
+            else:
+                resultado, erro = next(resultados)
+                if cache is not None and erro is None:
+                    novos.append((h, resultado))
+            yield idx, nome, conteudo, resultado, erro
+            if callable(progress_callback):
+                try:
+                    progress_callback(idx, total, nome)
+                except Exception:
+                    pass
+    finally:
+        if executor is not None:
+            # cancel_futures (Python 3.9+; mínimo do projeto: 3.10) descarta o que ainda não
+            # começou quando o consumidor interrompe a leitura
+            executor.shutdown(cancel_futures=True)
+        if cache is not None and novos:
+            try:
+                cache.gravar_varios(versao_cache, novos)
+            except Exception as e:
+                print(f"Warning: falha ao gravar no cache de XMLs: {e}")
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Limite de variáveis por consulta no SQLite (versões antigas aceitam no máximo 999)
+_LOTE_SQL = 500
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS parse_cache (
+    chave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    acessado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_parse_cache_acessado_em ON parse_cache (acessado_em);
+"""
+
+
+def hash_conteudo(conteudo):
+    """SHA-256 (hex) dos bytes do arquivo: identifica o conteúdo independentemente do nome."""
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+class ParseCache:
+    """
+    Cache persistente (SQLite) do resultado da extração de cada XML.
+
+    A chave é "<versao>:<sha256 do conteúdo>", onde a versão identifica o extrator
+    (ex.: VERSAO_EXTRATOR de src/xml_reader.py). Ao mudar a versão, as entradas
+    antigas deixam de ser encontradas e acabam removidas pela política LRU, que
+    mantém a soma dos tamanhos abaixo de max_bytes.
+    """
+
+    def __init__(self, caminho, max_bytes=512 * 1024 * 1024):
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        diretorio = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(diretorio, exist_ok=True)
+        with self._conectar() as conn:
+            conn.executescript(_DDL)
+
+    @contextmanager
+    def _conectar(self):
+        # Uma conexão por operação: o cache é usado por várias sessões/threads do Streamlit.
+        # A operação roda numa transação (commit/rollback) e a conexão é fechada ao final,
+        # sem depender do coletor de lixo (importante nos processos de leitura paralela).
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def obter_varios(self, versao, hashes):
+        """Retorna {hash: valor} para os hashes presentes no cache e atualiza o acesso (LRU)."""
+        encontrados = {}
+        unicos = list(dict.fromkeys(hashes))
+        agora = time.time()
+        prefixo = f"{versao}:"
+        with self._lock, self._conectar() as conn:
+            for i in range(0, len(unicos), _LOTE_SQL):
+                chaves = [prefixo + h for h in unicos[i:i + _LOTE_SQL]]
+                marcadores = ",".join("?" * len(chaves))
+                rows = conn.execute(
+                    f"SELECT chave, valor FROM parse_cache WHERE chave IN ({marcadores})", chaves
+                ).fetchall()
+                for chave, valor in rows:
+                    encontrados[chave[len(prefixo):]] = json.loads(valor)
+                if rows:
+                    conn.executemany(
+                        "UPDATE parse_cache SET acessado_em = ? WHERE chave = ?",
+                        [(agora, chave) for chave, _ in rows],
+                    )
+        return encontrados
+
+    def gravar_varios(self, versao, itens):
+        """Grava [(hash, valor)] (valor serializável em JSON) e aplica a evicção por tamanho."""
+        if not itens:
+            return
+        agora = time.time()
+        linhas = []
+        for h, valor in itens:
+            texto = json.dumps(valor, ensure_ascii=False)
+            linhas.append((f"{versao}:{h}", texto, len(texto.encode("utf-8")), agora))
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO parse_cache (chave, valor, tamanho, acessado_em) VALUES (?, ?, ?, ?)",
+                linhas,
+            )
+            self._evictar(conn)
+
+    def _evictar(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM parse_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excedente = total - self.max_bytes
+        removidas = []
+        liberado = 0
+        for chave, tamanho in conn.execute("SELECT chave, tamanho FROM parse_cache ORDER BY acessado_em"):
+            removidas.append((chave,))
+            liberado += tamanho
+            if liberado >= excedente:
+                break
+        conn.executemany("DELETE FROM parse_cache WHERE chave = ?", removidas)
+
+    def limpar(self):
+        """Remove todas as entradas do cache."""
+        with self._lock, self._conectar() as conn:
+            conn.execute("DELETE FROM parse_cache")
+
+
+_cache_padrao = None
+_cache_padrao_lock = threading.Lock()
+
+
+def obter_cache_padrao():
+    """
+    Cache compartilhado pelo processo, configurado por variáveis de ambiente:
+      - XML_CACHE_PATH: arquivo SQLite (padrão ~/.cache/collosfiscal/parse_cache.sqlite3)
+      - XML_CACHE_MAX_MB: limite de tamanho para a evicção LRU (padrão 512)
+      - XML_CACHE_DISABLED=1: desativa o cache (retorna None)
+    """
+    global _cache_padrao
+    if os.getenv("XML_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    with _cache_padrao_lock:
+        if _cache_padrao is None:
+            caminho = os.getenv("XML_CACHE_PATH") or os.path.join(
+                os.path.expanduser("~"), ".cache", "collosfiscal", "parse_cache.sqlite3"
+            )
+            try:
+                max_mb = float(os.getenv("XML_CACHE_MAX_MB", "512"))
+            except ValueError:
+                max_mb = 512
+            try:
+                _cache_padrao = ParseCache(caminho, max_bytes=int(max_mb * 1024 * 1024))
+            except Exception as e:
+                # Sem cache o app continua funcionando (apenas sem o ganho em reenvios)
+                print(f"Warning: não foi possível abrir o cache de XMLs em {caminho}: {e}")
+                return None
+        return _cache_padrao
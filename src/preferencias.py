@@ -0,0 +1,63 @@
+import pandas as pd
+
+from src.db import buscar_preferencias_empresa_fornecedores, salvar_preferencias_em_lote
+
+# Colunas editáveis de df_geral que as preferências por fornecedor preenchem
+COLUNAS_PREFERENCIA = ["tipo_operacao", "data_nota", "complemento", "debito", "credito", "historico"]
+
+
+def garantir_colunas(df_geral):
+    """Garante que as colunas editáveis existam em df_geral (vazias quando ausentes)."""
+    for col in COLUNAS_PREFERENCIA:
+        if col not in df_geral.columns:
+            df_geral[col] = ""
+    return df_geral
+
+
+def mesclar_preferencias(df_geral, preferencias):
+    """
+    Aplica em df_geral (in-place) as preferências {cnpj_fornecedor: dict} por CNPJ emissor.
+
+    Para cada coluna, os valores são mapeados pelo CNPJ de uma vez e só sobrescrevem
+    a nota quando a preferência tem valor preenchido.
+    """
+    if not preferencias or df_geral.empty:
+        return df_geral
+    prefs = pd.DataFrame.from_dict(preferencias, orient="index")
+    for col in COLUNAS_PREFERENCIA:
+        if col not in prefs.columns:
+            continue
+        valores = df_geral["cnpj_emissor"].map(prefs[col])
+        preenchidos = valores.notna() & valores.astype(bool)
+        if preenchidos.any():
+            if col not in df_geral.columns:
+                df_geral[col] = ""
+            df_geral.loc[preenchidos, col] = valores[preenchidos]
+    return df_geral
+
+
+def aplicar_preferencias(df_geral, empresa_id):
+    """Aplica em df_geral (in-place) as preferências salvas no banco para a empresa, por CNPJ emissor."""
+    if df_geral.empty:
+        return df_geral
+    preferencias = buscar_preferencias_empresa_fornecedores(empresa_id, df_geral["cnpj_emissor"].unique().tolist())
+    return mesclar_preferencias(df_geral, preferencias)
+
+
+def salvar_preferencias(df_geral, empresa_id):
+    """
+    Grava as escolhas atuais de df_geral como preferências da empresa, num único upsert.
+
+    Considera as notas com CNPJ emissor e tipo de operação preenchidos; para fornecedores
+    com várias notas vale a última. Retorna o número de fornecedores gravados.
+    """
+    if df_geral.empty:
+        return 0
+    garantir_colunas(df_geral)
+    validas = df_geral[df_geral["cnpj_emissor"].astype(bool) & df_geral["tipo_operacao"].astype(bool)]
+    registros = (
+        validas[["cnpj_emissor"] + COLUNAS_PREFERENCIA]
+        .rename(columns={"cnpj_emissor": "cnpj_fornecedor"})
+        .to_dict("records")
+    )
+    return salvar_preferencias_em_lote(empresa_id, registros)
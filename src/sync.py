@@ -0,0 +1,192 @@
+"""
+Sincronização do backend local (SQLite) com o PostgreSQL central.
+
+Uso:
+    python -m src.sync [--sqlite CAMINHO] [--intervalo SEGUNDOS]
+
+Empresas, preferências por fornecedor, catálogo de CFOPs e cadastro legado de emissores
+são sincronizados nos dois sentidos, com upsert pelas chaves naturais (os ids de empresa
+diferem entre os bancos: as preferências são identificadas pelo CNPJ da empresa).
+
+A cada ciclo, o local guarda em sync_estado uma impressão (hash) de cada linha como
+ficou após a sincronização. No ciclo seguinte só são enviadas as linhas alteradas ou
+criadas localmente desde então; em seguida tudo o que está no central é trazido para o
+local. Assim uma alteração local prevalece sobre a do central apenas quando foi feita
+depois da última sincronização, e na primeira sincronização de uma filial só sobem as
+linhas que o central ainda não tem (o catálogo padrão semeado no local não sobrescreve
+as edições do central). As tabelas de referência da decomposição do CFOP são só trazidas.
+
+Com --intervalo, repete a sincronização periodicamente até ser interrompido. O
+PostgreSQL é configurado pelas variáveis SUPABASE_* (independente de DB_BACKEND).
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+
+from sqlalchemy import Column, MetaData, String, Table, delete, insert, select
+
+from src import db
+
+_metadata_sync = MetaData()
+
+# Impressão de cada linha sincronizada, por tabela e chave natural (apenas no banco local)
+sync_estado = Table(
+    "sync_estado",
+    _metadata_sync,
+    Column("tabela", String(100), primary_key=True),
+    Column("chave", String(255), primary_key=True),
+    Column("impressao", String(64), nullable=False),
+)
+
+# Tabelas sincronizadas nos dois sentidos: (tabela, chave natural). Empresas primeiro, para
+# que as preferências possam ser remapeadas pelo CNPJ da empresa nos dois bancos.
+_SINCRONIZADAS = [
+    (db.empresas, ("cnpj",)),
+    (db.preferencias_fornecedor_empresa, ("empresa_cnpj", "cnpj_fornecedor")),
+    (db.cfop_catalog, ("codigo",)),
+    (db.emissores_operacoes, ("cnpj_emissor",)),
+]
+
+# Tabelas de referência copiadas do PostgreSQL para o local: (tabela, chave natural)
+_REFERENCIAS = [
+    (db.origem_destino_cfop, "codigo"),
+    (db.tipo_operacao_cfop, "codigo"),
+    (db.finalidade_cfop, "codigo"),
+]
+
+
+def _linhas(conn, tabela, sem=("id",)):
+    colunas = [c for c in tabela.c if c.name not in sem]
+    return [dict(r._mapping) for r in conn.execute(select(*colunas))]
+
+
+def _ler(conn, tabela):
+    """Linhas sem o id do banco; preferências com empresa_cnpj no lugar de empresa_id."""
+    linhas = _linhas(conn, tabela)
+    if tabela is not db.preferencias_fornecedor_empresa:
+        return linhas
+    cnpj_por_id = {r.id: r.cnpj for r in conn.execute(select(db.empresas.c.id, db.empresas.c.cnpj))}
+    resultado = []
+    for linha in linhas:
+        empresa_cnpj = cnpj_por_id.get(linha.pop("empresa_id"))
+        if empresa_cnpj is not None:
+            resultado.append({**linha, "empresa_cnpj": empresa_cnpj})
+    return resultado
+
+
+def _gravar(conn, tabela, chave, linhas):
+    """Upsert das linhas (no formato de _ler) pela chave natural."""
+    indice = list(chave)
+    if tabela is db.preferencias_fornecedor_empresa:
+        id_por_cnpj = {r.cnpj: r.id for r in conn.execute(select(db.empresas.c.id, db.empresas.c.cnpj))}
+        linhas = [
+            {**{k: v for k, v in linha.items() if k != "empresa_cnpj"}, "empresa_id": id_por_cnpj[linha["empresa_cnpj"]]}
+            for linha in linhas
+            if linha["empresa_cnpj"] in id_por_cnpj
+        ]
+        indice = ["empresa_id", "cnpj_fornecedor"]
+    if linhas:
+        db.upsert(conn, tabela, linhas, indice, [c for c in linhas[0] if c not in indice])
+    return len(linhas)
+
+
+def _chave(linha, chave):
+    return json.dumps([linha[c] for c in chave], ensure_ascii=False)
+
+
+def _impressao(linha):
+    return hashlib.sha1(json.dumps(linha, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _sincronizar_tabela(local, remoto, tabela, chave):
+    """Envia as linhas alteradas localmente, traz as do central e regrava sync_estado."""
+    estado = {
+        r.chave: r.impressao
+        for r in local.execute(
+            select(sync_estado.c.chave, sync_estado.c.impressao).where(sync_estado.c.tabela == tabela.name)
+        )
+    }
+    locais = {_chave(linha, chave): linha for linha in _ler(local, tabela)}
+    remotas = {_chave(linha, chave): linha for linha in _ler(remoto, tabela)}
+    if estado:
+        alteradas = {k: linha for k, linha in locais.items() if estado.get(k) != _impressao(linha)}
+    else:
+        # Primeira sincronização: o central prevalece; só sobe o que ele ainda não tem
+        alteradas = {k: linha for k, linha in locais.items() if k not in remotas}
+
+    enviadas = _gravar(remoto, tabela, chave, list(alteradas.values()))
+    remotas.update(alteradas)
+    recebidas = _gravar(local, tabela, chave, [linha for k, linha in remotas.items() if locais.get(k) != linha])
+
+    local.execute(delete(sync_estado).where(sync_estado.c.tabela == tabela.name))
+    if remotas:
+        local.execute(
+            insert(sync_estado),
+            [{"tabela": tabela.name, "chave": k, "impressao": _impressao(linha)} for k, linha in remotas.items()],
+        )
+    return enviadas, recebidas
+
+
+def _receber_referencias(remoto, local):
+    """Pull das tabelas de referência PostgreSQL -> local. Retorna contagens por tabela."""
+    contagens = {}
+    for tabela, chave in _REFERENCIAS:
+        linhas = _linhas(remoto, tabela)
+        db.upsert(local, tabela, linhas, [chave], [c for c in linhas[0] if c != chave] if linhas else [])
+        contagens[tabela.name] = len(linhas)
+    return contagens
+
+
+def sincronizar(local=None, remoto=None):
+    """Executa um ciclo de sincronização e retorna {"enviadas": {...}, "recebidas": {...}}."""
+    local = local if local is not None else db.criar_engine_sqlite()
+    remoto = remoto if remoto is not None else db.criar_engine_postgres()
+    # Sem semear o catálogo: ele vem do central
+    db.inicializar_schema(local, semear=False)
+    _metadata_sync.create_all(local)
+
+    enviadas, recebidas = {}, {}
+    # O central confirma antes do local: se a gravação local falhar, sync_estado não
+    # avança e as linhas são reenviadas no próximo ciclo (o upsert é idempotente)
+    with local.begin() as conn_local, remoto.begin() as conn_remoto:
+        for tabela, chave in _SINCRONIZADAS:
+            enviadas[tabela.name], recebidas[tabela.name] = _sincronizar_tabela(
+                conn_local, conn_remoto, tabela, chave
+            )
+        recebidas.update(_receber_referencias(conn_remoto, conn_local))
+
+    # O processo atual pode estar usando o banco local: relê os caches na próxima consulta
+    db.invalidar_cache_empresas()
+    db.invalidar_cache_catalogo()
+    db.invalidar_cache_cfop()
+    return {"enviadas": enviadas, "recebidas": recebidas}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.sync", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sqlite", default=None, help="arquivo SQLite local (padrão: SQLITE_PATH)")
+    parser.add_argument("--intervalo", type=float, default=None, help="repete a cada N segundos")
+    args = parser.parse_args(argv)
+
+    local = db.criar_engine_sqlite(args.sqlite)
+    remoto = db.criar_engine_postgres()
+    while True:
+        inicio = time.perf_counter()
+        try:
+            resultado = sincronizar(local, remoto)
+            print(f"Sincronizado em {time.perf_counter() - inicio:.2f}s: {resultado}")
+        except Exception as e:
+            print(f"Erro na sincronização: {e}", file=sys.stderr)
+            if args.intervalo is None:
+                return 1
+        if args.intervalo is None:
+            return 0
+        time.sleep(args.intervalo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,172 @@ from lxml import etree
 import pandas as pd
 import io
 
+from src.arquivos import ler_arquivo
+from src.parallel import processar_arquivos
+
 NFE_NAMESPACE = "http://www.portalfiscal.inf.br/nfe"
+_NS = "{%s}" % NFE_NAMESPACE
+
+# Versão do extrator: altere sempre que o formato de (registro, itens) mudar,
+# invalidando os resultados gravados no cache de parse (src/parse_cache.py).
+VERSAO_EXTRATOR = "nfe-1"
+
+TAG_INFNFE = f"{_NS}infNFe"
+TAG_EMIT = f"{_NS}emit"
+TAG_DET = f"{_NS}det"
+TAG_PROD = f"{_NS}prod"
+
+# Campos de cabeçalho: vale a primeira ocorrência no documento, a mesma semântica
+# de root.findtext(".//{ns}campo") usada anteriormente.
+_CAMPOS_CABECALHO = {
+    f"{_NS}vNF": "vNF",
+    f"{_NS}CFOP": "CFOP",
+    f"{_NS}vICMS": "vICMS",
+    f"{_NS}dhEmi": "dhEmi",
+    f"{_NS}dEmi": "dEmi",
+    f"{_NS}nNF": "nNF",
+}
+
+# Campos do item lidos diretamente de det/prod (tag no XML -> chave no dict do item)
+_CAMPOS_ITEM = {
+    f"{_NS}cProd": "cProd",
+    f"{_NS}xProd": "xProd",
+    f"{_NS}qCom": "qCom",
+    f"{_NS}vProd": "vProd",
+    f"{_NS}CFOP": "cfop",
+}
+
+_TAGS_VISITADAS = (TAG_INFNFE, TAG_EMIT, TAG_DET, *_CAMPOS_CABECALHO)
+
+
+class _ColetorNFe:
+    """
+    Acumula o registro da nota e a lista de itens visitando cada elemento uma única vez.
+
+    Substitui as várias buscas `.//` (cada uma percorria o documento inteiro) por um
+    despacho por tag durante um único percurso da árvore.
+    """
+
+    __slots__ = ("chave", "cnpj_emissor", "fornecedor", "emit_visto", "campos", "itens")
+
+    def __init__(self):
+        self.chave = None
+        self.cnpj_emissor = ""
+        self.fornecedor = ""
+        self.emit_visto = False
+        self.campos = {}
+        self.itens = []
+
+    def visitar(self, el):
+        tag = el.tag
+        if tag == TAG_DET:
+            prod = el.find(TAG_PROD)
+            if prod is None:
+                return
+            # Uma passada pelos filhos de prod (em vez de um findtext por campo);
+            # vale o primeiro filho de cada tag, como em findtext.
+            valores = {}
+            for filho in prod:
+                nome = _CAMPOS_ITEM.get(filho.tag)
+                if nome is not None and nome not in valores:
+                    valores[nome] = filho.text or ""
+            # nItem normalmente é atributo do det
+            item = {"nItem": el.get("nItem", "")}
+            for nome in _CAMPOS_ITEM.values():
+                item[nome] = valores.get(nome, "")
+            self.itens.append(item)
+        elif tag in _CAMPOS_CABECALHO:
+            nome = _CAMPOS_CABECALHO[tag]
+            if nome not in self.campos:
+                self.campos[nome] = el.text or ""
+        elif tag == TAG_INFNFE:
+            if self.chave is None:
+                self.chave = el.get("Id", "").replace("NFe", "")
+        elif tag == TAG_EMIT:
+            if not self.emit_visto:
+                self.emit_visto = True
+                self.cnpj_emissor = el.findtext(f"{_NS}CNPJ", default="")
+                self.fornecedor = el.findtext(f"{_NS}xNome", default="")
+
+    def resultado(self):
+        """Retorna (registro, itens) ou None quando o documento não contém infNFe."""
+        if self.chave is None:
+            return None
+        campos = self.campos
+        valor_total = campos.get("vNF", "0")
+        credito_icms = campos.get("vICMS", "0")
+        data_emissao = campos.get("dhEmi", "") or campos.get("dEmi", "")
+        numero_nota = campos.get("nNF", "")
+        registro = {
+            "chave": self.chave,
+            "tipo": "NFe",
+            "fornecedor": self.fornecedor,
+            "cnpj_emissor": self.cnpj_emissor,
+            "valor_total": float(valor_total) if valor_total not in (None, "") else 0.0,
+            "cfop_atual": campos.get("CFOP", ""),
+            "credito_icms": float(credito_icms) if credito_icms not in (None, "") else 0.0,
+            "data_nota": data_emissao,
+            # Complemento: CNPJ + Razão Social + Número da Nota
+            "complemento": f"{self.cnpj_emissor} {self.fornecedor} {numero_nota}",
+            "nNF": numero_nota,
+        }
+        return registro, self.itens
+
+
+def _extrair_nfe(root):
+    """Extrai (registro, itens) de uma NF-e já parseada em um único percurso da árvore."""
+    coletor = _ColetorNFe()
+    # O filtro por tag roda dentro do lxml: um único percurso que só entrega ao Python
+    # os elementos de interesse.
+    for el in root.iterdescendants(*_TAGS_VISITADAS):
+        coletor.visitar(el)
+    return coletor.resultado()
+
 
-def extrair_dados_xmls(arquivos_xml, progress_callback=None):
+def _extrair_nfe_streaming(fonte):
+    """
+    Variante de _extrair_nfe sobre etree.iterparse: cada det é descartado assim que
+    seus campos são lidos, então o pico de memória não cresce com o número de itens.
+    """
+    coletor = _ColetorNFe()
+    for _, el in etree.iterparse(fonte, events=("end",), tag=_TAGS_VISITADAS):
+        coletor.visitar(el)
+        if el.tag == TAG_DET:
+            # Libera o det já lido e os irmãos anteriores (ide, emit, dets anteriores),
+            # cujos campos já foram coletados nos respectivos eventos "end".
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+    return coletor.resultado()
+
+
+def _processar_nfe(conteudo, streaming=False):
+    """Extrai (registro, itens) dos bytes de um XML. Função de módulo para rodar em subprocessos."""
+    if streaming:
+        # BytesIO sobre bytes compartilha o buffer; o iterparse lê em blocos
+        return _extrair_nfe_streaming(io.BytesIO(conteudo))
+    # fromstring parseia direto do buffer, sem cópia intermediária
+    return _extrair_nfe(etree.fromstring(conteudo))
+
+
+def extrair_dados_xmls(arquivos_xml, progress_callback=None, streaming=False, paralelo=False, max_workers=None,
+                       cache=None):
     """
     Extrai dados principais das NF-e e também os itens de cada nota.
 
+    Com streaming=True o XML é lido com etree.iterparse e os itens (det) são liberados
+    à medida que são extraídos, em vez de manter a árvore completa do documento. O
+    resultado (df e itens_por_chave) é o mesmo do modo padrão; arquivos_dict continua
+    guardando os bytes originais, necessários para a exportação do ZIP.
+
+    Com paralelo=True os arquivos são distribuídos entre max_workers processos
+    (padrão: XML_WORKERS ou número de CPUs); registros, itens e arquivos são
+    combinados na ordem de upload e progress_callback continua sendo chamado
+    para cada arquivo.
+
+    Com cache (ParseCache, ver src/parse_cache.py) arquivos já vistos, identificados
+    pelo SHA-256 do conteúdo, são recuperados do cache em vez de parseados de novo.
+
     Retorna:
       - df: DataFrame com registros por nota (chave, fornecedor, cnpj_emissor, valor_total, cfop_atual, ...)
       - arquivos_dict: mapeamento nome_arquivo -> conteúdo_bytes (compatível com uso anterior)
@@ -17,101 +177,31 @@ def extrair_dados_xmls(arquivos_xml, progress_callback=None):
     arquivos_dict = {}
     itens_por_chave = {}
 
-    total = len(arquivos_xml)
-    for idx, file in enumerate(arquivos_xml, start=1):
-        try:
-            # Parse do arquivo
-            tree = etree.parse(file)
-            root = tree.getroot()
-
-            # Salvar conteúdo do arquivo (mantendo compatibilidade: nome -> bytes)
-            try:
-                arquivos_dict[file.name] = file.getvalue()
-            except Exception:
-                # Se o objeto não tiver getvalue (por alguma razão), ler do começo
-                file.seek(0)
-                arquivos_dict[file.name] = file.read()
-
-            infNFe = root.find(".//{http://www.portalfiscal.inf.br/nfe}infNFe")
-            if infNFe is None:
-                continue
-
-            emit = root.find(".//{http://www.portalfiscal.inf.br/nfe}emit")
-            if emit is not None:
-                cnpj_emissor = emit.findtext("{http://www.portalfiscal.inf.br/nfe}CNPJ", default="")
-                fornecedor = emit.findtext("{http://www.portalfiscal.inf.br/nfe}xNome", default="")
-            else:
-                cnpj_emissor = ""
-                fornecedor = ""
-
-            chave = infNFe.get("Id", "").replace("NFe", "")
-            valor_total = root.findtext(".//{http://www.portalfiscal.inf.br/nfe}vNF", default="0")
-            cfop_atual = root.findtext(".//{http://www.portalfiscal.inf.br/nfe}CFOP", default="")
-            credito_icms = root.findtext(".//{http://www.portalfiscal.inf.br/nfe}vICMS", default="0")
-
-            # Nova extração da data da nota
-            data_emissao = root.findtext(".//{http://www.portalfiscal.inf.br/nfe}dhEmi", default="")
-            if not data_emissao:
-                data_emissao = root.findtext(".//{http://www.portalfiscal.inf.br/nfe}dEmi", default="")
+    arquivos = [ler_arquivo(file) for file in arquivos_xml]
+    for _, nome, conteudo, extraido, erro in processar_arquivos(
+        _processar_nfe,
+        arquivos,
+        progress_callback=progress_callback,
+        paralelo=paralelo,
+        max_workers=max_workers,
+        extra_args=(streaming,),
+        cache=cache,
+        versao_cache=VERSAO_EXTRATOR,
+    ):
+        if erro is not None:
+            print(f"Erro ao processar {nome}: {erro}")
+            continue
 
-            # Complemento: CNPJ + Razão Social + Número da Nota
-            numero_nota = root.findtext(".//{http://www.portalfiscal.inf.br/nfe}nNF", default="")
-            complemento = f"{cnpj_emissor} {fornecedor} {numero_nota}"
-
-            # Extrair itens (det)
-            itens = []
-            for det in root.findall(".//{http://www.portalfiscal.inf.br/nfe}det"):
-                # nItem normalmente é atributo do det
-                nItem = det.get("nItem", "")
-                prod = det.find("{http://www.portalfiscal.inf.br/nfe}prod")
-                if prod is None:
-                    continue
-                cProd = prod.findtext("{http://www.portalfiscal.inf.br/nfe}cProd", default="")
-                xProd = prod.findtext("{http://www.portalfiscal.inf.br/nfe}xProd", default="")
-                qCom = prod.findtext("{http://www.portalfiscal.inf.br/nfe}qCom", default="")
-                vProd = prod.findtext("{http://www.portalfiscal.inf.br/nfe}vProd", default="")
-                cfop_item = prod.findtext("{http://www.portalfiscal.inf.br/nfe}CFOP", default="")
-
-                itens.append({
-                    "nItem": nItem,
-                    "cProd": cProd,
-                    "xProd": xProd,
-                    "qCom": qCom,
-                    "vProd": vProd,
-                    "cfop": cfop_item
-                })
-
-            # Salva itens por chave
-            itens_por_chave[chave] = itens
-
-            registros.append({
-                "chave": chave,
-                "tipo": "NFe",
-                "fornecedor": fornecedor,
-                "cnpj_emissor": cnpj_emissor,
-                "valor_total": float(valor_total) if valor_total not in (None, "") else 0.0,
-                "cfop_atual": cfop_atual,
-                "credito_icms": float(credito_icms) if credito_icms not in (None, "") else 0.0,
-                "data_nota": data_emissao,
-                "complemento": complemento,
-                "nNF": numero_nota
-            })
-
-            # Atualiza progresso, se callback fornecido
-            if callable(progress_callback):
-                try:
-                    progress_callback(idx, total, getattr(file, 'name', None))
-                except Exception:
-                    pass
-
-        except Exception as e:
-            print(f"Erro ao processar {getattr(file, 'name', str(file))}: {e}")
-            if callable(progress_callback):
-                try:
-                    progress_callback(idx, total, getattr(file, 'name', None))
-                except Exception:
-                    pass
+        # Salvar conteúdo do arquivo (mantendo compatibilidade: nome -> bytes)
+        arquivos_dict[nome] = conteudo
+
+        if extraido is None:
             continue
+        registro, itens = extraido
+
+        # Salva itens por chave
+        itens_por_chave[registro["chave"]] = itens
+        registros.append(registro)
 
     df = pd.DataFrame(registros)
     return df, arquivos_dict, itens_por_chave
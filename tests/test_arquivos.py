@@ -0,0 +1,59 @@
+import io
+import tarfile
+import zipfile
+
+from src import arquivos
+from src.arquivos import ArquivoXML, expandir_arquivos
+
+
+def _zip(membros):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nome, dados in membros.items():
+            zf.writestr(nome, dados)
+    return buffer.getvalue()
+
+
+def _tar_gz(membros):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for nome, dados in membros.items():
+            info = tarfile.TarInfo(nome)
+            info.size = len(dados)
+            tf.addfile(info, io.BytesIO(dados))
+    return buffer.getvalue()
+
+
+def test_membros_com_mesmo_nome_base_nao_se_sobrescrevem():
+    lote = _zip({"a/nota.xml": b"<a/>", "b/nota.xml": b"<b/>"})
+    saida = expandir_arquivos([ArquivoXML("lote.zip", lote)])
+    assert [(a.nome, a.conteudo) for a in saida] == [("nota.xml", b"<a/>"), ("b/nota.xml", b"<b/>")]
+
+
+def test_xml_enviado_diretamente_mantem_o_nome():
+    lote = _tar_gz({"nota.xml": b"<tar/>"})
+    saida = expandir_arquivos([ArquivoXML("lote.tgz", lote), ArquivoXML("nota.xml", b"<direto/>")])
+    assert {a.nome: a.conteudo for a in saida} == {"nota.xml": b"<direto/>", "nota (2).xml": b"<tar/>"}
+
+
+def test_membro_acima_do_limite_e_ignorado(monkeypatch):
+    monkeypatch.setattr(arquivos, "TAMANHO_MAXIMO_MEMBRO", 1000)
+    lote = _zip({"grande.xml": b"<a>" + b" " * 5000 + b"</a>", "pequena.xml": b"<b/>"})
+    assert [a.nome for a in expandir_arquivos([ArquivoXML("lote.zip", lote)])] == ["pequena.xml"]
+
+
+def test_tamanho_declarado_falso_e_conferido_na_leitura(monkeypatch):
+    monkeypatch.setattr(arquivos, "TAMANHO_MAXIMO_MEMBRO", 1000)
+    lote = bytearray(_zip({"bomba.xml": b"<a>" + b" " * 5000 + b"</a>"}))
+    # Cabeçalhos (local e central) declarando 10 bytes descompactados
+    for assinatura, deslocamento in ((b"PK\x03\x04", 22), (b"PK\x01\x02", 24)):
+        i = lote.index(assinatura) + deslocamento
+        lote[i:i + 4] = (10).to_bytes(4, "little")
+    assert expandir_arquivos([ArquivoXML("lote.zip", bytes(lote))]) == []
+
+
+def test_limite_total_interrompe_a_extracao(monkeypatch):
+    monkeypatch.setattr(arquivos, "TAMANHO_MAXIMO_TOTAL", 2500)
+    membros = {f"n{i}.xml": b"<a>" + b" " * 993 + b"</a>" for i in range(5)}
+    saida = expandir_arquivos([ArquivoXML("lote.tar.gz", _tar_gz(membros))])
+    assert [a.nome for a in saida] == ["n0.xml", "n1.xml"]
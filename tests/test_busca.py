@@ -0,0 +1,49 @@
+import pandas as pd
+
+from src.busca import TODOS, IndiceBusca, normalizar, normalizar_texto
+
+
+def _notas():
+    return pd.DataFrame(
+        {
+            "fornecedor": ["ACME – Indústria Ltda", "São Paulo Serviços", "Straße GmbH"],
+            "nNF": ["101", "202", "303"],
+            "tipo": ["NFe", "NFSe", "NFe"],
+            "cfop_atual": ["5102", "", "6102"],
+            "historico": ["Temp. 20°C", None, ""],
+        }
+    )
+
+
+def test_consulta_e_indice_usam_a_mesma_normalizacao():
+    serie = pd.Series(["ACME – Ind", "São", "Straße", "20°C"])
+    assert list(normalizar(serie)) == [normalizar_texto(v) for v in serie]
+
+
+def test_caracteres_nao_ascii_casam():
+    indice = IndiceBusca(_notas(), ["fornecedor", "historico"])
+    assert list(indice.filtrar("ACME – Ind")) == [True, False, False]
+    assert list(indice.filtrar("straße")) == [False, False, True]
+    assert list(indice.filtrar("20°c", "historico")) == [True, False, False]
+
+
+def test_ignora_acentos_e_maiusculas():
+    indice = IndiceBusca(_notas(), ["fornecedor"])
+    assert list(indice.filtrar("SAO PAULO", "fornecedor")) == [False, True, False]
+    assert list(indice.filtrar("industria")) == [True, False, False]
+
+
+def test_todos_busca_em_todas_as_colunas_indexadas():
+    df = _notas()
+    indice = IndiceBusca(df, list(df.columns))
+    assert list(indice.filtrar("202", TODOS)) == [False, True, False]
+    assert list(indice.filtrar("nfse", TODOS)) == [False, True, False]
+    assert list(indice.filtrar("6102", TODOS)) == [False, False, True]
+
+
+def test_atualizar_reindexa_celulas_editadas():
+    df = _notas()
+    indice = IndiceBusca(df, ["fornecedor", "historico"])
+    df.loc[1, "historico"] = "Frete – Ágil"
+    indice.atualizar(df, [1], ["historico"])
+    assert list(indice.filtrar("frete – agil")) == [False, True, False]
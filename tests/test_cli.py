@@ -0,0 +1,17 @@
+from src.cli import _listar_entradas
+
+
+def test_arquivos_com_mesmo_nome_em_pastas_diferentes(tmp_path):
+    for pasta, conteudo in (("a", b"<a/>"), ("b", b"<b/>"), ("b/c", b"<c/>")):
+        (tmp_path / "lote" / pasta).mkdir(parents=True, exist_ok=True)
+        (tmp_path / "lote" / pasta / "nota.xml").write_bytes(conteudo)
+    (tmp_path / "lote" / "a" / "leia-me.txt").write_text("ignorado")
+    (tmp_path / "avulsa").mkdir()
+    (tmp_path / "avulsa" / "nota.xml").write_bytes(b"<d/>")
+
+    arquivos = _listar_entradas([str(tmp_path / "lote"), str(tmp_path / "avulsa" / "nota.xml")])
+
+    nomes = [a.nome for a in arquivos]
+    assert nomes[:3] == ["nota.xml", "b/c/nota.xml", "b/nota.xml"]
+    assert len(set(nomes)) == 4
+    assert [a.conteudo for a in arquivos] == [b"<a/>", b"<c/>", b"<b/>", b"<d/>"]
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from src.edicao import COLUNAS_EDITAVEIS, aplicar_edicoes
+
+
+def _df_geral(n=6):
+    return pd.DataFrame(
+        {
+            "chave": [f"K{i}" for i in range(n)],
+            "fornecedor": [f"Fornecedor {i}" for i in range(n)],
+            "valor_total": [float(i) for i in range(n)],
+            "tipo_operacao": "1102",
+            "data_nota": "2025-01-01",
+            "complemento": [f"C{i}" for i in range(n)],
+            "debito": "",
+            "credito": "",
+            "historico": [None] * n,
+        }
+    )
+
+
+def _editor(df_geral):
+    editado = df_geral.copy()
+    editado.insert(0, "Selecionar", False)
+    return editado
+
+
+def _legado(df_geral, edited_df):
+    # Caminho anterior (linha a linha), usado como referência
+    for _, row in edited_df.iterrows():
+        chave = row["chave"]
+        for col in COLUNAS_EDITAVEIS:
+            df_geral.loc[df_geral["chave"] == chave, col] = row.get(col, "")
+
+
+class _IndiceEspiao:
+    def __init__(self):
+        self.escritas = []
+
+    def atualizar(self, df, rotulos, colunas):
+        self.escritas.extend((df.loc[r, "chave"], c) for r in rotulos for c in colunas)
+
+
+def test_so_escreve_as_celulas_alteradas():
+    df_geral = _df_geral()
+    editado = _editor(df_geral)
+    editado.loc[1, "debito"] = "1111"
+    editado.loc[4, "tipo_operacao"] = "2102"
+    editado.loc[4, "historico"] = "HIST"
+    espiao = _IndiceEspiao()
+
+    assert aplicar_edicoes(df_geral, editado, indice_busca=espiao) == 3
+    assert sorted(espiao.escritas) == [("K1", "debito"), ("K4", "historico"), ("K4", "tipo_operacao")]
+    assert df_geral.loc[1, "debito"] == "1111"
+    assert df_geral.loc[4, ["tipo_operacao", "historico"]].tolist() == ["2102", "HIST"]
+    # None dos dois lados não conta como alteração
+    assert aplicar_edicoes(df_geral, _editor(df_geral)) == 0
+
+
+def test_editor_filtrado_nao_toca_as_demais_notas():
+    df_geral = _df_geral()
+    editado = _editor(df_geral).iloc[[2, 3]].copy()
+    editado["credito"] = "2222"
+    antes = df_geral.copy()
+
+    assert aplicar_edicoes(df_geral, editado) == 2
+    fora = ~df_geral["chave"].isin(["K2", "K3"])
+    pd.testing.assert_frame_equal(df_geral[fora], antes[fora])
+
+
+def test_igual_ao_caminho_linha_a_linha():
+    rng = np.random.default_rng(1)
+    base = _df_geral(40)
+    # Chave repetida em df_geral: as duas linhas recebem o valor
+    base.loc[39, "chave"] = "K0"
+    editado = _editor(base.drop(index=39)).sample(frac=0.6, random_state=3)
+    linhas = rng.choice(editado.index, 10, replace=False)
+    editado.loc[linhas, "tipo_operacao"] = "2102"
+    editado.loc[linhas[:5], "debito"] = "1" * 13
+    editado.loc[linhas[5:], "historico"] = "123"
+
+    esperado, atual = base.copy(), base.copy()
+    _legado(esperado, editado)
+    aplicar_edicoes(atual, editado)
+    pd.testing.assert_frame_equal(atual, esperado)
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from src import itens
+from src.itens import DiarioCfop, GradeItens, TabelaItens
+
+
+def _tabela():
+    return TabelaItens.de_itens_por_chave(
+        {
+            "A": [
+                {"nItem": "1", "cProd": "p1", "xProd": "Parafuso", "qCom": "2", "vProd": "10.00", "cfop": "5102"},
+                {"nItem": "2", "cProd": "p2", "xProd": "Porca", "qCom": "1", "vProd": "3.50", "cfop": ""},
+            ],
+            "B": [{"nItem": "1", "cProd": "p3", "xProd": "Arruela", "qCom": "5", "vProd": "1.25", "cfop": "6102"}],
+            "C": [
+                {"nItem": "1", "cProd": "p4", "xProd": "Broca", "qCom": "1", "vProd": "30.00", "cfop": ""},
+                {"nItem": "2", "cProd": "p5", "xProd": "Serra", "qCom": "1", "vProd": "45.00", "cfop": "5102"},
+            ],
+        }
+    )
+
+
+CFOP_NOTA = {"A": "1102", "B": "2102", "C": "1556"}
+FORNECEDOR = {"A": "Fornecedor A", "B": "Fornecedor B", "C": "Fornecedor C"}
+
+
+def test_posicoes_das_notas_seguem_a_ordem_das_chaves():
+    tabela = _tabela()
+    assert list(tabela.posicoes_das_notas(["C", "A"])) == [3, 4, 0, 1]
+    assert list(tabela.posicoes_das_notas(["B", "inexistente"])) == [2]
+    assert tabela.posicoes_das_notas([]).size == 0
+    assert "A" in tabela and "X" not in tabela
+
+
+def test_cfop_atual_editado_prevalece_sobre_xml_e_nota():
+    tabela = _tabela()
+    posicoes = np.arange(len(tabela))
+    # Sem edição: CFOP do XML; sem CFOP no XML: CFOP da nota
+    assert list(tabela.cfop_atual(posicoes, CFOP_NOTA)) == ["5102", "1102", "6102", "1556", "5102"]
+    tabela.atribuir_cfop([0, 1], "1403")
+    assert list(tabela.cfop_atual(posicoes, CFOP_NOTA)) == ["1403", "1403", "6102", "1556", "5102"]
+    # Limpar a edição volta ao XML/nota
+    tabela.atribuir_cfop([0], "")
+    assert list(tabela.cfop_atual([0, 1], CFOP_NOTA)) == ["5102", "1403"]
+
+
+def test_atribuir_cfop_sem_alteracao_nao_muda_a_versao():
+    tabela = _tabela()
+    antigos = tabela.atribuir_cfop([0, 1], "")
+    assert tabela.versao == 0 and pd.isna(antigos).all()
+    tabela.atribuir_cfop([0, 1], "1403")
+    assert tabela.versao == 1
+    tabela.atribuir_cfop([0, 1], "1403")
+    assert tabela.versao == 1
+    # Basta um item diferente para contar como alteração
+    tabela.atribuir_cfop([0, 1, 2], "1403")
+    assert tabela.versao == 2
+    assert tabela.cfops_editados() == {"A": {"1": "1403", "2": "1403"}, "B": {"1": "1403"}}
+
+
+def _grade_completa(tabela, chaves):
+    return GradeItens(tabela).obter(chaves, CFOP_NOTA, FORNECEDOR)
+
+
+def test_grade_incremental_igual_a_reconstrucao():
+    tabela = _tabela()
+    grade = GradeItens(tabela)
+    sequencia = [
+        (["A"], None),
+        (["A", "C"], ([3], "1403")),
+        (["C"], ([0, 4], "2102")),
+        (["A", "B", "C"], None),
+        (["B", "C"], ([2, 3], "")),
+    ]
+    for chaves, edicao in sequencia:
+        if edicao is not None:
+            tabela.atribuir_cfop(*edicao)
+        pd.testing.assert_frame_equal(
+            grade.obter(chaves, CFOP_NOTA, FORNECEDOR), _grade_completa(tabela, chaves), check_dtype=False
+        )
+
+
+def test_grade_reutiliza_o_frame_sem_mudancas():
+    tabela = _tabela()
+    grade = GradeItens(tabela)
+    primeiro = grade.obter(["A", "B"], CFOP_NOTA, FORNECEDOR)
+    assert grade.obter(["A", "B"], dict(CFOP_NOTA), FORNECEDOR) is primeiro
+    # Reatribuir o mesmo CFOP não altera a versão e mantém o frame
+    tabela.atribuir_cfop([0], "")
+    assert grade.obter(["A", "B"], CFOP_NOTA, FORNECEDOR) is primeiro
+    # Mudança no CFOP da nota recalcula cfop_atual
+    atualizado = grade.obter(["A", "B"], {**CFOP_NOTA, "A": "1949"}, FORNECEDOR)
+    assert list(atualizado["cfop_atual"]) == ["5102", "1949", "6102"]
+
+
+def _editados(tabela):
+    return tabela.df["cfop_editado"].astype(object).where(tabela.df["cfop_editado"].notna(), None).tolist()
+
+
+def test_desfazer_edicao_unica_e_em_lote():
+    tabela = _tabela()
+    diario = DiarioCfop(tabela, limite=5)
+    inicial = _editados(tabela)
+
+    assert diario.aplicar([1], "1403") == 1
+    apos_unica = _editados(tabela)
+    assert diario.aplicar(tabela.posicoes_das_notas(["A", "B", "C"]), "2102") == 5
+    assert diario.aplicar([0, 2, 4], "") == 3  # posições não contíguas, limpando edições
+
+    assert diario.desfazer() == 3
+    assert _editados(tabela) == ["2102"] * 5
+    assert diario.desfazer() == 5
+    assert _editados(tabela) == apos_unica
+    assert diario.desfazer() == 1
+    assert _editados(tabela) == inicial
+    assert diario.desfazer() == 0 and len(diario) == 0
+
+
+def test_desfazer_em_muitas_faixas_e_valores():
+    itens = {f"N{i}": [{"nItem": str(j), "cfop": "5102"} for j in range(1, 4)] for i in range(200)}
+    tabela = TabelaItens.de_itens_por_chave(itens)
+    rng = np.random.default_rng(0)
+    diario = DiarioCfop(tabela, limite=50)
+    estados = []
+    for cfop in ["1102", "2102", "", "1403", "1556"]:
+        estados.append(_editados(tabela))
+        diario.aplicar(np.sort(rng.choice(len(tabela), 250, replace=False)), cfop)
+    for esperado in reversed(estados):
+        diario.desfazer()
+        assert _editados(tabela) == esperado
+
+
+def test_profundidade_limitada(monkeypatch):
+    monkeypatch.setattr(itens, "ITENS_UNDO_MAX", 2)
+    tabela = _tabela()
+    diario = DiarioCfop(tabela)
+    for cfop in ["1102", "2102", "1403"]:
+        diario.aplicar([0], cfop)
+    assert len(diario) == 2
+    assert diario.desfazer() == 1 and diario.desfazer() == 1
+    # A primeira aplicação foi descartada: o item fica com o CFOP dela
+    assert diario.desfazer() == 0
+    assert _editados(tabela)[0] == "1102"
+
+
+def test_desfazer_apos_nova_categoria():
+    tabela = _tabela()
+    diario = DiarioCfop(tabela)
+    diario.aplicar([0, 1], "1403")
+    diario.aplicar([1, 2], "1556")
+    # Categorias criadas depois dos instantâneos (inclusive fora do diário)
+    tabela.atribuir_cfop([3], "9999")
+    diario.aplicar([0, 4], "7777")
+    categorias_antes = list(tabela.df["cfop_editado"].cat.categories)
+    assert {"1403", "1556", "9999", "7777"} <= set(categorias_antes)
+
+    diario.desfazer()
+    assert _editados(tabela) == ["1403", "1556", "1556", "9999", None]
+    diario.desfazer()
+    assert _editados(tabela) == ["1403", "1403", None, "9999", None]
+    diario.desfazer()
+    assert _editados(tabela) == [None, None, None, "9999", None]
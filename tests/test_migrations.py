@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import create_engine, inspect, insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+from src import db
+from src.migrations import MIGRACOES, executar_migracoes, migracoes_aplicadas
+
+
+@pytest.fixture
+def eng(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'banco.sqlite3'}")
+
+
+def _banco_legado(eng):
+    # Tabela criada antes do índice único, com fornecedores duplicados
+    with eng.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE preferencias_fornecedor_empresa (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "empresa_id INTEGER NOT NULL, cnpj_fornecedor VARCHAR(14) NOT NULL, tipo_operacao VARCHAR(255), "
+            "cfop VARCHAR(10), debito VARCHAR(13), credito VARCHAR(13), historico VARCHAR(9), "
+            "data_nota VARCHAR, complemento VARCHAR(255))"
+        ))
+        conn.execute(
+            text("INSERT INTO preferencias_fornecedor_empresa (empresa_id, cnpj_fornecedor, debito) VALUES (:e, :c, :d)"),
+            [
+                {"e": 1, "c": "11", "d": "antigo"},
+                {"e": 1, "c": "22", "d": "unico"},
+                {"e": 1, "c": "11", "d": "recente"},
+                {"e": 2, "c": "11", "d": "outra empresa"},
+            ],
+        )
+
+
+def _preferencias(eng):
+    with eng.connect() as conn:
+        rows = conn.execute(select(db.preferencias_fornecedor_empresa).order_by("empresa_id", "cnpj_fornecedor"))
+        return [(r.empresa_id, r.cnpj_fornecedor, r.debito) for r in rows]
+
+
+def test_migracoes_sao_idempotentes(eng):
+    assert executar_migracoes(eng) == [v for v, _, _ in MIGRACOES]
+    assert executar_migracoes(eng) == []
+    assert migracoes_aplicadas(eng) == {v for v, _, _ in MIGRACOES}
+    # Mesmo repetidas sem o registro em schema_migrations, nenhuma falha
+    with eng.begin() as conn:
+        for _, _, migrar in MIGRACOES:
+            migrar(conn)
+
+
+def test_remove_duplicatas_mantendo_a_mais_recente(eng):
+    _banco_legado(eng)
+    executar_migracoes(eng)
+    assert _preferencias(eng) == [(1, "11", "recente"), (1, "22", "unico"), (2, "11", "outra empresa")]
+    indices = {i["name"]: i for i in inspect(eng).get_indexes("preferencias_fornecedor_empresa")}
+    assert indices["ux_preferencias_empresa_fornecedor"]["unique"]
+    with pytest.raises(IntegrityError), eng.begin() as conn:
+        conn.execute(insert(db.preferencias_fornecedor_empresa).values(empresa_id=1, cnpj_fornecedor="22"))
+
+
+def test_lote_com_fornecedor_repetido_vale_o_ultimo(eng):
+    executar_migracoes(eng)
+    with eng.begin() as conn:
+        gravadas = db.salvar_preferencias_em_lote(
+            1,
+            [
+                {"cnpj_fornecedor": "11", "debito": "primeiro"},
+                {"cnpj_fornecedor": "22", "debito": "b"},
+                {"cnpj_fornecedor": "11", "debito": "ultimo"},
+                {"cnpj_fornecedor": "", "debito": "sem cnpj"},
+            ],
+            conn=conn,
+        )
+    assert gravadas == 2
+    assert _preferencias(eng) == [(1, "11", "ultimo"), (1, "22", "b")]
+
+    # Novo lote atualiza pelo ON CONFLICT, sem duplicar
+    with eng.begin() as conn:
+        db.salvar_preferencias_em_lote(1, [{"cnpj_fornecedor": "22", "debito": "novo"}], conn=conn)
+    assert _preferencias(eng) == [(1, "11", "ultimo"), (1, "22", "novo")]
+
+
+def test_upsert_em_varios_lotes(eng):
+    executar_migracoes(eng)
+    linhas = [{"codigo": f"{i:04d}", "categoria": "C", "nome": f"n{i}", "descricao": None} for i in range(3000)]
+    with eng.begin() as conn:
+        db.upsert(conn, db.cfop_catalog, linhas, ["codigo"], ["categoria", "nome", "descricao"])
+        db.upsert(conn, db.cfop_catalog, [{**linhas[0], "nome": "alterado"}], ["codigo"], ["nome"])
+    with eng.connect() as conn:
+        nomes = dict(conn.execute(select(db.cfop_catalog.c.codigo, db.cfop_catalog.c.nome)).all())
+    assert nomes["0000"] == "alterado" and nomes["2999"] == "n2999"
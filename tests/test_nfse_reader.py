@@ -0,0 +1,48 @@
+import io
+
+from src.nfse_reader import iterar_nfses
+
+_COMP_NFSE = (
+    "<CompNfse><Nfse><InfNfse>"
+    "<Numero>123</Numero><DataEmissao>2025-01-02</DataEmissao>"
+    "<Servico><Valores><ValorServicos>10.50</ValorServicos></Valores></Servico>"
+    "<PrestadorServico><IdentificacaoPrestador><Cnpj>11222333000181</Cnpj></IdentificacaoPrestador>"
+    "<RazaoSocial>ACME Serviços</RazaoSocial></PrestadorServico>"
+    "</InfNfse></Nfse></CompNfse>"
+)
+
+
+def _ler(xml):
+    return list(iterar_nfses(io.BytesIO(xml.encode("utf-8"))))
+
+
+def test_nfse_simples():
+    (registro,) = _ler('<?xml version="1.0" encoding="UTF-8"?>' + _COMP_NFSE)
+    assert registro["chave"] == "123"
+    assert registro["cnpj_emissor"] == "11222333000181"
+    assert registro["valor_total"] == 10.5
+
+
+def test_comentario_e_instrucao_antes_da_raiz():
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<?xml-stylesheet type="text/xsl" href="nfse.xsl"?>'
+        "<!-- exportado pela prefeitura -->" + _COMP_NFSE
+    )
+    (registro,) = _ler(xml)
+    assert registro["chave"] == "123"
+    assert registro["fornecedor"] == "ACME Serviços"
+
+
+def test_lote_com_comentario_antes_da_raiz():
+    notas = "".join(_COMP_NFSE.replace("<Numero>123<", f"<Numero>{n}<") for n in (1, 2, 3))
+    xml = f"<!-- lote --><ConsultarNfseResponse><ListaNfse>{notas}</ListaNfse></ConsultarNfseResponse>"
+    assert [r["chave"] for r in _ler(xml)] == ["1", "2", "3"]
+
+
+def test_nota_malformada_no_meio_do_lote_nao_derruba_as_demais(capsys):
+    notas = [_COMP_NFSE.replace("<Numero>123<", f"<Numero>{n}<") for n in (1, 2, 3)]
+    notas[1] = notas[1].replace("<ValorServicos>10.50<", "<ValorServicos>10,50<")
+    xml = f"<ConsultarNfseResponse><ListaNfse>{''.join(notas)}</ListaNfse></ConsultarNfseResponse>"
+    assert [r["chave"] for r in _ler(xml)] == ["1", "3"]
+    assert "NFS-e 2" in capsys.readouterr().out
@@ -0,0 +1,81 @@
+from src import nfse_reader, xml_reader
+from src.parse_cache import ParseCache, hash_conteudo
+
+
+def _cache(tmp_path, max_bytes=1024 * 1024):
+    return ParseCache(str(tmp_path / "cache" / "parse_cache.sqlite3"), max_bytes=max_bytes)
+
+
+def test_acerto_e_falha(tmp_path):
+    cache = _cache(tmp_path)
+    h1, h2 = hash_conteudo(b"<a/>"), hash_conteudo(b"<b/>")
+    assert cache.obter_varios("v1", [h1, h2]) == {}
+    cache.gravar_varios("v1", [(h1, {"chave": "1", "itens": [1, 2]})])
+    assert cache.obter_varios("v1", [h1, h2, h1]) == {h1: {"chave": "1", "itens": [1, 2]}}
+    # Mesmo arquivo, sob outro nome: a chave é o conteúdo
+    assert hash_conteudo(b"<a/>") == h1
+
+
+def test_muitos_hashes_em_lotes(tmp_path):
+    cache = _cache(tmp_path)
+    itens = [(hash_conteudo(str(i).encode()), i) for i in range(1200)]
+    cache.gravar_varios("v1", itens)
+    assert cache.obter_varios("v1", [h for h, _ in itens]) == dict(itens)
+
+
+def test_evicao_remove_os_menos_usados(tmp_path, monkeypatch):
+    relogio = iter(range(1000))
+    monkeypatch.setattr("src.parse_cache.time.time", lambda: next(relogio))
+    # Cada valor ("x" * 100 em JSON) ocupa 102 bytes: cabem três
+    cache = _cache(tmp_path, max_bytes=350)
+    cache.gravar_varios("v1", [("a", "x" * 100)])
+    cache.gravar_varios("v1", [("b", "x" * 100)])
+    cache.gravar_varios("v1", [("c", "x" * 100)])
+    cache.obter_varios("v1", ["a"])  # "a" passa a ser o mais recente
+    cache.gravar_varios("v1", [("d", "x" * 100)])
+    assert set(cache.obter_varios("v1", ["a", "b", "c", "d"])) == {"a", "c", "d"}
+    cache.gravar_varios("v1", [("e", "x" * 100), ("f", "x" * 100)])
+    assert set(cache.obter_varios("v1", ["a", "b", "c", "d", "e", "f"])) == {"d", "e", "f"}
+
+
+def test_versao_diferente_nao_encontra_entradas_antigas(tmp_path):
+    cache = _cache(tmp_path)
+    h = hash_conteudo(b"<a/>")
+    cache.gravar_varios("nfe-1", [(h, "antigo")])
+    assert cache.obter_varios("nfe-2", [h]) == {}
+    assert cache.obter_varios("nfe-1", [h]) == {h: "antigo"}
+
+
+_NFSE = (
+    b"<CompNfse><Nfse><InfNfse><Numero>7</Numero>"
+    b"<Servico><Valores><ValorServicos>1.00</ValorServicos></Valores></Servico>"
+    b"</InfNfse></Nfse></CompNfse>"
+)
+
+
+def test_mudar_versao_do_extrator_invalida_o_cache(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    chamadas = []
+    original = nfse_reader._processar_nfse
+
+    def contar(conteudo):
+        chamadas.append(conteudo)
+        return original(conteudo)
+
+    monkeypatch.setattr(nfse_reader, "_processar_nfse", contar)
+    arquivos = [("nota.xml", _NFSE)]
+    df, _ = nfse_reader.extrair_dados_nfses_xmls(arquivos, cache=cache)
+    assert list(df["chave"]) == ["7"] and len(chamadas) == 1
+    # Gravado sob a versão atual do extrator; segunda leitura vem do cache
+    assert cache.obter_varios(nfse_reader.VERSAO_EXTRATOR, [hash_conteudo(_NFSE)])
+    nfse_reader.extrair_dados_nfses_xmls(arquivos, cache=cache)
+    assert len(chamadas) == 1
+
+    monkeypatch.setattr(nfse_reader, "VERSAO_EXTRATOR", nfse_reader.VERSAO_EXTRATOR + "-nova")
+    df, _ = nfse_reader.extrair_dados_nfses_xmls(arquivos, cache=cache)
+    assert list(df["chave"]) == ["7"] and len(chamadas) == 2
+
+
+def test_versoes_dos_extratores_sao_distintas():
+    # NF-e e NFS-e compartilham o arquivo de cache: as chaves não podem colidir
+    assert xml_reader.VERSAO_EXTRATOR != nfse_reader.VERSAO_EXTRATOR
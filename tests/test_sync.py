@@ -0,0 +1,85 @@
+from sqlalchemy import insert, select, update
+
+from src import db
+from src.sync import sincronizar
+
+
+def _engines(tmp_path):
+    local = db.criar_engine_sqlite(str(tmp_path / "local.sqlite3"))
+    remoto = db.criar_engine_sqlite(str(tmp_path / "central.sqlite3"))
+    db.inicializar_schema(remoto)
+    return local, remoto
+
+
+def _catalogo(eng):
+    with eng.connect() as conn:
+        return {r.codigo: r.nome for r in conn.execute(select(db.cfop_catalog))}
+
+
+def _preferencias(eng):
+    with eng.connect() as conn:
+        rows = conn.execute(
+            select(db.empresas.c.cnpj, db.preferencias_fornecedor_empresa.c.cnpj_fornecedor,
+                   db.preferencias_fornecedor_empresa.c.debito)
+            .join(db.empresas, db.empresas.c.id == db.preferencias_fornecedor_empresa.c.empresa_id)
+        )
+        return {(r.cnpj, r.cnpj_fornecedor): r.debito for r in rows}
+
+
+def test_primeira_sincronizacao_nao_sobrescreve_o_central(tmp_path):
+    local, remoto = _engines(tmp_path)
+    with remoto.begin() as conn:
+        conn.execute(update(db.cfop_catalog).where(db.cfop_catalog.c.codigo == "1102").values(nome="Editado no central"))
+    # Filial nova que já usou o app: catálogo padrão semeado no local
+    db.inicializar_schema(local)
+
+    resultado = sincronizar(local, remoto)
+
+    assert resultado["enviadas"]["cfop_catalog"] == 0
+    assert _catalogo(remoto)["1102"] == "Editado no central"
+    assert _catalogo(local)["1102"] == "Editado no central"
+
+
+def test_traz_empresas_e_preferencias_remapeando_ids(tmp_path):
+    local, remoto = _engines(tmp_path)
+    with remoto.begin() as conn:
+        # Ids do central diferentes dos que o local vai gerar
+        conn.execute(insert(db.empresas).values(id=40, cnpj="11111111000111", nome="A", razao_social="A SA"))
+        conn.execute(insert(db.empresas).values(id=41, cnpj="22222222000122", nome="B", razao_social="B SA"))
+    with remoto.begin() as conn:
+        db.salvar_preferencias_em_lote(41, [{"cnpj_fornecedor": "99", "debito": "100"}], conn=conn)
+
+    sincronizar(local, remoto)
+
+    with local.connect() as conn:
+        assert {r.cnpj for r in conn.execute(select(db.empresas))} == {"11111111000111", "22222222000122"}
+    assert _preferencias(local) == {("22222222000122", "99"): "100"}
+
+
+def test_envia_so_o_que_mudou_desde_a_ultima_sincronizacao(tmp_path):
+    local, remoto = _engines(tmp_path)
+    with remoto.begin() as conn:
+        conn.execute(insert(db.empresas).values(cnpj="11111111000111", nome="A", razao_social="A SA"))
+    sincronizar(local, remoto)
+
+    # Alteração local no 1102 e, no central, no 2102
+    with local.begin() as conn:
+        conn.execute(update(db.cfop_catalog).where(db.cfop_catalog.c.codigo == "1102").values(nome="Filial"))
+        empresa_id = conn.execute(select(db.empresas.c.id)).scalar()
+        db.salvar_preferencias_em_lote(empresa_id, [{"cnpj_fornecedor": "99", "debito": "7"}], conn=conn)
+    with remoto.begin() as conn:
+        conn.execute(update(db.cfop_catalog).where(db.cfop_catalog.c.codigo == "2102").values(nome="Central"))
+
+    resultado = sincronizar(local, remoto)
+
+    assert resultado["enviadas"]["cfop_catalog"] == 1
+    assert resultado["enviadas"]["preferencias_fornecedor_empresa"] == 1
+    for eng in (local, remoto):
+        catalogo = _catalogo(eng)
+        assert (catalogo["1102"], catalogo["2102"]) == ("Filial", "Central")
+    assert _preferencias(remoto) == {("11111111000111", "99"): "7"}
+
+    # Sem alterações: nada é enviado nem regravado
+    resultado = sincronizar(local, remoto)
+    assert sum(resultado["enviadas"].values()) == 0
+    assert resultado["recebidas"]["cfop_catalog"] == 0